@@ -237,6 +237,39 @@ const collections = [
             { key: 'logged_at', type: 'datetime', required: true }
         ]
     },
+    // 📈 Metric Rollups - Hourly/daily aggregates kept by impact-monitor (server-only)
+    {
+        name: 'Metric_Rollups', id: 'Metric_Rollups', permissions: [], attributes: [
+            { key: 'source', type: 'string', size: 64, required: true },         // ESG_Metrics, Communications
+            { key: 'metric_type', type: 'string', size: 64, required: true },
+            { key: 'granularity', type: 'string', size: 16, required: true },    // hour | day | period | watermark | claim
+            { key: 'bucket', type: 'string', size: 32, required: false },        // 2025-01-31T09 | 2025-01-31 | 2025-01
+            { key: 'count', type: 'integer', required: false },
+            { key: 'sum', type: 'float', required: false },
+            { key: 'last_value', type: 'float', required: false },
+            { key: 'through', type: 'string', size: 128, required: false },     // watermark: $createdAt|$id; rollups: run start id>last row id
+            { key: 'updated_at', type: 'datetime', required: false }
+        ], indexes: [
+            { key: 'rollup_bucket_idx', type: 'key', attributes: ['source', 'granularity', 'bucket'] },
+            { key: 'rollup_metric_idx', type: 'key', attributes: ['source', 'granularity', 'metric_type', 'bucket'] }
+        ]
+    },
+    // 💾 Engine Cache - Persistent response cache tier for multi-llm-engine (server-only)
+    {
+        name: 'Engine_Cache', id: 'Engine_Cache', permissions: [], attributes: [
+            { key: 'cache_key', type: 'string', size: 64, required: true },      // sha256 of engine/task/prompt
+            { key: 'engine', type: 'string', size: 32, required: true },
+            { key: 'model', type: 'string', size: 64, required: true },
+            { key: 'task_type', type: 'string', size: 64, required: true },
+            { key: 'response_text', type: 'string', size: 50000, required: true },
+            { key: 'tokens', type: 'integer', required: false },
+            { key: 'expires_at', type: 'datetime', required: true },
+            { key: 'created_at', type: 'datetime', required: true }
+        ], indexes: [
+            { key: 'cache_key_unique', type: 'unique', attributes: ['cache_key'] },
+            { key: 'expires_at_idx', type: 'key', attributes: ['expires_at'] }
+        ]
+    },
     // 🛒 Skills Marketplace - Public skill catalog
     {
         name: 'Skills', id: 'Skills', attributes: [
@@ -311,7 +344,7 @@ async function setup() {
     // 2. Create Collections & Attributes
     for (const col of collections) {
         try {
-            await databases.createCollection(DATABASE_ID, col.id, col.name, [Permission.read(Role.any())]);
+            await databases.createCollection(DATABASE_ID, col.id, col.name, col.permissions ?? [Permission.read(Role.any())]);
             console.log(`✅ Collection ${col.name} Created`);
         } catch (e) {
             if (e.code === 409) console.log(`ℹ️ Collection ${col.name} Exists`);
@@ -336,6 +369,19 @@ async function setup() {
     console.log("⏳ Indexing (3s)...");
     await new Promise(r => setTimeout(r, 3000));
 
+    // Indexes need their attributes to be available, hence after the wait
+    for (const col of collections) {
+        for (const index of col.indexes || []) {
+            try {
+                await databases.createIndex(DATABASE_ID, col.id, index.key, index.type, index.attributes,
+                    index.attributes.map(() => 'ASC'));
+                console.log(`✅ Index ${col.name}.${index.key} Created`);
+            } catch (e) {
+                if (e.code !== 409) console.error(`❌ Index ${col.name}.${index.key} Failed:`, e.message);
+            }
+        }
+    }
+
     // 3. Seed Data (Documents)
     try {
         const svc = await databases.listDocuments(DATABASE_ID, 'Services');
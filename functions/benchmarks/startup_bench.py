@@ -0,0 +1,146 @@
+"""
+Cold- and warm-invocation overhead for every Python function.
+
+Each trial starts a fresh interpreter (a cold instance), imports the
+function's main.py, runs one invocation (cold) and then several more in
+the same process (warm). Appwrite and the LLM providers are served by the
+multi-llm-engine provider stub, so this runs offline.
+
+Usage:
+    python functions/benchmarks/startup_bench.py [--trials 5] [--warm 20] [--only impact-monitor]
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FUNCTIONS_DIR = os.path.dirname(HERE)
+STUB_DIR = os.path.join(FUNCTIONS_DIR, 'multi-llm-engine', 'benchmarks')
+
+# One representative request per function
+INVOCATIONS = {
+    'multi-llm-engine': {'method': 'POST', 'body': {'task_type': 'code', 'prompt': 'startup bench', 'cache': False}},
+    'impact-monitor': {'method': 'POST', 'body': {'action': 'metrics'}},
+    'whatsapp-bridge': {'method': 'POST', 'body': {'from': '+254700000000', 'body': 'status please'}},
+    'whatsapp-bridge:verify': {'method': 'GET', 'body': {},
+                               'query': {'hub.mode': 'subscribe', 'hub.verify_token': '', 'hub.challenge': '1'}},
+    'crewai-recon:no-url': {'method': 'POST', 'body': {}},
+}
+
+
+class BenchRequest:
+    def __init__(self, spec: dict):
+        self.method = spec['method']
+        self.body = json.dumps(spec['body'])
+        self.query = spec.get('query', {})
+        self.headers = {'content-type': 'application/json'}
+
+
+class BenchResponse:
+    def json(self, data, status: int = 200, headers: dict = None):
+        return {'status': status, 'body': data}
+
+    def text(self, body, status: int = 200, headers: dict = None):
+        return {'status': status, 'body': body}
+
+    def send(self, body, status: int = 200, headers: dict = None):
+        return {'status': status, 'body': body}
+
+
+class BenchContext:
+    def __init__(self, spec: dict):
+        self.req = BenchRequest(spec)
+        self.res = BenchResponse()
+
+    def log(self, message):
+        pass
+
+    def error(self, message):
+        pass
+
+
+def run_child(name: str, warm: int):
+    """Measure one cold instance; prints a JSON line for the parent."""
+    function = name.split(':')[0]
+    spec = INVOCATIONS[name]
+
+    start = time.perf_counter()
+    module_spec = importlib.util.spec_from_file_location('function_main', os.path.join(FUNCTIONS_DIR, function, 'main.py'))
+    module = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(module)
+    import_ms = (time.perf_counter() - start) * 1000
+
+    if function == 'multi-llm-engine':
+        sys.path.insert(0, STUB_DIR)
+        from load_bench import PROVIDER_PATHS
+        base_url = os.environ['APPWRITE_ENDPOINT'][:-len('/v1')]
+        # main.py put its directory on sys.path; ENGINES lives in its settings module
+        for engine in importlib.import_module('settings').ENGINES.values():
+            engine['url'] = base_url + PROVIDER_PATHS[engine['type']].format(model=engine['model'])
+
+    timings, statuses = [], []
+    for _ in range(warm + 1):
+        t0 = time.perf_counter()
+        response = module.main(BenchContext(spec))
+        timings.append((time.perf_counter() - t0) * 1000)
+        statuses.append(response['status'])
+    if hasattr(module, 'usage_logger'):
+        module.usage_logger.close()
+
+    print(json.dumps({
+        'import_ms': import_ms,
+        'first_ms': timings[0],
+        'warm_ms': statistics.median(timings[1:]) if warm else 0.0,
+        'status': statuses[0],
+        'modules': len(sys.modules),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trials', type=int, default=5, help='fresh interpreters per function')
+    parser.add_argument('--warm', type=int, default=20, help='warm invocations per trial')
+    parser.add_argument('--only', action='append', help='limit to these invocation names')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args.child, args.warm)
+
+    sys.path.insert(0, STUB_DIR)
+    import stub_server
+    server = stub_server.start(stub_server.StubConfig(latency='fixed:0'))
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    env = dict(os.environ, APPWRITE_ENDPOINT=f"{base_url}/v1", APPWRITE_PROJECT_ID='bench',
+               APPWRITE_API_KEY='bench', OPENROUTER_API_KEY='stub', ANTHROPIC_API_KEY='stub',
+               OPENAI_API_KEY='stub', XAI_API_KEY='stub', GOOGLE_API_KEY='stub')
+
+    print(f"{'invocation':<26}{'import':>10}{'cold call':>12}{'warm call':>12}{'cold total':>12}{'modules':>9}  status")
+    for name in args.only or INVOCATIONS:
+        trials = []
+        for _ in range(args.trials):
+            proc = subprocess.run([sys.executable, __file__, '--child', name, '--warm', str(args.warm)],
+                                  env=env, capture_output=True, text=True)
+            if proc.returncode != 0:
+                error = (proc.stderr.strip().splitlines() or ['failed'])[-1]
+                print(f"{name:<26}  error: {error}")
+                break
+            trials.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        if not trials:
+            continue
+        median = lambda key: statistics.median(t[key] for t in trials)
+        print(f"{name:<26}{median('import_ms'):>8.1f}ms{median('first_ms'):>10.1f}ms"
+              f"{median('warm_ms'):>10.1f}ms{median('import_ms') + median('first_ms'):>10.1f}ms"
+              f"{int(median('modules')):>9}  {trials[0]['status']}")
+
+    server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,18 @@
-from crewai import Agent, Task, Crew
 import os
+import json
 
 def main(context):
     try:
-        url = context.req.body.get('url')
+        body = context.req.body
+        data = json.loads(body) if isinstance(body, str) and body else (body or {})
+        url = data.get('url')
+        if not url:
+            return context.res.json({"error": "Missing url"}, 400)
+
+        # crewai pulls in langchain and friends (seconds of import time), so
+        # only load it once there is real work to do
+        from crewai import Agent, Task, Crew
+
         researcher = Agent(role='Tech Scout', goal='Analyze stack', backstory='CTO')
         task = Task(description=f'Analyze {url}', agent=researcher)
         crew = Crew(agents=[researcher], tasks=[task])
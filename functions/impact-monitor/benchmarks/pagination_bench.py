@@ -0,0 +1,174 @@
+"""
+Pagination benchmark: one-shot list_documents vs cursor-paged streaming.
+
+Runs against an in-process Appwrite stub holding a synthetic ESG_Metrics
+collection (1M rows by default). Rows are generated on demand from their
+index, so the stub itself uses no memory, and every page goes through a
+JSON encode/decode as it would over HTTP. Query.select therefore shrinks
+what gets "transferred".
+
+  single     - one list_documents with the default limit (the old code:
+               silently truncated)
+  load_all   - every page collected into a list, then aggregated
+  stream     - iter_pages() into GroupedTotals at several page sizes,
+               with and without Query.select
+
+Peak memory is traced with tracemalloc, which also slows every mode down
+by a similar factor.
+
+Usage:
+    python benchmarks/pagination_bench.py [--docs 1000000] [--page-sizes 100,1000,5000]
+        [--rtt-ms 0] [--skip-load-all] [--json]
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FUNCTION_DIR = os.path.dirname(HERE)
+
+METRIC_TYPES = ('hours_saved', 'token_cost', 'carbon_offset', 'content_pieces')
+DEFAULT_LIMIT = 25
+
+
+def load_function():
+    spec = importlib.util.spec_from_file_location('impact_monitor', os.path.join(FUNCTION_DIR, 'main.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class SyntheticDatabases:
+    """
+    list_documents over `size` synthetic rows with ids in index order.
+    Understands the queries iter_pages() sends: limit, cursorAfter, select.
+    """
+
+    def __init__(self, size: int, rtt_ms: float = 0.0):
+        self.size = size
+        self.rtt_s = rtt_ms / 1000
+        self.requests = 0
+        self.bytes = 0
+
+    @staticmethod
+    def row(i: int) -> dict:
+        return {
+            '$id': f"{i:09d}",
+            '$createdAt': f"2025-01-{1 + i % 28:02d}T{i % 24:02d}:00:00.000+00:00",
+            'metric_type': METRIC_TYPES[i % len(METRIC_TYPES)],
+            'value': (i % 97) / 10,
+            'unit': 'hours',
+            'context': f"synthetic row {i} " + 'x' * 180,
+            'period': '2025-01',
+            'logged_at': f"2025-01-{1 + i % 28:02d}T{i % 24:02d}:00:00.000+00:00",
+        }
+
+    def list_documents(self, database_id: str, collection_id: str, queries: list = None) -> dict:
+        limit, start, fields = DEFAULT_LIMIT, 0, None
+        for raw in queries or []:
+            query = json.loads(raw)
+            values = query.get('values') or []
+            argument = values[0] if values else query.get('attribute')
+            if query['method'] == 'limit':
+                limit = argument
+            elif query['method'] in ('cursorAfter', 'cursor_after'):
+                start = int(argument) + 1
+            elif query['method'] == 'select':
+                fields = values or query.get('attribute')
+
+        rows = [self.row(i) for i in range(start, min(start + limit, self.size))]
+        if fields:
+            rows = [{k: row[k] for k in fields if k in row} for row in rows]
+        payload = json.dumps({'total': self.size, 'documents': rows})
+        self.requests += 1
+        self.bytes += len(payload)
+        if self.rtt_s:
+            time.sleep(self.rtt_s)
+        return json.loads(payload)
+
+
+def measure(name: str, databases: SyntheticDatabases, run) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows, groups = run()
+    wall_s = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'mode': name,
+        'rows': rows,
+        'groups': groups,
+        'requests': databases.requests,
+        'mb_transferred': round(databases.bytes / 1e6, 1),
+        'peak_mb': round(peak / 1e6, 2),
+        'wall_s': round(wall_s, 2),
+        'rows_per_s': round(rows / wall_s) if wall_s else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=1_000_000, help='synthetic rows in the collection')
+    parser.add_argument('--page-sizes', default='100,1000,5000', help='comma-separated page sizes to stream with')
+    parser.add_argument('--rtt-ms', type=float, default=0.0, help='simulated round trip per request')
+    parser.add_argument('--skip-load-all', action='store_true', help='skip the collect-then-aggregate run')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    impact = load_function()
+    totals_fields = ['metric_type', 'value']
+    report = []
+
+    def stub():
+        return SyntheticDatabases(args.docs, args.rtt_ms)
+
+    databases = stub()
+
+    def single():
+        totals = impact.GroupedTotals('metric_type', value='value')
+        docs = databases.list_documents(impact.DATABASE_ID, 'ESG_Metrics', [])['documents']
+        return len(docs), len(totals.consume(docs))
+    report.append(measure('single', databases, single))
+
+    if not args.skip_load_all:
+        databases = stub()
+
+        def load_all():
+            docs = []
+            for page in impact.iter_pages(databases, 'ESG_Metrics', select=totals_fields, page_size=1000):
+                docs.extend(page)
+            totals = impact.GroupedTotals('metric_type', value='value')
+            return len(docs), len(totals.consume(docs))
+        report.append(measure('load_all/1000', databases, load_all))
+
+    variants = [(int(size), True) for size in args.page_sizes.split(',')] + [(1000, False)]
+    for page_size, use_select in variants:
+        databases = stub()
+
+        def stream():
+            totals = impact.GroupedTotals('metric_type', value='value')
+            rows = 0
+            for page in impact.iter_pages(databases, 'ESG_Metrics', select=totals_fields if use_select else None,
+                                          page_size=page_size):
+                for doc in page:
+                    totals.add(doc)
+                rows += len(page)
+            return rows, len(totals.groups)
+        report.append(measure(f"stream/{page_size}{'' if use_select else ' no-select'}", databases, stream))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    print(f"{'mode':<22}{'rows':>10}{'groups':>8}{'requests':>10}{'MB xfer':>10}{'peak MB':>10}{'wall':>9}{'rows/s':>10}")
+    for row in report:
+        print(f"{row['mode']:<22}{row['rows']:>10}{row['groups']:>8}{row['requests']:>10}{row['mb_transferred']:>10}"
+              f"{row['peak_mb']:>10}{row['wall_s']:>8.2f}s{row['rows_per_s']:>10}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
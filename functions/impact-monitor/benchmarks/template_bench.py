@@ -0,0 +1,247 @@
+"""
+Report rendering micro-benchmark: the old generate_report_html f-string vs
+the compiled template plan.
+
+  fstring        - the previous implementation (kept verbatim below)
+  compiled       - render() on the tenant's cached, brand-bound plan
+  generate       - generate_report_html(): stamp, render and decode to str
+  batch          - render_reports() over --periods periods, per report
+
+plus the one-off cost of parsing and compiling the template (paid once per
+process). Outputs are checked to match, whitespace aside.
+
+Usage:
+    python benchmarks/template_bench.py [--iterations 20000] [--periods 12] [--json]
+"""
+import argparse
+import importlib.util
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FUNCTION_DIR = os.path.dirname(HERE)
+
+METRICS = {
+    'hours_saved': 123.4, 'token_efficiency': 85, 'carbon_offset_kg': 61.7, 'content_pieces': 42,
+    'flash_requests': 310, 'cost_savings': 30, 'skills_deployed': 9, 'learning_traces': 517,
+    'human_approvals': 42, 'rejection_rate': 12.5,
+}
+
+
+def load_function():
+    spec = importlib.util.spec_from_file_location('impact_monitor', os.path.join(FUNCTION_DIR, 'main.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def fstring_report_html(metrics: dict, period: str) -> str:
+    """generate_report_html as it was before the template engine."""
+    return f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <title>Fikanova ESG Report - {period}</title>
+        <style>
+            body {{
+                font-family: 'Inter', -apple-system, sans-serif;
+                max-width: 800px;
+                margin: 0 auto;
+                padding: 40px;
+                color: #1a1a2e;
+            }}
+            .header {{
+                text-align: center;
+                border-bottom: 2px solid #8b5cf6;
+                padding-bottom: 20px;
+                margin-bottom: 40px;
+            }}
+            .header h1 {{ color: #8b5cf6; margin-bottom: 8px; }}
+            .header p {{ color: #666; }}
+            .section {{ margin-bottom: 40px; }}
+            .section h2 {{ 
+                color: #1a1a2e; 
+                border-left: 4px solid #8b5cf6;
+                padding-left: 16px;
+            }}
+            .metric-grid {{
+                display: grid;
+                grid-template-columns: repeat(3, 1fr);
+                gap: 20px;
+                margin-top: 20px;
+            }}
+            .metric-card {{
+                background: #f8f9fa;
+                border-radius: 12px;
+                padding: 24px;
+                text-align: center;
+            }}
+            .metric-value {{
+                font-size: 2.5rem;
+                font-weight: 700;
+                color: #8b5cf6;
+            }}
+            .metric-label {{
+                font-size: 0.875rem;
+                color: #666;
+                margin-top: 8px;
+            }}
+            .insight {{
+                background: #f0f9ff;
+                border-left: 4px solid #3b82f6;
+                padding: 16px;
+                margin: 16px 0;
+            }}
+            .footer {{
+                text-align: center;
+                color: #666;
+                font-size: 0.875rem;
+                margin-top: 60px;
+                padding-top: 20px;
+                border-top: 1px solid #ddd;
+            }}
+        </style>
+    </head>
+    <body>
+        <div class="header">
+            <h1>Fikanova ESG Report</h1>
+            <p>Environmental, Social & Governance Metrics</p>
+            <p><strong>Period:</strong> {period}</p>
+        </div>
+
+        <div class="section">
+            <h2>🌍 Environmental Impact</h2>
+            <div class="metric-grid">
+                <div class="metric-card">
+                    <div class="metric-value">{metrics.get('hours_saved', 0):.1f}</div>
+                    <div class="metric-label">Hours Saved by AI</div>
+                </div>
+                <div class="metric-card">
+                    <div class="metric-value">{metrics.get('carbon_offset_kg', 0):.2f}</div>
+                    <div class="metric-label">kg CO₂ Reduced</div>
+                </div>
+                <div class="metric-card">
+                    <div class="metric-value">{metrics.get('token_efficiency', 0):.0f}%</div>
+                    <div class="metric-label">Token Efficiency</div>
+                </div>
+            </div>
+            <div class="insight">
+                <strong>Insight:</strong> By routing {metrics.get('flash_requests', 0)} requests to Gemini Flash 
+                instead of Pro, we reduced compute costs by {metrics.get('cost_savings', 0):.0f}% while 
+                maintaining quality.
+            </div>
+        </div>
+
+        <div class="section">
+            <h2>👥 Social Impact</h2>
+            <div class="metric-grid">
+                <div class="metric-card">
+                    <div class="metric-value">{metrics.get('content_pieces', 0)}</div>
+                    <div class="metric-label">Content Pieces Generated</div>
+                </div>
+                <div class="metric-card">
+                    <div class="metric-value">{metrics.get('learning_traces', 0)}</div>
+                    <div class="metric-label">AI Learning Events</div>
+                </div>
+                <div class="metric-card">
+                    <div class="metric-value">{metrics.get('skills_deployed', 0)}</div>
+                    <div class="metric-label">Skills Deployed (Free)</div>
+                </div>
+            </div>
+            <div class="insight">
+                <strong>Knowledge Sharing:</strong> {metrics.get('learning_traces', 0)} learning events 
+                contributed to open-source AI training, benefiting the broader SME community.
+            </div>
+        </div>
+
+        <div class="section">
+            <h2>🏛️ Governance</h2>
+            <div class="metric-grid">
+                <div class="metric-card">
+                    <div class="metric-value">{metrics.get('human_approvals', 0)}</div>
+                    <div class="metric-label">Human Approvals</div>
+                </div>
+                <div class="metric-card">
+                    <div class="metric-value">{metrics.get('rejection_rate', 0):.1f}%</div>
+                    <div class="metric-label">Content Rejection Rate</div>
+                </div>
+                <div class="metric-card">
+                    <div class="metric-value">100%</div>
+                    <div class="metric-label">Human-in-the-Loop</div>
+                </div>
+            </div>
+            <div class="insight">
+                <strong>Oversight:</strong> All AI-generated content passes through human review 
+                before publication, ensuring brand consistency and accuracy.
+            </div>
+        </div>
+
+        <div class="footer">
+            <p>Generated by Fikanova AI Workforce | {datetime.now().strftime('%Y-%m-%d %H:%M UTC')}</p>
+            <p>This report is auto-generated for compliance and fundraising documentation.</p>
+        </div>
+    </body>
+    </html>
+    """
+
+
+
+def per_call_us(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--periods', type=int, default=12, help='reports per batch render')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    impact = load_function()
+    normalize = lambda text: re.sub(r'\s+', ' ', text).strip()
+    if normalize(fstring_report_html(METRICS, '2025-01')) != normalize(impact.generate_report_html(METRICS, '2025-01')):
+        print('warning: template output differs from the f-string', file=sys.stderr)
+
+    with open(os.path.join(impact.REPORT_TEMPLATE_DIR, 'esg_report.html'), encoding='utf-8') as f:
+        source = f.read()
+    compile_us = per_call_us(lambda: impact.ReportTemplate(source).bind(brand=impact.report_brand()), 200)
+
+    plan = impact.get_report_template()
+    context = {'period': '2025-01', 'metrics': METRICS, 'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M UTC')}
+    batch = [(f"2024-{m:02d}", METRICS) for m in range(1, args.periods + 1)]
+    batch_iterations = max(args.iterations // args.periods, 1)
+
+    report = [
+        {'mode': 'fstring', 'us': per_call_us(lambda: fstring_report_html(METRICS, '2025-01').encode(), args.iterations)},
+        {'mode': 'compiled', 'us': per_call_us(lambda: plan.render(context), args.iterations)},
+        {'mode': 'generate', 'us': per_call_us(lambda: impact.generate_report_html(METRICS, '2025-01'), args.iterations)},
+        {'mode': f"batch/{args.periods}",
+         'us': per_call_us(lambda: impact.render_reports(batch), batch_iterations) / args.periods},
+        {'mode': 'compile (once)', 'us': compile_us},
+    ]
+    baseline = report[0]['us']
+    for row in report:
+        row['us'] = round(row['us'], 2)
+        row['vs_fstring'] = round(baseline / row['us'], 2) if row['us'] else 0.0
+    stats = {'slots': plan.slots, 'segments': len(plan.plan) - plan.slots, 'bytes': len(plan.render(context))}
+
+    if args.json:
+        print(json.dumps({'template': stats, 'modes': report}, indent=2))
+        return 0
+    print(f"template: {stats['slots']} slots, {stats['segments']} static segments, {stats['bytes']} bytes rendered")
+    print(f"{'mode':<16}{'per report':>14}{'vs f-string':>13}")
+    for row in report:
+        print(f"{row['mode']:<16}{row['us']:>12.2f}us{row['vs_fstring']:>12.2f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,15 +4,26 @@ Provides real-time monitoring, ESG report generation, and metrics aggregation.
 
 Endpoints (via 'action' parameter):
   - monitor: Real-time impact check (default)
-  - report:  Generate monthly ESG PDF report
+  - report:  Monthly ESG report, stored as HTML + PDF in the esg-reports bucket
   - metrics: Aggregate dashboard data
+  - rollup:  Advance the incremental Metric_Rollups aggregates
+
+Each endpoint runs its Appwrite queries concurrently and reports
+per-query timings under 'query_timings'. monitor and metrics responses are
+cached per instance (TTL, stale-while-revalidate, ETag / 304).
 """
 import os
+import re
+import html
 import json
-from datetime import datetime, timedelta
+import time
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime, timedelta, timezone
 from appwrite.client import Client
 from appwrite.services.databases import Databases
-from appwrite.services.storage import Storage
 from appwrite.query import Query
 from appwrite.id import ID
 
@@ -21,188 +32,914 @@ APPWRITE_ENDPOINT = os.environ.get('APPWRITE_ENDPOINT', 'https://fra.cloud.appwr
 APPWRITE_PROJECT_ID = os.environ.get('APPWRITE_PROJECT_ID')
 APPWRITE_API_KEY = os.environ.get('APPWRITE_API_KEY')
 DATABASE_ID = os.environ.get('DATABASE_ID', '693703ef001133c62d78')
-STORAGE_BUCKET_ID = os.environ.get('STORAGE_BUCKET_ID', 'esg-reports')
+STORAGE_BUCKET_ID = os.environ.get('STORAGE_BUCKET_ID', '6948fc80003ca6505164')  # esg-reports
+
+# Independent list_documents calls run concurrently on a small pool; each
+# gets IMPACT_QUERY_TIMEOUT_S before its check is treated as failed.
+# Paginated scans (rollup reads) have their own pool and timeout, so a slow
+# scan can't hold the workers the single-call checks need.
+QUERY_WORKERS = int(os.environ.get('IMPACT_QUERY_WORKERS', '6'))
+QUERY_TIMEOUT_S = float(os.environ.get('IMPACT_QUERY_TIMEOUT_S', '5'))
+SCAN_WORKERS = int(os.environ.get('IMPACT_SCAN_WORKERS', '3'))
+SCAN_TIMEOUT_S = float(os.environ.get('IMPACT_SCAN_TIMEOUT_S', '15'))
+
+# Scans page through collections with cursorAfter, IMPACT_PAGE_SIZE rows
+# per request, fetching only the fields they aggregate
+PAGE_SIZE = int(os.environ.get('IMPACT_PAGE_SIZE', '500'))
+
+# Rollups: hourly/daily (and ESG per-period) counts and sums kept in
+# Metric_Rollups, advanced from a $createdAt high-water mark.
+# {"action": "rollup"} advances them by up to IMPACT_ROLLUP_MAX_ROWS (run it
+# on a schedule); reads only top them up, by at most
+# IMPACT_ROLLUP_REQUEST_MAX_ROWS, when this instance's view is older than
+# IMPACT_ROLLUP_MAX_AGE_S, and otherwise serve them as they are.
+ROLLUP_COLLECTION = os.environ.get('IMPACT_ROLLUP_COLLECTION', 'Metric_Rollups')
+ROLLUP_MAX_ROWS = int(os.environ.get('IMPACT_ROLLUP_MAX_ROWS', '5000'))
+ROLLUP_REQUEST_MAX_ROWS = int(os.environ.get('IMPACT_ROLLUP_REQUEST_MAX_ROWS', '500'))
+ROLLUP_MAX_AGE_S = float(os.environ.get('IMPACT_ROLLUP_MAX_AGE_S', '60'))
+ROLLUP_LAG_S = 5
+# A run claims the mark it starts from; a claim this old is presumed dead
+ROLLUP_CLAIM_TTL_S = float(os.environ.get('IMPACT_ROLLUP_CLAIM_TTL_S', '300'))
+ROLLUP_CLAIM_ATTEMPTS = 5
+# source collection -> fields: metric type, value (None counts rows),
+# timestamp for hour/day buckets, and an optional reporting period
+ROLLUP_SOURCES = {
+    'ESG_Metrics': {'metric': 'metric_type', 'value': 'value', 'time': 'logged_at', 'period': 'period'},
+    'Communications': {'metric': 'channel', 'value': None, 'time': 'created_at'},
+}
+
+# Polled actions are answered from a per-instance cache: fresh for their
+# TTL, then served stale for up to IMPACT_CACHE_STALE_S more while one
+# background rebuild runs. Clients sending If-None-Match get a 304 while
+# the payload (minus timestamps and timings) is unchanged.
+CACHE_TTL_S = {
+    'monitor': float(os.environ.get('IMPACT_MONITOR_TTL_S', '10')),
+    'metrics': float(os.environ.get('IMPACT_METRICS_TTL_S', '30')),
+}
+CACHE_STALE_S = float(os.environ.get('IMPACT_CACHE_STALE_S', '120'))
+# Fields that change on every build and so are left out of the ETag
+CACHE_VOLATILE_KEYS = ('timestamp', 'query_timings', 'cache')
+
+# Rendered reports are stored as one file per period, tenant and format. Its
+# name carries a hash of the period's inputs (ESG rollups and the counts of
+# rows created in that month), the template and this version (bump it when
+# a template changes); a file whose hash no longer matches is replaced.
+REPORT_RENDER_VERSION = '1'
+
+# Report templates are parsed once per process into a render plan. A tenant
+# gets templates/esg_report.<tenant>.html when it has one, else the default,
+# with its IMPACT_REPORT_BRANDS entry (JSON) filling the {{ brand.* }} slots.
+REPORT_TEMPLATE_DIR = os.environ.get(
+    'IMPACT_REPORT_TEMPLATE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates'))
+REPORT_BRANDS = {'default': {'name': 'Fikanova', 'accent': '#8b5cf6'}}
+REPORT_BRANDS.update(json.loads(os.environ.get('IMPACT_REPORT_BRANDS', '{}')))
+REPORT_MAX_PERIODS = 24
+
+
+# ============================================================================
+# APPWRITE CLIENT (built once per warm instance)
+# ============================================================================
+
+_services = {}
+# Re-entrant: get_databases() builds the client under the same lock
+_services_lock = threading.RLock()
+
+
+def get_client() -> Client:
+    """Module-cached Appwrite client, configured on first use."""
+    if 'client' not in _services:
+        with _services_lock:
+            if 'client' not in _services:
+                client = Client()
+                client.set_endpoint(APPWRITE_ENDPOINT)
+                client.set_project(APPWRITE_PROJECT_ID)
+                client.set_key(APPWRITE_API_KEY)
+                _services['client'] = client
+    return _services['client']
+
+
+def get_databases() -> Databases:
+    if 'databases' not in _services:
+        with _services_lock:
+            if 'databases' not in _services:
+                _services['databases'] = Databases(get_client())
+    return _services['databases']
+
+
+def get_storage():
+    """Storage service; its module is only imported when a report needs it."""
+    if 'storage' not in _services:
+        with _services_lock:
+            if 'storage' not in _services:
+                from appwrite.services.storage import Storage
+                _services['storage'] = Storage(get_client())
+    return _services['storage']
+
+
+# ============================================================================
+# QUERY FAN-OUT (concurrent list_documents with per-query timeouts)
+# ============================================================================
+
+def get_executor(kind: str = 'query') -> ThreadPoolExecutor:
+    """The 'query' or 'scan' pool, kept for the warm instance like the Appwrite client."""
+    key = f"{kind}_executor"
+    if key not in _services:
+        with _services_lock:
+            if key not in _services:
+                workers = SCAN_WORKERS if kind == 'scan' else QUERY_WORKERS
+                _services[key] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"impact-{kind}")
+    return _services[key]
+
+
+# The running fan-out job's deadline, checked by iter_pages between pages
+_job = threading.local()
+
+
+def _past_deadline() -> bool:
+    deadline = getattr(_job, 'deadline', None)
+    return deadline is not None and time.perf_counter() >= deadline
+
+
+def _timed(deadline: float, fn, *args) -> tuple:
+    start = time.perf_counter()
+    if start >= deadline:
+        # Queued behind slower work until its caller gave up: don't start it
+        return TimeoutError("deadline passed before the query started"), 0.0
+    _job.deadline = deadline
+    try:
+        response = fn(*args)
+    except Exception as e:
+        response = e
+    finally:
+        _job.deadline = None
+    return response, (time.perf_counter() - start) * 1000
+
+
+def fan_out(databases, queries: dict) -> tuple:
+    """
+    Run independent list_documents calls concurrently.
+    
+    `queries` maps a name to (collection_id, [Query, ...]), or to (job,)
+    for a zero-argument callable such as a paginated aggregation; either
+    may end with a timeout overriding QUERY_TIMEOUT_S (SCAN_TIMEOUT_S for
+    callables, which run on the scan pool). Returns (results, timings):
+    each result is the response, or the exception the query raised
+    (TimeoutError if it overran), so every caller keeps its own failure
+    handling and can tell a failed count from a zero.
+    
+    Every job's deadline counts from the start of the fan-out. A job still
+    queued at its deadline never runs, and a paginated job stops at its
+    next page, so abandoned work frees its worker instead of delaying the
+    next request's queries.
+    """
+    started = time.perf_counter()
+    futures = {}
+    for name, spec in queries.items():
+        if callable(spec[0]):
+            timeout = spec[1] if len(spec) > 1 else SCAN_TIMEOUT_S
+            future = get_executor('scan').submit(_timed, started + timeout, spec[0])
+        else:
+            timeout = spec[2] if len(spec) > 2 else QUERY_TIMEOUT_S
+            future = get_executor().submit(_timed, started + timeout, databases.list_documents,
+                                           DATABASE_ID, spec[0], spec[1])
+        futures[name] = (future, timeout)
+    
+    results, timings = {}, {}
+    for name, (future, timeout) in futures.items():
+        try:
+            response, elapsed_ms = future.result(max(started + timeout - time.perf_counter(), 0))
+        except FutureTimeout:
+            future.cancel()
+            response, elapsed_ms = TimeoutError(f"{name} query timed out after {timeout}s"), timeout * 1000
+        results[name] = response
+        timings[name] = {'ms': round(elapsed_ms, 1), 'status': 'ok'}
+        if failed(response):
+            timings[name].update(status='timeout' if isinstance(response, TimeoutError) else 'error',
+                                 error=str(response))
+    
+    return results, {'wall_ms': round((time.perf_counter() - started) * 1000, 1), 'queries': timings}
+
+
+def failed(result) -> bool:
+    return isinstance(result, Exception)
+
+
+# ============================================================================
+# PAGINATION (cursor-paged streams into running aggregates)
+# ============================================================================
+
+def iter_pages(databases, collection_id: str, queries: list = None, select: list = None,
+               page_size: int = PAGE_SIZE, after: str = None):
+    """
+    Yield a collection's matching documents one page at a time.
+    
+    Pages are chained with cursorAfter (resuming after `after`, a document
+    id, if given), so only one page is held at once however many rows
+    match. `select` limits each row to the named fields; $id is always
+    fetched since the cursor needs it. Inside a fan_out() job, a scan that
+    outlives the job's deadline raises TimeoutError between pages.
+    """
+    base = list(queries or []) + [Query.limit(page_size)]
+    if select:
+        base.append(Query.select(sorted(set(select) | {'$id'})))
+    cursor = after
+    while True:
+        if _past_deadline():
+            raise TimeoutError(f"{collection_id} scan stopped at its deadline")
+        page_queries = base + [Query.cursor_after(cursor)] if cursor else base
+        page = databases.list_documents(DATABASE_ID, collection_id, page_queries).get('documents', [])
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        cursor = page[-1]['$id']
+
+
+def iter_documents(databases, collection_id: str, queries: list = None, select: list = None,
+                   page_size: int = PAGE_SIZE, after: str = None):
+    """iter_pages(), flattened to one document at a time."""
+    for page in iter_pages(databases, collection_id, queries, select, page_size, after):
+        yield from page
+
+
+class GroupedTotals:
+    """
+    Running count, sum and latest value per group over a document stream.
+    Memory grows with the number of groups, never with the number of rows.
+    
+    By default each document counts once and adds its `value` field. Over
+    pre-aggregated rows (rollups), `weight` names the field holding each
+    row's count and `latest` the field holding its most recent value.
+    """
+
+    def __init__(self, group_by: str, value: str = None, weight: str = None, latest: str = None):
+        self.group_by = group_by
+        self.value = value
+        self.weight = weight
+        self.latest = latest or value
+        self.groups = {}
+
+    @property
+    def fields(self) -> list:
+        """The fields add() reads, for iter_pages(select=...)."""
+        return [f for f in (self.group_by, self.value, self.weight, self.latest) if f]
+
+    def add(self, doc: dict):
+        totals = self.groups.get(doc.get(self.group_by))
+        if totals is None:
+            totals = self.groups[doc.get(self.group_by)] = {'count': 0, 'sum': 0.0, 'latest': None}
+        totals['count'] += (doc.get(self.weight) or 0) if self.weight else 1
+        if self.value:
+            totals['sum'] += doc.get(self.value) or 0
+        if self.latest and doc.get(self.latest) is not None:
+            totals['latest'] = doc[self.latest]
+
+    def consume(self, documents) -> dict:
+        for doc in documents:
+            self.add(doc)
+        return self.groups
+
+
+# ============================================================================
+# ROLLUPS (incremental hourly / daily aggregates)
+# ============================================================================
+
+def rollup_id(source: str, granularity: str, metric_type: str, bucket: str) -> str:
+    """Deterministic Metric_Rollups document id (Appwrite ids max out at 36 chars)."""
+    return hashlib.sha1(f"{source}|{granularity}|{metric_type}|{bucket}".encode()).hexdigest()[:32]
+
+
+def _mark(doc: dict) -> str:
+    """
+    High-water mark after `doc`: its $id anchors the next run's cursor,
+    and its $createdAt is the fallback if that row is later deleted.
+    """
+    return f"{doc.get('$createdAt', '')}|{doc['$id']}"
+
+
+def _rollup_buckets(spec: dict, doc: dict) -> list:
+    timestamp = doc.get(spec['time']) or doc.get('$createdAt') or ''
+    buckets = [('hour', timestamp[:13]), ('day', timestamp[:10])]
+    if spec.get('period') and doc.get(spec['period']):
+        buckets.append(('period', doc[spec['period']]))
+    return [(granularity, bucket) for granularity, bucket in buckets if bucket]
+
+
+def _load_rollups(databases, document_ids: list) -> dict:
+    """Existing rollup documents by id, fetched 100 ids per request."""
+    found = {}
+    for i in range(0, len(document_ids), 100):
+        chunk = document_ids[i:i + 100]
+        response = databases.list_documents(DATABASE_ID, ROLLUP_COLLECTION,
+                                            [Query.equal('$id', chunk), Query.limit(len(chunk))])
+        found.update((doc['$id'], doc) for doc in response.get('documents', []))
+    return found
+
+
+def _get_rollup(databases, document_id: str):
+    try:
+        return databases.get_document(DATABASE_ID, ROLLUP_COLLECTION, document_id)
+    except Exception as e:
+        if getattr(e, 'code', None) == 404:
+            return None
+        raise
+
+
+def _put_rollup(databases, document_id: str, data: dict, exists: bool):
+    if exists:
+        databases.update_document(DATABASE_ID, ROLLUP_COLLECTION, document_id, data)
+    else:
+        databases.create_document(DATABASE_ID, ROLLUP_COLLECTION, document_id, data)
+
+
+def _pages_since(databases, source: str, spec: dict, watermark: str):
+    """Pages of `source` rows after the high-water mark, oldest first, only the fields rollups read."""
+    created_after, _, cursor = watermark.partition('|')
+    until = (datetime.utcnow() - timedelta(seconds=ROLLUP_LAG_S)).isoformat()
+    queries = [Query.order_asc('$createdAt'), Query.less_than_equal('$createdAt', until)]
+    if created_after:
+        queries.append(Query.greater_than_equal('$createdAt', created_after))
+    select = ['$createdAt'] + [spec[f] for f in ('metric', 'value', 'time', 'period') if spec.get(f)]
+    
+    started = False
+    try:
+        for page in iter_pages(databases, source, queries, select, after=cursor or None):
+            started = True
+            yield page
+    except Exception as e:
+        # Only Appwrite rejecting the cursor document itself means the mark's row was deleted;
+        # anything else (network, 5xx, a deadline) must leave the mark where it is
+        if started or not cursor or getattr(e, 'code', None) not in (400, 404) or cursor not in str(e):
+            raise
+        # The deleted row can't anchor a cursor: resume strictly after its timestamp
+        queries[-1] = Query.greater_than('$createdAt', created_after)
+        yield from iter_pages(databases, source, queries, select)
+
+
+def _claimed_at(claim: dict) -> datetime:
+    """A claim's updated_at as naive UTC (Appwrite returns it with an offset)."""
+    claimed = datetime.fromisoformat(str(claim.get('updated_at') or '1970-01-01T00:00:00'))
+    if claimed.tzinfo is not None:
+        claimed = claimed.astimezone(timezone.utc).replace(tzinfo=None)
+    return claimed
+
+
+def _claim_run(databases, source: str, watermark: str):
+    """
+    Claim the run that starts from `watermark`, returning the claim's id, or
+    None if another instance holds it.
+    
+    Claims are create-only Metric_Rollups documents keyed by source, mark
+    and attempt, so exactly one instance can create each. A claim older
+    than ROLLUP_CLAIM_TTL_S belongs to a run that died; the next attempt's
+    id is then open, and again only one instance gets it.
+    """
+    now = datetime.utcnow()
+    for attempt in range(ROLLUP_CLAIM_ATTEMPTS):
+        claim_id = rollup_id(source, 'claim', str(attempt), watermark)
+        try:
+            databases.create_document(DATABASE_ID, ROLLUP_COLLECTION, claim_id, {
+                'source': source, 'metric_type': '*', 'granularity': 'claim', 'bucket': str(attempt),
+                'through': watermark, 'updated_at': now.isoformat()
+            })
+            return claim_id
+        except Exception as e:
+            if getattr(e, 'code', None) != 409:
+                raise
+        claim = _get_rollup(databases, claim_id)
+        # Gone: its run finished and moved the mark past ours
+        if claim is None or now - _claimed_at(claim) < timedelta(seconds=ROLLUP_CLAIM_TTL_S):
+            return None
+    return None
+
+
+def _release_claim(databases, claim_id: str):
+    try:
+        databases.delete_document(DATABASE_ID, ROLLUP_COLLECTION, claim_id)
+    except Exception as e:
+        if getattr(e, 'code', None) != 404:
+            raise
+
+
+def refresh_rollups(databases, source: str, max_rows: int = ROLLUP_MAX_ROWS) -> dict:
+    """
+    Fold the rows added to `source` since its high-water mark into the
+    hourly, daily (and, for ESG_Metrics, per-period) rollups.
+    
+    Rows are read in $createdAt order by cursor from the last row folded,
+    up to max_rows per run and only once they are ROLLUP_LAG_S old, so
+    slow writers can't slip in behind the mark. Each rollup records the
+    run that last wrote it (the mark it started from) and the last row it
+    folded, as 'through' = "<start id>><row id>". A run that died between
+    writing rollups and the mark is retried from the same start and reads
+    the same rows in the same order, so each rollup it already wrote skips
+    its rows up to and including that last row and nothing is counted
+    twice.
+    
+    Instances share the mark, so a run first claims it (see _claim_run)
+    and re-reads it: a run whose mark another instance has claimed or
+    already moved does nothing and reports 'busy'.
+    """
+    state_id = rollup_id(source, 'watermark', '*', '')
+    state = _get_rollup(databases, state_id)
+    watermark = (state or {}).get('through') or ''
+    _rollups_refreshed_at[source] = time.time()
+    busy = {'source': source, 'rows': 0, 'rollups': 0, 'through': watermark or None, 'caught_up': False, 'busy': True}
+    
+    claim_id = _claim_run(databases, source, watermark)
+    if claim_id is None:
+        return busy
+    try:
+        state = _get_rollup(databases, state_id)
+        if ((state or {}).get('through') or '') != watermark:
+            return busy
+        return _fold_run(databases, source, state_id, state, max_rows)
+    finally:
+        # A run that raises is retried safely from the same mark; one that dies
+        # without getting here keeps the claim until ROLLUP_CLAIM_TTL_S
+        _release_claim(databases, claim_id)
+
+
+def _fold_run(databases, source: str, state_id: str, state: dict, max_rows: int) -> dict:
+    """refresh_rollups() once the run is claimed: fold, write the rollups, then move the mark."""
+    spec = ROLLUP_SOURCES[source]
+    watermark = (state or {}).get('through') or ''
+    run = watermark.rpartition('|')[2]
+    
+    rollups = {}   # document id -> {'exists', 'data', 'skip_until'}
+    processed = 0
+    for docs in _pages_since(databases, source, spec, watermark):
+        targets = []
+        for doc in docs:
+            metric_type = str(doc.get(spec['metric']) or 'unknown')
+            targets.append([(rollup_id(source, granularity, metric_type, bucket), metric_type, granularity, bucket)
+                            for granularity, bucket in _rollup_buckets(spec, doc)])
+        
+        new_ids = list(dict.fromkeys(t[0] for row in targets for t in row if t[0] not in rollups))
+        existing = _load_rollups(databases, new_ids) if new_ids else {}
+        for document_id, metric_type, granularity, bucket in (t for row in targets for t in row):
+            if document_id in rollups:
+                continue
+            doc = existing.get(document_id) or {}
+            started_from, _, last_row = (doc.get('through') or '').partition('>')
+            rollups[document_id] = {
+                'exists': document_id in existing,
+                'skip_until': last_row if last_row and started_from == run else None,
+                'data': {
+                    'source': source, 'metric_type': metric_type, 'granularity': granularity, 'bucket': bucket,
+                    'count': doc.get('count') or 0,
+                    'sum': doc.get('sum') or 0.0,
+                    'last_value': doc.get('last_value'),
+                    'through': doc.get('through') or ''
+                }
+            }
+        
+        for doc, row_targets in zip(docs, targets):
+            value = float(doc.get(spec['value']) or 0) if spec.get('value') else 1.0
+            for document_id, _, _, _ in row_targets:
+                rollup = rollups[document_id]
+                if rollup['skip_until']:
+                    # Folded by an earlier, interrupted run from the same mark
+                    if doc['$id'] == rollup['skip_until']:
+                        rollup['skip_until'] = None
+                    continue
+                data = rollup['data']
+                data['count'] += 1
+                data['sum'] += value
+                data['last_value'] = value
+                data['through'] = f"{run}>{doc['$id']}"
+        
+        processed += len(docs)
+        watermark = _mark(docs[-1])
+        if processed >= max_rows:
+            break
+    
+    now = datetime.utcnow().isoformat()
+    for document_id, rollup in rollups.items():
+        _put_rollup(databases, document_id, dict(rollup['data'], updated_at=now), rollup['exists'])
+    if processed:
+        _put_rollup(databases, state_id, {
+            'source': source, 'metric_type': '*', 'granularity': 'watermark', 'bucket': '',
+            'count': ((state or {}).get('count') or 0) + processed, 'through': watermark, 'updated_at': now
+        }, state is not None)
+    
+    return {'source': source, 'rows': processed, 'rollups': len(rollups),
+            'through': watermark or None, 'caught_up': processed < max_rows}
+
+
+_rollups_refreshed_at = {}
+# One refresh per source at a time on this instance (claims cover the others)
+_rollup_locks = {source: threading.Lock() for source in ROLLUP_SOURCES}
+
+
+def ensure_rollups(databases, context, *sources):
+    """
+    Top up the sources' rollups on the request path, if this instance
+    hasn't in ROLLUP_MAX_AGE_S: at most ROLLUP_REQUEST_MAX_ROWS rows each,
+    and not at all while another request here is already refreshing that
+    source. A larger backlog is left to the scheduled rollup run; the
+    caller reads whatever the rollups hold.
+    """
+    for source in sources:
+        if time.time() - _rollups_refreshed_at.get(source, 0) < ROLLUP_MAX_AGE_S:
+            continue
+        if not _rollup_locks[source].acquire(blocking=False):
+            continue
+        try:
+            result = refresh_rollups(databases, source, ROLLUP_REQUEST_MAX_ROWS)
+            if result['rows']:
+                context.log(f"Rolled up {result['rows']} {source} rows into {result['rollups']} buckets")
+            if not result['caught_up'] and not result.get('busy'):
+                context.log(f"{source} rollups are behind; the scheduled rollup run will catch up")
+        except Exception as e:
+            # Back off like a successful refresh rather than retrying on every read
+            _rollups_refreshed_at[source] = time.time()
+            context.log(f"Rollup refresh failed for {source}: {e}")
+        finally:
+            _rollup_locks[source].release()
+
+
+def rollup_totals(databases, source: str, granularity: str, since: str = None, until: str = None,
+                  bucket: str = None) -> dict:
+    """
+    Per-metric {'count', 'sum', 'latest'} over one source's buckets in a
+    range - O(buckets), not O(rows). Buckets stream in time order, so
+    'latest' is the most recent bucket's last value.
+    """
+    queries = [Query.equal('source', source), Query.equal('granularity', granularity), Query.order_asc('bucket')]
+    if bucket:
+        queries.append(Query.equal('bucket', bucket))
+    if since:
+        queries.append(Query.greater_than_equal('bucket', since))
+    if until:
+        queries.append(Query.less_than_equal('bucket', until))
+    totals = GroupedTotals('metric_type', value='sum', weight='count', latest='last_value')
+    return totals.consume(iter_documents(databases, ROLLUP_COLLECTION, queries, select=totals.fields))
+
+
+def handle_rollup(context, databases) -> dict:
+    """Advance every source's rollups (for a scheduled run)."""
+    sources = []
+    for source in ROLLUP_SOURCES:
+        with _rollup_locks[source]:
+            sources.append(refresh_rollups(databases, source))
+    return {'status': 'success', 'sources': sources}
+
+
+# ============================================================================
+# RESPONSE CACHE (TTL + stale-while-revalidate + ETag for polled actions)
+# ============================================================================
+
+def _stable(value):
+    """The payload without its per-build fields, for hashing."""
+    if isinstance(value, dict):
+        return {k: _stable(v) for k, v in value.items() if k not in CACHE_VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [_stable(v) for v in value]
+    return value
+
+
+def etag_for(body: dict) -> str:
+    digest = hashlib.sha1(json.dumps(_stable(body), sort_keys=True, default=str).encode()).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+class BackgroundLog:
+    """
+    Stands in for the request context during a background rebuild, which
+    outlives the execution that started it: the handler's log lines are
+    kept here as plain strings instead of going to a finished context.
+    """
+    
+    def __init__(self, size: int = 50):
+        self.lines = deque(maxlen=size)
+    
+    def log(self, message):
+        self.lines.append(f"{datetime.utcnow().isoformat()} {message}")
+    
+    error = log
+
+
+class ResponseCache:
+    """
+    Last response per action. Misses and expired entries are rebuilt
+    inline, one caller at a time per action (others wait and share the
+    result); entries inside the stale window are served immediately while a
+    single background thread rebuilds them. The database therefore sees at
+    most one build per action per TTL, however many dashboards poll.
+    
+    `build` takes the context to log through: the caller's for inline
+    builds, `background_log` for background ones. A failed background
+    build is recorded in `errors` until the next successful one.
+    """
+    
+    def __init__(self, ttls: dict, stale_s: float):
+        self.ttls = ttls
+        self.stale_s = stale_s
+        self.entries = {}
+        self.locks = {action: threading.Lock() for action in ttls}
+        self.refreshing = set()
+        self.guard = threading.Lock()
+        self.background_log = BackgroundLog()
+        self.errors = {}
+    
+    def cacheable(self, action: str) -> bool:
+        return self.ttls.get(action, 0) > 0
+    
+    def _store(self, action: str, build, context) -> dict:
+        body = build(context)
+        entry = {'body': body, 'etag': etag_for(body), 'stored': time.monotonic()}
+        previous = self.entries.get(action)
+        if previous and previous['etag'] == entry['etag']:
+            entry['changed'] = previous.get('changed', previous['stored'])
+        self.entries[action] = entry
+        self.errors.pop(action, None)
+        return entry
+    
+    def _revalidate(self, action: str, build):
+        try:
+            with self.locks[action]:
+                self._store(action, build, self.background_log)
+        except Exception as e:
+            self.errors[action] = {'error': str(e), 'at': datetime.utcnow().isoformat()}
+            self.background_log.log(f"Background refresh of '{action}' failed: {e}")
+        finally:
+            with self.guard:
+                self.refreshing.discard(action)
+    
+    def get(self, action: str, build, context) -> tuple:
+        """Returns (entry, state) with state 'hit', 'stale' or 'miss'."""
+        ttl = self.ttls[action]
+        entry = self.entries.get(action)
+        age = time.monotonic() - entry['stored'] if entry else None
+        if entry and age < ttl:
+            return entry, 'hit'
+        if entry and age < ttl + self.stale_s:
+            with self.guard:
+                start = action not in self.refreshing
+                self.refreshing.add(action)
+            if start:
+                threading.Thread(target=self._revalidate, args=(action, build),
+                                 name=f"impact-refresh-{action}", daemon=True).start()
+            return entry, 'stale'
+        
+        with self.locks[action]:
+            # Someone else may have rebuilt it while we waited
+            entry = self.entries.get(action)
+            if entry and time.monotonic() - entry['stored'] < ttl:
+                return entry, 'hit'
+            return self._store(action, build, context), 'miss'
+    
+    def invalidate(self, action: str = None):
+        if action:
+            self.entries.pop(action, None)
+        else:
+            self.entries.clear()
+
+
+response_cache = ResponseCache(CACHE_TTL_S, CACHE_STALE_S)
+
+
+def if_none_match(req, data: dict) -> list:
+    """ETags from the If-None-Match header, or an 'if_none_match' body field for SDK executions."""
+    headers = getattr(req, 'headers', None) or {}
+    value = headers.get('if-none-match') or headers.get('If-None-Match') or data.get('if_none_match') or ''
+    return [tag.strip() for tag in value.split(',') if tag.strip()]
+
+
+def cached_response(context, action: str, handler, databases, data: dict):
+    """Serve a polled action through response_cache, with 304s for matching ETags."""
+    # Builds log through the context they are handed, so a background rebuild never touches this request's
+    entry, state = response_cache.get(action, lambda build_context: handler(build_context, databases), context)
+    now = time.monotonic()
+    age = now - entry['stored']
+    ttl = response_cache.ttls[action]
+    headers = {
+        'ETag': entry['etag'],
+        'Age': str(int(age)),
+        'Cache-Control': f"max-age={max(int(ttl - age), 0)}, stale-while-revalidate={int(response_cache.stale_s)}",
+        'X-Cache': state.upper(),
+    }
+    
+    tags = if_none_match(context.req, data)
+    if entry['etag'] in tags or '*' in tags:
+        return context.res.send('', 304, headers)
+    
+    body = dict(entry['body'])
+    body['cache'] = {
+        'state': state,
+        'age_s': round(age, 1),
+        'ttl_s': ttl,
+        'unchanged_for_s': round(now - entry.get('changed', entry['stored']), 1),
+        'etag': entry['etag'],
+    }
+    if action in response_cache.errors:
+        body['cache']['refresh_error'] = response_cache.errors[action]
+    return context.res.json(body, 200, headers)
+
+
+# ============================================================================
+# REPORT TEMPLATES (parsed once per process into static segments + slots)
+# ============================================================================
+
+SLOT_PATTERN = re.compile(r'\{\{\s*([\w.]+)\s*((?:\|\s*\w+(?::[^|}\s]*)?\s*)*)\}\}')
+TENANT_PATTERN = re.compile(r'[a-z0-9_-]{1,32}')
+
+
+def _lookup(keys: list):
+    """Getter for a dotted path; the usual one- and two-level paths get a direct lookup."""
+    if len(keys) == 1:
+        key, = keys
+        return lambda context: context.get(key)
+    if len(keys) == 2:
+        outer, inner = keys
+        return lambda context: (context.get(outer) or {}).get(inner)
+    
+    def walk(context):
+        value = context
+        for key in keys:
+            value = value.get(key) if isinstance(value, dict) else None
+        return value
+    return walk
+
+
+def _compile_slot(path: str, filters: str) -> tuple:
+    """
+    A `{{ path.to.value|filter }}` reference as (root key, %-format spec,
+    value getter). Filters: fixed:N formats a number with N decimals
+    (missing reads as 0); raw skips HTML escaping. Anything else renders
+    as escaped text.
+    """
+    keys = path.split('.')
+    decimals, escape = None, True
+    for spec in filter(None, (f.strip() for f in filters.split('|'))):
+        name, _, arg = spec.partition(':')
+        if name == 'fixed':
+            decimals = int(arg or 0)
+        elif name == 'raw':
+            escape = False
+        else:
+            raise ValueError(f"Unknown template filter '{name}' in {{{{ {path} }}}}")
+    
+    get = _lookup(keys)
+    if decimals is not None:
+        return keys[0], b'%%.%df' % decimals, lambda context: get(context) or 0
+    if escape:
+        return keys[0], b'%s', lambda context: html.escape(str(_blank(get(context)))).encode()
+    return keys[0], b'%s', lambda context: str(_blank(get(context))).encode()
+
+
+def _blank(value):
+    return '' if value is None else value
+
+
+class ReportTemplate:
+    """
+    A template compiled to a render plan: static byte segments (kept
+    %-escaped) and (root key, format spec, getter) slots. The plan is
+    flattened into one bytes %-format, so rendering is a tuple of slot
+    values and a single format call. bind() folds values shared by many renders (brand,
+    timestamp) into the static segments ahead of time.
+    """
+    
+    def __init__(self, source: str, name: str = 'inline'):
+        self.name = name
+        self.fingerprint = hashlib.sha1(source.encode()).hexdigest()[:16]
+        plan, position = [], 0
+        for match in SLOT_PATTERN.finditer(source):
+            plan.append(source[position:match.start()].encode().replace(b'%', b'%%'))
+            plan.append(_compile_slot(match.group(1), match.group(2)))
+            position = match.end()
+        plan.append(source[position:].encode().replace(b'%', b'%%'))
+        self._build(plan)
+    
+    def _build(self, plan: list):
+        """Merge adjacent static segments and flatten the plan into its %-format."""
+        self.plan = []
+        for part in plan:
+            if isinstance(part, bytes) and self.plan and isinstance(self.plan[-1], bytes):
+                self.plan[-1] += part
+            elif part != b'':
+                self.plan.append(part)
+        self.format = b''.join(part if isinstance(part, bytes) else part[1] for part in self.plan)
+        self.getters = [part[2] for part in self.plan if not isinstance(part, bytes)]
+    
+    @property
+    def slots(self) -> int:
+        return len(self.getters)
+    
+    def bind(self, **values) -> 'ReportTemplate':
+        """A copy with every slot under these top-level keys already rendered."""
+        bound = ReportTemplate.__new__(ReportTemplate)
+        bound.name = self.name
+        digest = repr(sorted(values.items())).encode()
+        bound.fingerprint = hashlib.sha1(self.fingerprint.encode() + digest).hexdigest()[:16]
+        bound._build([(part[1] % (part[2](values),)).replace(b'%', b'%%')
+                      if not isinstance(part, bytes) and part[0] in values else part
+                      for part in self.plan])
+        return bound
+    
+    def render(self, context: dict) -> bytes:
+        return self.format % tuple([get(context) for get in self.getters])
+
+
+# tenant -> compiled template with its brand bound
+_templates = {}
+
+
+def report_tenant(tenant: str = None) -> str:
+    """The tenant's own key if it has a brand or template variant, else 'default'."""
+    if tenant and TENANT_PATTERN.fullmatch(tenant) and (
+            tenant in REPORT_BRANDS or os.path.exists(os.path.join(REPORT_TEMPLATE_DIR, f"esg_report.{tenant}.html"))):
+        return tenant
+    return 'default'
+
+
+def report_brand(tenant: str = None) -> dict:
+    return {**REPORT_BRANDS['default'], **REPORT_BRANDS.get(report_tenant(tenant), {})}
+
+
+def get_report_template(tenant: str = None) -> ReportTemplate:
+    """Compiled template for a tenant, parsed on first use and kept for the process."""
+    key = report_tenant(tenant)
+    if key not in _templates:
+        path = os.path.join(REPORT_TEMPLATE_DIR, f"esg_report.{key}.html")
+        if not os.path.exists(path):
+            path = os.path.join(REPORT_TEMPLATE_DIR, 'esg_report.html')
+        with open(path, encoding='utf-8') as f:
+            template = ReportTemplate(f.read(), os.path.basename(path))
+        _templates[key] = template.bind(brand=report_brand(key))
+    return _templates[key]
+
+
+def render_reports(reports: list, tenant: str = None) -> list:
+    """
+    Render several (period, metrics) reports in one pass, sharing the
+    tenant's compiled plan and one generated-at stamp.
+    """
+    plan = get_report_template(tenant)
+    generated_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')
+    return [plan.render({'period': period, 'metrics': metrics, 'generated_at': generated_at})
+            for period, metrics in reports]
 
 
 # ============================================================================
 # ESG REPORT GENERATION (merged from esg-reporter)
 # ============================================================================
 
-def generate_report_html(metrics: dict, period: str) -> str:
+def generate_report_html(metrics: dict, period: str, tenant: str = None) -> str:
     """Generate HTML report from metrics data."""
-    return f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <title>Fikanova ESG Report - {period}</title>
-        <style>
-            body {{
-                font-family: 'Inter', -apple-system, sans-serif;
-                max-width: 800px;
-                margin: 0 auto;
-                padding: 40px;
-                color: #1a1a2e;
-            }}
-            .header {{
-                text-align: center;
-                border-bottom: 2px solid #8b5cf6;
-                padding-bottom: 20px;
-                margin-bottom: 40px;
-            }}
-            .header h1 {{ color: #8b5cf6; margin-bottom: 8px; }}
-            .header p {{ color: #666; }}
-            .section {{ margin-bottom: 40px; }}
-            .section h2 {{ 
-                color: #1a1a2e; 
-                border-left: 4px solid #8b5cf6;
-                padding-left: 16px;
-            }}
-            .metric-grid {{
-                display: grid;
-                grid-template-columns: repeat(3, 1fr);
-                gap: 20px;
-                margin-top: 20px;
-            }}
-            .metric-card {{
-                background: #f8f9fa;
-                border-radius: 12px;
-                padding: 24px;
-                text-align: center;
-            }}
-            .metric-value {{
-                font-size: 2.5rem;
-                font-weight: 700;
-                color: #8b5cf6;
-            }}
-            .metric-label {{
-                font-size: 0.875rem;
-                color: #666;
-                margin-top: 8px;
-            }}
-            .insight {{
-                background: #f0f9ff;
-                border-left: 4px solid #3b82f6;
-                padding: 16px;
-                margin: 16px 0;
-            }}
-            .footer {{
-                text-align: center;
-                color: #666;
-                font-size: 0.875rem;
-                margin-top: 60px;
-                padding-top: 20px;
-                border-top: 1px solid #ddd;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <h1>Fikanova ESG Report</h1>
-            <p>Environmental, Social & Governance Metrics</p>
-            <p><strong>Period:</strong> {period}</p>
-        </div>
-
-        <div class="section">
-            <h2>🌍 Environmental Impact</h2>
-            <div class="metric-grid">
-                <div class="metric-card">
-                    <div class="metric-value">{metrics.get('hours_saved', 0):.1f}</div>
-                    <div class="metric-label">Hours Saved by AI</div>
-                </div>
-                <div class="metric-card">
-                    <div class="metric-value">{metrics.get('carbon_offset_kg', 0):.2f}</div>
-                    <div class="metric-label">kg CO₂ Reduced</div>
-                </div>
-                <div class="metric-card">
-                    <div class="metric-value">{metrics.get('token_efficiency', 0):.0f}%</div>
-                    <div class="metric-label">Token Efficiency</div>
-                </div>
-            </div>
-            <div class="insight">
-                <strong>Insight:</strong> By routing {metrics.get('flash_requests', 0)} requests to Gemini Flash 
-                instead of Pro, we reduced compute costs by {metrics.get('cost_savings', 0):.0f}% while 
-                maintaining quality.
-            </div>
-        </div>
-
-        <div class="section">
-            <h2>👥 Social Impact</h2>
-            <div class="metric-grid">
-                <div class="metric-card">
-                    <div class="metric-value">{metrics.get('content_pieces', 0)}</div>
-                    <div class="metric-label">Content Pieces Generated</div>
-                </div>
-                <div class="metric-card">
-                    <div class="metric-value">{metrics.get('learning_traces', 0)}</div>
-                    <div class="metric-label">AI Learning Events</div>
-                </div>
-                <div class="metric-card">
-                    <div class="metric-value">{metrics.get('skills_deployed', 0)}</div>
-                    <div class="metric-label">Skills Deployed (Free)</div>
-                </div>
-            </div>
-            <div class="insight">
-                <strong>Knowledge Sharing:</strong> {metrics.get('learning_traces', 0)} learning events 
-                contributed to open-source AI training, benefiting the broader SME community.
-            </div>
-        </div>
-
-        <div class="section">
-            <h2>🏛️ Governance</h2>
-            <div class="metric-grid">
-                <div class="metric-card">
-                    <div class="metric-value">{metrics.get('human_approvals', 0)}</div>
-                    <div class="metric-label">Human Approvals</div>
-                </div>
-                <div class="metric-card">
-                    <div class="metric-value">{metrics.get('rejection_rate', 0):.1f}%</div>
-                    <div class="metric-label">Content Rejection Rate</div>
-                </div>
-                <div class="metric-card">
-                    <div class="metric-value">100%</div>
-                    <div class="metric-label">Human-in-the-Loop</div>
-                </div>
-            </div>
-            <div class="insight">
-                <strong>Oversight:</strong> All AI-generated content passes through human review 
-                before publication, ensuring brand consistency and accuracy.
-            </div>
-        </div>
-
-        <div class="footer">
-            <p>Generated by Fikanova AI Workforce | {datetime.now().strftime('%Y-%m-%d %H:%M UTC')}</p>
-            <p>This report is auto-generated for compliance and fundraising documentation.</p>
-        </div>
-    </body>
-    </html>
-    """
-
-
-def handle_report(context, databases) -> dict:
-    """
-    Generate monthly ESG report.
-    Queries ESG_Metrics and Learning_Traces for the previous month.
-    """
-    # Calculate previous month period
-    today = datetime.now()
-    first_of_month = today.replace(day=1)
-    last_month_end = first_of_month - timedelta(days=1)
-    period = last_month_end.strftime('%Y-%m')
-    
-    context.log(f"Generating ESG report for period: {period}")
-    
-    # Query ESG Metrics
-    try:
-        esg_response = databases.list_documents(
-            DATABASE_ID,
-            'ESG_Metrics',
-            [Query.equal('period', period)]
-        )
-    except Exception:
-        esg_response = {'documents': []}
-    
-    # Aggregate metrics
+    return render_reports([(period, metrics)], tenant)[0].decode()
+
+
+def report_periods(data: dict) -> list:
+    """
+    Requested closed months: 'periods' (a list) or 'period', defaulting to
+    the previous month.
+    """
+    periods = data.get('periods') or ([data['period']] if data.get('period') else [])
+    if not periods:
+        last_month_end = datetime.utcnow().replace(day=1) - timedelta(days=1)
+        return [last_month_end.strftime('%Y-%m')]
+    
+    current = datetime.utcnow().strftime('%Y-%m')
+    if len(periods) > REPORT_MAX_PERIODS:
+        raise ValueError(f"At most {REPORT_MAX_PERIODS} periods per request")
+    for period in periods:
+        if not (isinstance(period, str) and re.fullmatch(r'\d{4}-(0[1-9]|1[0-2])', period)):
+            raise ValueError(f"Invalid period '{period}' (expected YYYY-MM)")
+        if period >= current:
+            raise ValueError(f"Period {period} is not closed yet")
+    return list(dict.fromkeys(periods))
+
+
+def period_bounds(period: str) -> tuple:
+    """First instant of a YYYY-MM month and of the next one, as Appwrite datetimes."""
+    year, month = int(period[:4]), int(period[5:7])
+    following = f"{year + month // 12:04d}-{month % 12 + 1:02d}"
+    return f"{period}-01T00:00:00.000+00:00", f"{following}-01T00:00:00.000+00:00"
+
+
+def report_count_queries(period: str) -> dict:
+    """
+    The period's counts, as fan_out() queries: rows created during the month
+    (skills: deployed by its end), so a closed month's figures stay put.
+    """
+    start, end = period_bounds(period)
+    during = [Query.greater_than_equal('$createdAt', start), Query.less_than('$createdAt', end), Query.limit(1)]
+    return {
+        f"learning_traces:{period}": ('Learning_Traces', during),
+        f"approved_drafts:{period}": ('Content_Drafts', [Query.equal('status', 'approved')] + during),
+        f"open_drafts:{period}": ('Content_Drafts', [Query.equal('status', 'draft')] + during),
+        f"skills:{period}": ('Skills', [Query.less_than('$createdAt', end), Query.limit(1)]),
+    }
+
+
+def build_report_metrics(esg_totals: dict, results: dict) -> dict:
+    """
+    One period's report metrics from its ESG rollups and its counts.
+    A metric whose count failed is None rather than its default.
+    """
     metrics = {
         'hours_saved': 0,
         'token_efficiency': 85,
@@ -216,68 +953,276 @@ def handle_report(context, databases) -> dict:
         'rejection_rate': 0
     }
     
-    for doc in esg_response.get('documents', []):
-        if doc.get('metric_type') == 'hours_saved':
-            metrics['hours_saved'] += doc.get('value', 0)
-        elif doc.get('metric_type') == 'token_cost':
-            metrics['token_efficiency'] = 100 - (doc.get('value', 0) * 10)
+    # Hours add up; token cost is the latest reading
+    if 'hours_saved' in esg_totals:
+        metrics['hours_saved'] += esg_totals['hours_saved']['sum']
+    if 'token_cost' in esg_totals:
+        metrics['token_efficiency'] = 100 - ((esg_totals['token_cost']['latest'] or 0) * 10)
     
     # Estimate carbon offset: ~0.5kg CO2 per hour of compute saved
     metrics['carbon_offset_kg'] = metrics['hours_saved'] * 0.5
     
-    # Query Learning Traces count
-    try:
-        learning_response = databases.list_documents(
-            DATABASE_ID,
-            'Learning_Traces',
-            [Query.limit(1)]
-        )
-        metrics['learning_traces'] = learning_response.get('total', 0)
-    except Exception:
-        pass
-    
-    # Query Content Drafts (approved)
-    try:
-        drafts_response = databases.list_documents(
-            DATABASE_ID,
-            'Content_Drafts',
-            [Query.equal('status', 'approved'), Query.limit(1)]
-        )
+    # Learning Traces count
+    learning_response = results['learning_traces']
+    metrics['learning_traces'] = None if failed(learning_response) else learning_response.get('total', 0)
+    
+    # Content Drafts (approved); the rejection rate needs both draft counts
+    drafts_response = results['approved_drafts']
+    rejected_response = results['open_drafts']
+    if failed(drafts_response):
+        metrics['content_pieces'] = metrics['human_approvals'] = metrics['rejection_rate'] = None
+    else:
         metrics['content_pieces'] = drafts_response.get('total', 0)
         metrics['human_approvals'] = drafts_response.get('total', 0)
         
-        # Calculate rejection rate
-        rejected_response = databases.list_documents(
-            DATABASE_ID,
-            'Content_Drafts',
-            [Query.equal('status', 'draft'), Query.limit(1)]
-        )
-        total_drafts = metrics['content_pieces'] + rejected_response.get('total', 0)
-        metrics['rejection_rate'] = (rejected_response.get('total', 0) / max(total_drafts, 1)) * 100
-    except Exception:
-        pass
-    
-    # Query Skills deployed
+        if failed(rejected_response):
+            metrics['rejection_rate'] = None
+        else:
+            total_drafts = metrics['content_pieces'] + rejected_response.get('total', 0)
+            metrics['rejection_rate'] = (rejected_response.get('total', 0) / max(total_drafts, 1)) * 100
+    
+    # Skills deployed
+    skills_response = results['skills']
+    metrics['skills_deployed'] = None if failed(skills_response) else skills_response.get('total', 0)
+    
+    return metrics
+
+
+def handle_report(context, databases, data: dict = None, formats: list = None) -> dict:
+    """
+    Generate monthly ESG reports.
+    Defaults to the previous month; 'periods' renders several closed months
+    in one batch, and 'tenant' picks a branded template variant. `formats`
+    limits the stored artifacts to those (a download needs only its own).
+    """
+    data = data or {}
+    periods = report_periods(data)
+    tenant = report_tenant(data.get('tenant'))
+    
+    context.log(f"Generating ESG report for period(s): {', '.join(periods)}")
+    
+    # Each period's ESG rollups and counts, fetched concurrently
+    ensure_rollups(databases, context, 'ESG_Metrics')
+    queries = {}
+    for period in periods:
+        queries[f"esg_metrics:{period}"] = (
+            lambda period=period: rollup_totals(databases, 'ESG_Metrics', 'period', bucket=period),)
+        queries.update(report_count_queries(period))
+    results, timings = fan_out(databases, queries)
+    
+    errors = {name: str(response) for name, response in results.items() if failed(response)}
+    reports = []
+    for period in periods:
+        esg_totals = results[f"esg_metrics:{period}"]
+        counts = {name.split(':')[0]: results[name] for name in report_count_queries(period)}
+        report = {'period': period, 'metrics': build_report_metrics({} if failed(esg_totals) else esg_totals, counts)}
+        unavailable = [name for name in errors if name.endswith(f":{period}")]
+        if unavailable:
+            # Never store (or replace a stored report with) one rendered from missing figures
+            report['artifacts_error'] = f"Not stored: {', '.join(unavailable)} unavailable"
+        else:
+            totals = {name: response.get('total', 0) for name, response in counts.items()}
+            report['content_hash'] = report_digest(period, {'esg': esg_totals, 'counts': totals}, tenant)
+        reports.append(report)
+    
+    # HTML / PDF live in the esg-reports bucket; only changed inputs render
+    storable = [report for report in reports if 'content_hash' in report]
     try:
-        skills_response = databases.list_documents(
-            DATABASE_ID,
-            'Skills',
-            [Query.limit(1)]
-        )
-        metrics['skills_deployed'] = skills_response.get('total', 0)
-    except Exception:
-        pass
-    
-    # Generate HTML report
-    html_content = generate_report_html(metrics, period)
+        for report, stored in zip(storable, store_reports(context, storable, tenant, formats) if storable else []):
+            report.update(stored)
+    except Exception as e:
+        context.log(f"Report storage failed: {e}")
+        for report in storable:
+            report['artifacts_error'] = str(e)
     
-    return {
-        'status': 'success',
-        'period': period,
-        'metrics': metrics,
-        'html_preview': html_content[:500] + '...',
-        'html_full': html_content
+    status = {'status': 'partial', 'errors': errors} if errors else {'status': 'success'}
+    if len(reports) == 1:
+        return {**status, **reports[0], 'tenant': tenant, 'query_timings': timings}
+    return {**status, 'tenant': tenant, 'reports': reports, 'query_timings': timings}
+
+
+# ============================================================================
+# REPORT ARTIFACTS (content-addressed HTML / PDF in the esg-reports bucket)
+# ============================================================================
+
+def _pdf_text(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def generate_report_pdf(metrics: dict, period: str, tenant: str = None) -> bytes:
+    """
+    One-page PDF of the report's figures, written directly so the function
+    needs no PDF library. The styled version is the HTML artifact.
+    """
+    brand = report_brand(tenant)['name']
+    lines = [
+        ('F2', 22, f"{brand} ESG Report"),
+        ('F1', 11, 'Environmental, Social & Governance Metrics'),
+        ('F1', 11, f"Period: {period}"),
+        None,
+        ('F2', 14, 'Environmental Impact'),
+        ('F1', 11, f"Hours saved by AI: {metrics.get('hours_saved', 0):.1f}"),
+        ('F1', 11, f"kg CO2 reduced: {metrics.get('carbon_offset_kg', 0):.2f}"),
+        ('F1', 11, f"Token efficiency: {metrics.get('token_efficiency', 0):.0f}%"),
+        ('F1', 11, f"Compute cost reduction: {metrics.get('cost_savings', 0):.0f}%"),
+        None,
+        ('F2', 14, 'Social Impact'),
+        ('F1', 11, f"Content pieces generated: {metrics.get('content_pieces', 0)}"),
+        ('F1', 11, f"AI learning events: {metrics.get('learning_traces', 0)}"),
+        ('F1', 11, f"Skills deployed (free): {metrics.get('skills_deployed', 0)}"),
+        None,
+        ('F2', 14, 'Governance'),
+        ('F1', 11, f"Human approvals: {metrics.get('human_approvals', 0)}"),
+        ('F1', 11, f"Content rejection rate: {metrics.get('rejection_rate', 0):.1f}%"),
+        ('F1', 11, 'Human-in-the-loop: 100%'),
+        None,
+        ('F1', 9, f"Generated by {brand} AI Workforce | {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}"),
+    ]
+    
+    ops, y = [], 780
+    for line in lines:
+        if line is None:
+            y -= 14
+            continue
+        font, size, text = line
+        ops.append(f"BT /{font} {size} Tf 56 {y} Td ({_pdf_text(text)}) Tj ET")
+        y -= int(size * 1.7)
+    stream = '\n'.join(ops).encode('latin-1', 'replace')
+    
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+        b"/Resources << /Font << /F1 4 0 R /F2 5 0 R >> >> /Contents 6 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+    ]
+    pdf, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+# format -> (mime type, batch renderer: ([(period, metrics)], tenant) -> [bytes])
+REPORT_FORMATS = {
+    'html': ('text/html; charset=utf-8', render_reports),
+    'pdf': ('application/pdf', lambda reports, tenant: [generate_report_pdf(m, p, tenant) for p, m in reports]),
+}
+
+# Stored file ID -> digest it was rendered from, as seen by this instance
+_stored_reports = {}
+
+
+def report_digest(period: str, inputs: dict, tenant: str = None) -> str:
+    """
+    Hash of what a period's stored report is rendered from: its inputs
+    ({'esg': rollup totals, 'counts': {name: total}}, all scoped to the
+    month) and the template.
+    """
+    # The bound template's fingerprint covers both the template file and the brand
+    payload = {'period': period, 'inputs': inputs, 'version': REPORT_RENDER_VERSION,
+               'template': get_report_template(tenant).fingerprint}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def report_file_id(period: str, tenant: str, fmt: str) -> str:
+    # Tenant keys can be longer than a 36-character file ID allows
+    return f"{fmt}-{period}-{hashlib.sha1(tenant.encode()).hexdigest()[:16]}"
+
+
+def report_file_name(period: str, digest: str, fmt: str) -> str:
+    return f"esg-report-{period}.{digest[:20]}.{fmt}"
+
+
+def report_file_url(file_id: str, mode: str = 'view') -> str:
+    return f"{APPWRITE_ENDPOINT}/storage/buckets/{STORAGE_BUCKET_ID}/files/{file_id}/{mode}?project={APPWRITE_PROJECT_ID}"
+
+
+def _stored_digest(storage, file_id: str):
+    """The digest in the stored file's name ('' if it has none), or None if there is no file."""
+    if file_id in _stored_reports:
+        return _stored_reports[file_id]
+    try:
+        file = storage.get_file(STORAGE_BUCKET_ID, file_id)
+    except Exception as e:
+        if getattr(e, 'code', None) == 404:
+            return None
+        raise
+    parts = (file.get('name') or '').rsplit('.', 2)
+    _stored_reports[file_id] = parts[1] if len(parts) == 3 else ''
+    return _stored_reports[file_id]
+
+
+def store_reports(context, reports: list, tenant: str = None, formats: list = None) -> list:
+    """
+    Make sure the HTML and PDF for each {'period', 'metrics', 'content_hash'}
+    report are in the bucket, rendering (as one batch per format) and
+    uploading only those whose stored file is missing or was rendered from
+    other inputs; the superseded file is deleted first. A repeat request
+    costs one get_file per file (nothing on a warm instance). `formats`
+    limits the work to those formats.
+    """
+    from appwrite.input_file import InputFile
+    storage = get_storage()
+    stored = [{'artifacts': {}, 'rendered': []} for _ in reports]
+    
+    for fmt in formats or REPORT_FORMATS:
+        mime_type, render = REPORT_FORMATS[fmt]
+        file_ids = [report_file_id(report['period'], tenant, fmt) for report in reports]
+        current = [_stored_digest(storage, file_id) for file_id in file_ids]
+        missing = [i for i, report in enumerate(reports) if current[i] != report['content_hash'][:20]]
+        contents = render([(reports[i]['period'], reports[i]['metrics']) for i in missing], tenant) if missing else []
+        for i, content in zip(missing, contents):
+            file_id, digest = file_ids[i], reports[i]['content_hash']
+            if current[i] is not None:
+                try:
+                    storage.delete_file(STORAGE_BUCKET_ID, file_id)
+                except Exception as e:
+                    if getattr(e, 'code', None) != 404:
+                        raise
+                context.log(f"Superseded {fmt} report {file_id} (rendered from {current[i] or 'unknown inputs'})")
+            _stored_reports.pop(file_id, None)
+            try:
+                storage.create_file(STORAGE_BUCKET_ID, file_id, InputFile.from_bytes(
+                    content, filename=report_file_name(reports[i]['period'], digest, fmt),
+                    mime_type=mime_type.split(';')[0]))
+            except Exception as e:
+                # 409: another instance stored it first; check its inputs next time
+                if getattr(e, 'code', None) != 409:
+                    raise
+            else:
+                _stored_reports[file_id] = digest[:20]
+            stored[i]['rendered'].append(fmt)
+            context.log(f"Stored {fmt} report {file_id} ({len(content)} bytes)")
+        for i, file_id in enumerate(file_ids):
+            stored[i]['artifacts'][fmt] = {
+                'file_id': file_id,
+                'view_url': report_file_url(file_id),
+                'download_url': report_file_url(file_id, 'download'),
+            }
+    
+    return stored
+
+
+def send_report_file(context, report: dict, fmt: str):
+    """Return one stored artifact through the function (the bucket itself is private)."""
+    if fmt not in report.get('artifacts', {}):
+        return context.res.json({'error': report.get('artifacts_error', f"No {fmt} artifact")}, 502)
+    content = get_storage().get_file_download(STORAGE_BUCKET_ID, report['artifacts'][fmt]['file_id'])
+    headers = {
+        'content-type': REPORT_FORMATS[fmt][0],
+        'content-disposition': f"inline; filename=\"esg-report-{report['period']}.{fmt}\"",
+        'ETag': f'"{report["content_hash"][:20]}"',
     }
+    if fmt == 'html':
+        return context.res.send(content.decode(), 200, headers)
+    return context.res.binary(content, 200, headers)
 
 
 # ============================================================================
@@ -297,35 +1242,20 @@ def handle_monitor(context, databases) -> dict:
         'checks': {}
     }
     
-    # Check Communications collection
-    try:
-        comms = databases.list_documents(
-            DATABASE_ID,
-            'Communications',
-            [Query.limit(1)]
-        )
-        status['checks']['communications'] = {
-            'status': 'ok',
-            'total': comms.get('total', 0)
-        }
-    except Exception as e:
-        status['checks']['communications'] = {'status': 'error', 'error': str(e)}
-        status['status'] = 'degraded'
-    
-    # Check Content_Drafts collection
-    try:
-        drafts = databases.list_documents(
-            DATABASE_ID,
-            'Content_Drafts',
-            [Query.limit(1)]
-        )
-        status['checks']['content_drafts'] = {
-            'status': 'ok',
-            'total': drafts.get('total', 0)
-        }
-    except Exception as e:
-        status['checks']['content_drafts'] = {'status': 'error', 'error': str(e)}
-        status['status'] = 'degraded'
+    # Check the Communications and Content_Drafts collections concurrently
+    results, status['query_timings'] = fan_out(databases, {
+        'communications': ('Communications', [Query.limit(1)]),
+        'content_drafts': ('Content_Drafts', [Query.limit(1)]),
+    })
+    for check, response in results.items():
+        if failed(response):
+            status['checks'][check] = {'status': 'error', 'error': str(response)}
+            status['status'] = 'degraded'
+        else:
+            status['checks'][check] = {
+                'status': 'ok',
+                'total': response.get('total', 0)
+            }
     
     # Overall health score
     ok_count = sum(1 for c in status['checks'].values() if c.get('status') == 'ok')
@@ -350,35 +1280,31 @@ def handle_metrics(context, databases) -> dict:
         'recent': {}
     }
     
-    # Total communications
-    try:
-        comms = databases.list_documents(DATABASE_ID, 'Communications', [Query.limit(1)])
-        metrics['totals']['communications'] = comms.get('total', 0)
-    except Exception:
-        metrics['totals']['communications'] = 0
+    # The last 24 hourly buckets, current hour included
+    first_hour = (datetime.utcnow() - timedelta(hours=23)).strftime('%Y-%m-%dT%H')
+    ensure_rollups(databases, context, 'Communications')
+    results, timings = fan_out(databases, {
+        'communications': ('Communications', [Query.limit(1)]),
+        'content_drafts': ('Content_Drafts', [Query.limit(1)]),
+        'communications_24h': (lambda: rollup_totals(databases, 'Communications', 'hour', since=first_hour),),
+    })
     
-    # Total content pieces
-    try:
-        drafts = databases.list_documents(DATABASE_ID, 'Content_Drafts', [Query.limit(1)])
-        metrics['totals']['content_drafts'] = drafts.get('total', 0)
-    except Exception:
-        metrics['totals']['content_drafts'] = 0
+    # Totals; a failed count is None (unknown), never 0
+    for name in ('communications', 'content_drafts'):
+        metrics['totals'][name] = None if failed(results[name]) else results[name].get('total', 0)
     
-    # Recent activity (last 24h)
-    try:
-        yesterday = (datetime.utcnow() - timedelta(days=1)).isoformat()
-        recent_comms = databases.list_documents(
-            DATABASE_ID,
-            'Communications',
-            [Query.greaterThan('created_at', yesterday), Query.limit(100)]
-        )
-        metrics['recent']['communications_24h'] = len(recent_comms.get('documents', []))
-    except Exception:
-        metrics['recent']['communications_24h'] = 0
+    # Recent activity (last 24h), by channel
+    recent_comms = results['communications_24h']
+    by_channel = None if failed(recent_comms) else {channel: t['count'] for channel, t in recent_comms.items()}
+    metrics['recent']['communications_24h'] = None if by_channel is None else sum(by_channel.values())
+    metrics['recent']['communications_24h_by_channel'] = by_channel
     
+    errors = {name: str(response) for name, response in results.items() if failed(response)}
     return {
-        'status': 'success',
-        'metrics': metrics
+        'status': 'partial' if errors else 'success',
+        'metrics': metrics,
+        **({'errors': errors} if errors else {}),
+        'query_timings': timings
     }
 
 
@@ -391,19 +1317,19 @@ def main(context):
     Unified Impact Monitor - Entry Point
     
     Parameters:
-      - action: 'monitor' (default), 'report', or 'metrics'
+      - action: 'monitor' (default), 'report', 'metrics' or 'rollup'
+      - fresh: bypass the monitor/metrics response cache
+      - download: 'html' or 'pdf' to receive a single period's stored file
+      - period / periods, tenant: report month(s) and branded variant
+      - if_none_match: ETag to revalidate (or the If-None-Match header)
     
     Usage:
       POST /v1/functions/impact-monitor/executions
       Body: {"action": "report"}
     """
     try:
-        # Initialize Appwrite
-        client = Client()
-        client.set_endpoint(APPWRITE_ENDPOINT)
-        client.set_project(APPWRITE_PROJECT_ID)
-        client.set_key(APPWRITE_API_KEY)
-        databases = Databases(client)
+        # Reuse the warm instance's Appwrite client
+        databases = get_databases()
         
         # Parse request
         req = context.req
@@ -420,14 +1346,33 @@ def main(context):
         context.log(f"Impact Monitor: handling action '{action}'")
         
         if action == 'report':
-            result = handle_report(context, databases)
+            download = data.get('download')
+            if download is not None and download not in REPORT_FORMATS:
+                raise ValueError(f"Unknown download format '{download}' (expected {' or '.join(REPORT_FORMATS)})")
+            if download and len(report_periods(data)) > 1:
+                raise ValueError("download returns one report: request a single period")
+            if download and download != 'html' and not hasattr(context.res, 'binary'):
+                return context.res.json({'error': f"This runtime cannot return binary responses, so no {download} download"}, 501)
+            # A download renders and uploads its own format only if the stored file is missing or stale
+            result = handle_report(context, databases, data, [download] if download else None)
+            if download:
+                return send_report_file(context, result, data['download'])
         elif action == 'metrics':
+            if response_cache.cacheable('metrics') and not data.get('fresh'):
+                return cached_response(context, 'metrics', handle_metrics, databases, data)
             result = handle_metrics(context, databases)
+        elif action == 'rollup':
+            result = handle_rollup(context, databases)
+            response_cache.invalidate('metrics')
         else:  # Default: monitor
+            if response_cache.cacheable('monitor') and not data.get('fresh'):
+                return cached_response(context, 'monitor', handle_monitor, databases, data)
             result = handle_monitor(context, databases)
         
         return context.res.json(result)
         
+    except ValueError as e:
+        return context.res.json({'error': str(e)}, 400)
     except Exception as e:
         context.log(f"Error in impact-monitor: {str(e)}")
         return context.res.json({'error': str(e)}, 500)
@@ -0,0 +1,199 @@
+"""
+Shared fixtures: main.py loaded once, and an in-memory stand-in for the
+Appwrite Databases service that understands the queries main.py sends.
+"""
+import importlib.util
+import itertools
+import json
+import os
+
+import pytest
+
+pytest.importorskip('appwrite')
+
+FUNCTION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class NotFound(Exception):
+    code = 404
+
+
+class Conflict(Exception):
+    code = 409
+
+
+class MemoryDatabases:
+    """
+    Collections as dicts in insertion order. Sorting is stable, so rows with
+    equal sort keys come back in insertion order, like Appwrite's internal
+    sequence (not by $id).
+    """
+
+    def __init__(self):
+        self.collections = {}
+        self.calls = []
+        self._sequence = itertools.count()
+
+    def add(self, collection_id: str, document_id: str, data: dict):
+        self.collections.setdefault(collection_id, {})[document_id] = dict(data, **{'$id': document_id})
+
+    def create_document(self, database_id, collection_id, document_id, data, permissions=None):
+        self.calls.append(('create', collection_id))
+        if document_id in self.collections.get(collection_id, {}):
+            raise Conflict(document_id)
+        self.add(collection_id, document_id, data)
+        return self.collections[collection_id][document_id]
+
+    def update_document(self, database_id, collection_id, document_id, data=None, permissions=None):
+        self.calls.append(('update', collection_id))
+        if document_id not in self.collections.get(collection_id, {}):
+            raise NotFound(document_id)
+        self.collections[collection_id][document_id].update(data or {})
+        return self.collections[collection_id][document_id]
+
+    def delete_document(self, database_id, collection_id, document_id):
+        self.calls.append(('delete', collection_id))
+        if self.collections.get(collection_id, {}).pop(document_id, None) is None:
+            raise NotFound(document_id)
+        return {}
+
+    def get_document(self, database_id, collection_id, document_id, queries=None):
+        self.calls.append(('get', collection_id))
+        if document_id not in self.collections.get(collection_id, {}):
+            raise NotFound(document_id)
+        return self.collections[collection_id][document_id]
+
+    def list_documents(self, database_id, collection_id, queries=None):
+        self.calls.append(('list', collection_id))
+        docs = list(self.collections.get(collection_id, {}).values())
+        limit, cursor, select = 25, None, None
+        for raw in queries or []:
+            query = json.loads(raw)
+            method = query['method'].replace('_', '').lower()
+            attribute, values = query.get('attribute'), query.get('values') or []
+            if len(values) == 1 and isinstance(values[0], list):
+                values = values[0]
+            argument = values[0] if values else attribute
+            if method == 'limit':
+                limit = argument
+            elif method == 'cursorafter':
+                cursor = argument
+            elif method == 'select':
+                select = values or attribute
+            elif method == 'orderasc':
+                docs.sort(key=lambda d: str(d.get(attribute)))
+            elif method == 'equal':
+                docs = [d for d in docs if d.get(attribute) in values]
+            elif method in ('greaterthan', 'greaterthanequal', 'lessthan', 'lessthanequal'):
+                compare = {'greaterthan': str.__gt__, 'greaterthanequal': str.__ge__,
+                           'lessthan': str.__lt__, 'lessthanequal': str.__le__}[method]
+                docs = [d for d in docs if d.get(attribute) is not None and compare(str(d[attribute]), str(argument))]
+        total = len(docs)
+        if cursor is not None:
+            ids = [d['$id'] for d in docs]
+            if cursor not in ids:
+                raise NotFound(cursor)
+            docs = docs[ids.index(cursor) + 1:]
+        docs = docs[:limit]
+        if select:
+            docs = [{k: d[k] for k in set(select) | {'$id'} if k in d} for d in docs]
+        return {'total': total, 'documents': docs}
+
+
+class MemoryStorage:
+    """Bucket files by id, keeping the name and bytes they were uploaded with."""
+
+    def __init__(self):
+        self.files = {}
+        self.calls = []
+
+    def create_file(self, bucket_id, file_id, file, permissions=None):
+        self.calls.append(('create', file_id))
+        if file_id in self.files:
+            raise Conflict(file_id)
+        self.files[file_id] = {'$id': file_id, 'name': file.filename, 'data': file.data}
+        return self.files[file_id]
+
+    def get_file(self, bucket_id, file_id):
+        self.calls.append(('get', file_id))
+        if file_id not in self.files:
+            raise NotFound(file_id)
+        return {k: v for k, v in self.files[file_id].items() if k != 'data'}
+
+    def delete_file(self, bucket_id, file_id):
+        self.calls.append(('delete', file_id))
+        if self.files.pop(file_id, None) is None:
+            raise NotFound(file_id)
+        return {}
+
+    def get_file_download(self, bucket_id, file_id):
+        return self.files[file_id]['data']
+
+
+class Upload:
+    """What main.py hands create_file, in place of appwrite.input_file.InputFile."""
+
+    def __init__(self, data, filename=None, mime_type=None):
+        self.data, self.filename, self.mime_type = data, filename, mime_type
+
+    from_bytes = classmethod(lambda cls, data, filename=None, mime_type=None: cls(data, filename, mime_type))
+
+
+class Context:
+    def __init__(self, body: dict = None, headers: dict = None):
+        self.req = type('Request', (), {'body': json.dumps(body or {}), 'headers': headers or {}, 'method': 'POST'})()
+        self.res = self
+        self.logs = []
+
+    def json(self, data, status: int = 200, headers: dict = None):
+        return {'status': status, 'body': data, 'headers': headers or {}}
+
+    def send(self, body, status: int = 200, headers: dict = None):
+        return {'status': status, 'raw': body, 'headers': headers or {}}
+
+    def log(self, message):
+        self.logs.append(message)
+
+    def error(self, message):
+        self.logs.append(message)
+
+
+@pytest.fixture
+def impact(monkeypatch):
+    """A fresh copy of main.py, so module-level caches don't leak between tests."""
+    monkeypatch.setenv('IMPACT_PAGE_SIZE', '7')
+    spec = importlib.util.spec_from_file_location('impact_monitor', os.path.join(FUNCTION_DIR, 'main.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, 'ROLLUP_LAG_S', 0)
+    return module
+
+
+@pytest.fixture
+def databases():
+    return MemoryDatabases()
+
+
+@pytest.fixture
+def storage(impact, monkeypatch):
+    memory = MemoryStorage()
+    monkeypatch.setattr(impact, 'get_storage', lambda: memory)
+    monkeypatch.setattr('appwrite.input_file.InputFile', Upload)
+    return memory
+
+
+class BinaryContext(Context):
+    """A runtime whose response object can return bytes."""
+
+    def binary(self, body, status: int = 200, headers: dict = None):
+        return {'status': status, 'raw': body, 'headers': headers or {}}
+
+
+@pytest.fixture
+def context():
+    return Context()
+
+
+@pytest.fixture
+def binary_context():
+    return BinaryContext()
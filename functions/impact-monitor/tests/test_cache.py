@@ -0,0 +1,51 @@
+import time
+
+
+def serve(impact, context, calls, fail=False):
+    def handler(build_context, databases):
+        build_context.log('building')
+        calls.append(build_context)
+        if fail:
+            raise RuntimeError('database unavailable')
+        return {'status': 'success', 'count': len(calls)}
+
+    return impact.cached_response(context, 'monitor', handler, None, {})
+
+
+def wait_for_refresh(impact):
+    for _ in range(100):
+        if not impact.response_cache.refreshing:
+            return
+        time.sleep(0.01)
+
+
+def expire(impact):
+    entry = impact.response_cache.entries['monitor']
+    entry['stored'] -= impact.response_cache.ttls['monitor'] + 0.1
+
+
+def test_background_rebuilds_log_away_from_the_request(impact, context):
+    calls = []
+    serve(impact, context, calls)
+    expire(impact)
+    later = type(context)()
+    response = serve(impact, later, calls)
+    wait_for_refresh(impact)
+
+    assert response['headers']['X-Cache'] == 'STALE'
+    assert calls == [context, impact.response_cache.background_log]
+    assert later.logs == []
+    assert impact.response_cache.background_log.lines[-1].endswith('building')
+
+
+def test_failed_background_rebuilds_are_recorded(impact, context):
+    calls = []
+    serve(impact, context, calls)
+    expire(impact)
+    serve(impact, context, calls, fail=True)
+    wait_for_refresh(impact)
+    response = serve(impact, context, calls, fail=True)
+    wait_for_refresh(impact)
+
+    assert response['body']['cache']['refresh_error']['error'] == 'database unavailable'
+    assert response['body']['count'] == 1
@@ -0,0 +1,77 @@
+import threading
+
+
+class SlowDatabases:
+    """list_documents blocks until released; the Learning_Traces collection always fails."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.release = threading.Event()
+        self.started = []
+
+    def list_documents(self, database_id, collection_id, queries=None):
+        self.started.append(collection_id)
+        if collection_id == 'Slow':
+            self.release.wait(5)
+        if collection_id == 'Learning_Traces':
+            raise RuntimeError('collection unavailable')
+        return self.inner.list_documents(database_id, collection_id, queries)
+
+
+def test_queued_queries_do_not_start_after_their_deadline(impact, databases, monkeypatch):
+    monkeypatch.setattr(impact, 'QUERY_WORKERS', 1)
+    slow = SlowDatabases(databases)
+    # The slow query frees the only worker after the queued one's deadline, but before its own
+    threading.Timer(0.2, slow.release.set).start()
+    results, timings = impact.fan_out(slow, {
+        'slow': ('Slow', [], 1),
+        'queued': ('Skills', [], 0.1),
+    })
+    impact.get_executor().submit(lambda: None).result(1)
+
+    assert results['slow']['total'] == 0
+    assert isinstance(results['queued'], TimeoutError)
+    assert timings['queries']['queued']['status'] == 'timeout'
+    assert slow.started == ['Slow']
+
+
+def test_scans_stop_at_their_deadline_on_their_own_pool(impact, databases, monkeypatch):
+    for i in range(30):
+        databases.add('Skills', f"s{i:03d}", {})
+    pages = []
+    slow = SlowDatabases(databases)
+
+    def scan():
+        for page in impact.iter_pages(slow, 'Skills', page_size=5):
+            pages.append(page)
+            slow.release.wait(0.05)
+        return len(pages)
+
+    monkeypatch.setattr(impact, 'QUERY_WORKERS', 1)
+    results, _ = impact.fan_out(slow, {'scan': (scan, 0.08), 'count': ('Skills', [])})
+    impact.get_executor('scan').submit(lambda: None).result(1)
+
+    assert isinstance(results['scan'], TimeoutError)
+    assert results['count']['total'] == 30
+    assert len(pages) < 6
+
+
+def test_failed_counts_are_reported_not_zeroed(impact, databases, context, monkeypatch):
+    monkeypatch.setattr(impact, 'ensure_rollups', lambda *args: None)
+    databases.add('Content_Drafts', 'd1', {'$createdAt': '2025-01-10T08:00:00.000+00:00', 'status': 'approved'})
+    slow = SlowDatabases(databases)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError('rollups unavailable')
+
+    monkeypatch.setattr(impact, 'rollup_totals', broken)
+    metrics = impact.handle_metrics(context, slow)
+    report = impact.handle_report(context, slow, {'period': '2025-01'})
+
+    assert metrics['status'] == 'partial'
+    assert metrics['metrics']['totals']['content_drafts'] == 1
+    assert metrics['metrics']['recent']['communications_24h'] is None
+    assert report['status'] == 'partial'
+    assert report['metrics']['learning_traces'] is None
+    assert report['metrics']['human_approvals'] == 1
+    assert 'content_hash' not in report and 'artifacts' not in report
@@ -0,0 +1,97 @@
+import json
+
+PERIOD = '2025-01'
+
+
+def log_esg(databases, document_id, metric_type, value, period=PERIOD):
+    logged_at = f"{period}-20T09:00:00.000+00:00"
+    databases.add('ESG_Metrics', document_id, {'$createdAt': logged_at, 'logged_at': logged_at,
+                                               'metric_type': metric_type, 'value': value, 'period': period})
+
+
+def report(impact, context, databases):
+    impact._rollups_refreshed_at.clear()
+    return impact.handle_report(context, databases, {'period': PERIOD})
+
+
+def test_digest_covers_the_period_inputs(impact):
+    inputs = {'esg': {'hours_saved': {'count': 2, 'sum': 5.0, 'latest': 3.0}}, 'counts': {'skills': 3}}
+
+    assert impact.report_digest(PERIOD, inputs) == impact.report_digest(PERIOD, json.loads(json.dumps(inputs)))
+    assert impact.report_digest(PERIOD, inputs) != impact.report_digest('2025-02', inputs)
+    assert impact.report_digest(PERIOD, inputs) != impact.report_digest(PERIOD, dict(inputs, counts={'skills': 4}))
+
+
+def test_rows_outside_the_period_do_not_rerender_it(impact, databases, storage, context):
+    log_esg(databases, 'e1', 'hours_saved', 4)
+    first = report(impact, context, databases)
+    later = '2025-03-02T08:00:00.000+00:00'
+    databases.add('Skills', 's1', {'$createdAt': later})
+    databases.add('Content_Drafts', 'd1', {'$createdAt': later, 'status': 'approved'})
+    impact._stored_reports.clear()
+    second = report(impact, context, databases)
+
+    assert first['rendered'] == ['html', 'pdf']
+    assert second['rendered'] == []
+    assert second['content_hash'] == first['content_hash']
+    assert second['metrics']['skills_deployed'] == 0
+
+
+def test_counts_in_the_period_are_part_of_the_stored_report(impact, databases, storage, context):
+    log_esg(databases, 'e1', 'hours_saved', 4)
+    first = report(impact, context, databases)
+    databases.add('Content_Drafts', 'd1', {'$createdAt': f"{PERIOD}-10T08:00:00.000+00:00", 'status': 'approved'})
+    second = report(impact, context, databases)
+
+    assert second['rendered'] == ['html', 'pdf']
+    assert second['content_hash'] != first['content_hash']
+    assert second['metrics']['human_approvals'] == 1
+    assert b'>1<' in storage.files[second['artifacts']['html']['file_id']]['data'].replace(b' ', b'')
+
+
+def test_changed_rollups_replace_the_superseded_files(impact, databases, storage, context):
+    log_esg(databases, 'e1', 'hours_saved', 4)
+    first = report(impact, context, databases)
+    log_esg(databases, 'e2', 'hours_saved', 2)
+    second = report(impact, context, databases)
+
+    assert second['rendered'] == ['html', 'pdf']
+    assert second['content_hash'] != first['content_hash']
+    assert second['artifacts']['html']['file_id'] == first['artifacts']['html']['file_id']
+    assert ('delete', first['artifacts']['pdf']['file_id']) in storage.calls
+    assert sorted(storage.files) == sorted(a['file_id'] for a in second['artifacts'].values())
+    assert storage.files[second['artifacts']['html']['file_id']]['name'].split('.')[1] == second['content_hash'][:20]
+
+
+def download(impact, databases, monkeypatch, context, body):
+    monkeypatch.setattr(impact, 'get_databases', lambda: databases)
+    context.req.body = json.dumps(dict(body, action='report'))
+    return impact.main(context)
+
+
+def test_download_takes_a_single_period(impact, databases, storage, context, monkeypatch):
+    response = download(impact, databases, monkeypatch, context, {'periods': ['2025-01', '2025-02'], 'download': 'html'})
+
+    assert response['status'] == 400
+    assert storage.calls == []
+
+
+def test_pdf_download_needs_binary_responses(impact, databases, storage, context, binary_context, monkeypatch):
+    log_esg(databases, 'e1', 'hours_saved', 4)
+    text_only = download(impact, databases, monkeypatch, context, {'period': PERIOD, 'download': 'pdf'})
+    binary = download(impact, databases, monkeypatch, binary_context, {'period': PERIOD, 'download': 'pdf'})
+
+    assert text_only['status'] == 501 and 'error' in text_only['body']
+    assert binary['status'] == 200 and binary['raw'].startswith(b'%PDF')
+
+
+def test_download_reuses_the_stored_file(impact, databases, storage, binary_context, monkeypatch):
+    log_esg(databases, 'e1', 'hours_saved', 4)
+    first = download(impact, databases, monkeypatch, binary_context, {'period': PERIOD, 'download': 'pdf'})
+    impact._stored_reports.clear()
+    storage.calls.clear()
+    second = download(impact, databases, monkeypatch, binary_context, {'period': PERIOD, 'download': 'pdf'})
+
+    assert first['raw'] == second['raw']
+    assert [file_id.split('-')[0] for file_id in storage.files] == ['pdf']
+    assert [call for call, _ in storage.calls] == ['get']
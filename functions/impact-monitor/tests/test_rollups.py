@@ -0,0 +1,138 @@
+import random
+
+import pytest
+
+NOW = '2025-01-15T10:30:00.000+00:00'
+
+
+def add_messages(databases, ids, created_at=NOW, channel='whatsapp'):
+    for document_id in ids:
+        databases.add('Communications', document_id,
+                      {'$createdAt': created_at, 'created_at': created_at, 'channel': channel})
+
+
+def hour_count(impact, databases, channel='whatsapp'):
+    totals = impact.rollup_totals(databases, 'Communications', 'hour', bucket=NOW[:13])
+    return totals.get(channel, {}).get('count', 0)
+
+
+def test_rows_sharing_a_timestamp_are_all_counted(impact, databases):
+    # Appwrite ids are not monotonic: later rows may sort below earlier ones
+    ids = [f"{random.Random(seed).getrandbits(40):012x}" for seed in range(20)]
+    add_messages(databases, ids[:10])
+    impact.refresh_rollups(databases, 'Communications')
+    add_messages(databases, ids[10:])
+    impact.refresh_rollups(databases, 'Communications')
+
+    assert hour_count(impact, databases) == 20
+
+
+def test_interrupted_run_is_not_double_counted(impact, databases, monkeypatch):
+    add_messages(databases, [f"a{i:03d}" for i in range(10)])
+    impact.refresh_rollups(databases, 'Communications')
+    add_messages(databases, [f"z{i:03d}" for i in range(5)] + [f"b{i:03d}" for i in range(5)])
+
+    # Rollups are written, then the run dies before moving the watermark
+    put_rollup = impact._put_rollup
+
+    def crash_on_watermark(db, document_id, data, exists):
+        if data.get('granularity') == 'watermark':
+            raise RuntimeError('instance stopped')
+        put_rollup(db, document_id, data, exists)
+
+    monkeypatch.setattr(impact, '_put_rollup', crash_on_watermark)
+    with pytest.raises(RuntimeError):
+        impact.refresh_rollups(databases, 'Communications')
+    monkeypatch.setattr(impact, '_put_rollup', put_rollup)
+
+    # The retry also sees rows that arrived after the crash
+    add_messages(databases, [f"c{i:03d}" for i in range(3)], channel='sms')
+    impact.refresh_rollups(databases, 'Communications')
+
+    assert hour_count(impact, databases) == 20
+    assert hour_count(impact, databases, 'sms') == 3
+
+
+def test_refresh_is_idempotent(impact, databases):
+    add_messages(databases, [f"m{i:03d}" for i in range(12)])
+    impact.refresh_rollups(databases, 'Communications')
+    result = impact.refresh_rollups(databases, 'Communications')
+
+    assert result['rows'] == 0
+    assert hour_count(impact, databases) == 12
+
+
+def test_reads_fold_a_bounded_number_of_rows(impact, databases, context, monkeypatch):
+    monkeypatch.setattr(impact, 'ROLLUP_REQUEST_MAX_ROWS', 14)
+    add_messages(databases, [f"m{i:03d}" for i in range(50)])
+    impact.ensure_rollups(databases, context, 'Communications')
+
+    assert hour_count(impact, databases) == 14
+    # Within ROLLUP_MAX_AGE_S the rollups are served as they are
+    impact.ensure_rollups(databases, context, 'Communications')
+    assert hour_count(impact, databases) == 14
+
+    impact.handle_rollup(context, databases)
+    assert hour_count(impact, databases) == 50
+
+
+def test_reads_skip_a_refresh_already_in_progress(impact, databases, context):
+    add_messages(databases, [f"m{i:03d}" for i in range(5)])
+    with impact._rollup_locks['Communications']:
+        impact.ensure_rollups(databases, context, 'Communications')
+
+    assert hour_count(impact, databases) == 0
+
+
+def test_a_run_claimed_by_another_instance_is_left_alone(impact, databases):
+    add_messages(databases, [f"m{i:03d}" for i in range(5)])
+    other = impact._claim_run(databases, 'Communications', '')
+    result = impact.refresh_rollups(databases, 'Communications')
+
+    assert result['busy'] and result['rows'] == 0
+    assert hour_count(impact, databases) == 0
+
+    impact._release_claim(databases, other)
+    impact.refresh_rollups(databases, 'Communications')
+    assert hour_count(impact, databases) == 5
+
+
+def test_an_expired_claim_is_taken_over(impact, databases, monkeypatch):
+    add_messages(databases, [f"m{i:03d}" for i in range(5)])
+    impact._claim_run(databases, 'Communications', '')
+    monkeypatch.setattr(impact, 'ROLLUP_CLAIM_TTL_S', 0)
+
+    assert impact.refresh_rollups(databases, 'Communications')['rows'] == 5
+    assert hour_count(impact, databases) == 5
+
+
+class CursorOutage:
+    """Fails every cursor-anchored read, the way a 5xx or a network error would."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.failing = True
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def list_documents(self, database_id, collection_id, queries=None):
+        if self.failing and collection_id == 'Communications' and any('cursor' in q.lower() for q in queries or []):
+            error = RuntimeError('Server Error')
+            error.code = 503
+            raise error
+        return self.inner.list_documents(database_id, collection_id, queries)
+
+
+def test_only_a_deleted_cursor_row_falls_back_to_the_timestamp(impact, databases):
+    add_messages(databases, ['b000', 'a000'])
+    impact.refresh_rollups(databases, 'Communications')
+    # Same $createdAt as the mark: a timestamp fallback would skip these
+    add_messages(databases, ['c000', '0000'])
+    outage = CursorOutage(databases)
+    with pytest.raises(RuntimeError):
+        impact.refresh_rollups(outage, 'Communications')
+    outage.failing = False
+    impact.refresh_rollups(outage, 'Communications')
+
+    assert hour_count(impact, databases) == 4
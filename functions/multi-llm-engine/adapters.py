@@ -0,0 +1,529 @@
+"""
+Provider adapters: request templates, payloads (with provider prompt
+caching) and response parsing, for both plain and streaming calls.
+"""
+import json
+import time
+import asyncio
+import hashlib
+import threading
+import http.client
+from abc import ABC, abstractmethod
+from estimation import estimate_tokens
+from metrics import metrics
+from prompts import split_prompt
+from ratelimit import EngineThrottled, rate_limiters
+from settings import (
+    ENGINES, ENGINE_MAX_CONCURRENCY, GEMINI_CACHE_MIN_TOKENS, GEMINI_CACHE_TTL_S, MAX_TOKENS,
+    RATE_LIMIT_MAX_WAIT_S,
+)
+from transport import (
+    AsyncConnectionPool, ConnectionPool, ProviderHTTPError, async_http_pool, engine_loop, http_pool,
+    offload, post_json, remaining_budget, request_scope, response_headers, response_timings,
+)
+
+
+# ============================================================================
+# PROVIDER PAYLOADS (messages + provider prompt caching)
+# ============================================================================
+
+def openai_messages(prompt) -> list:
+    system, messages = split_prompt(prompt)
+    return ([{'role': 'system', 'content': system}] if system else []) + messages
+
+
+def anthropic_payload(engine: dict, prompt, max_tokens: int) -> dict:
+    system, messages = split_prompt(prompt)
+    payload = {'model': engine['model'], 'max_tokens': max_tokens, 'messages': messages}
+    if system:
+        # Prefixes below the model's minimum (1024 tokens) are simply not cached
+        payload['system'] = [{'type': 'text', 'text': system, 'cache_control': {'type': 'ephemeral'}}]
+    return payload
+
+
+class GeminiContextCache:
+    """
+    cachedContent handles for large Gemini system prefixes, keyed by model
+    and prefix hash. Creation failures are remembered for a few minutes so
+    a misconfigured account doesn't pay an extra round trip per request.
+    The create call runs outside the lock, one per key: requests arriving
+    while it is in flight inline the prefix instead of waiting on it.
+    """
+
+    RETRY_AFTER_FAILURE_S = 300
+
+    def __init__(self):
+        self._entries = {}  # key -> (name or None, expires_at)
+        self._creating = set()
+        self._lock = threading.Lock()
+
+    def get(self, engine: dict, system: str, context=None):
+        """Name of a live cachedContent for this prefix, or None to inline it."""
+        if estimate_tokens(system, 'gemini') < GEMINI_CACHE_MIN_TOKENS:
+            return None
+        key = hashlib.sha256(f"{engine['model']}\n{system}".encode('utf-8')).hexdigest()
+        with self._lock:
+            name, expires_at = self._entries.get(key, (None, 0.0))
+            if time.time() < expires_at - 60:
+                return name
+            if key in self._creating:
+                return None
+            self._creating.add(key)
+        
+        try:
+            name = self._create(engine, system)
+            entry = (name, time.time() + GEMINI_CACHE_TTL_S)
+        except Exception as e:
+            if context:
+                context.log(f"Gemini context cache unavailable: {e}")
+            name, entry = None, (None, time.time() + self.RETRY_AFTER_FAILURE_S)
+        with self._lock:
+            self._entries[key] = entry
+            self._creating.discard(key)
+        return name
+
+    @staticmethod
+    def _create(engine: dict, system: str) -> str:
+        url = f"{engine['url'].split('/models/')[0]}/cachedContents?key={engine['key']}"
+        payload = {
+            'model': f"models/{engine['model']}",
+            'systemInstruction': {'parts': [{'text': system}]},
+            'ttl': f"{GEMINI_CACHE_TTL_S}s"
+        }
+        data, _ = post_json(url, payload, {'Content-Type': 'application/json'}, timeout=30)
+        return data['name']
+
+
+gemini_context_cache = GeminiContextCache()
+
+
+def gemini_payload(engine: dict, prompt, max_tokens: int, context=None) -> dict:
+    system, messages = split_prompt(prompt)
+    payload = {
+        'contents': [
+            {'role': 'model' if m['role'] == 'assistant' else 'user', 'parts': [{'text': m['content']}]}
+            for m in messages
+        ],
+        'generationConfig': {'maxOutputTokens': max_tokens}
+    }
+    if system:
+        cached = gemini_context_cache.get(engine, system, context)
+        if cached:
+            payload['cachedContent'] = cached
+        else:
+            payload['systemInstruction'] = {'parts': [{'text': system}]}
+    return payload
+
+
+# ============================================================================
+# PROVIDER ADAPTERS
+# ============================================================================
+
+# Each engine 'type' maps to a ProviderAdapter. An adapter knows the
+# provider's headers, payload shape and response format; everything about
+# a request that doesn't depend on the prompt (URL, pool key, the encoded
+# request line and headers, static payload fields) is compiled once per
+# engine into a RequestTemplate. New OpenAI-compatible servers (vLLM,
+# Ollama, LM Studio...) need only an LLM_ENGINES entry, no code.
+
+class ProviderAdapter(ABC):
+    """
+    Base adapter: JSON over POST with no auth. Subclasses fill in the
+    provider specifics; one missing payload/parse/stream can't be
+    instantiated, so it fails at registration rather than on first use.
+    """
+    
+    timeout = 30
+    requires_key = True
+    
+    def headers(self, engine: dict) -> dict:
+        return {'Content-Type': 'application/json'}
+    
+    def static_payload(self, engine: dict) -> dict:
+        """Payload fields that are the same for every request to this engine."""
+        return {}
+    
+    def stream_url(self, engine: dict) -> str:
+        return engine['url']
+    
+    @abstractmethod
+    def payload(self, engine: dict, prompt, max_tokens: int, context) -> dict:
+        """The per-request payload fields."""
+    
+    async def payload_async(self, engine: dict, prompt, max_tokens: int, context) -> dict:
+        return self.payload(engine, prompt, max_tokens, context)
+    
+    @abstractmethod
+    def parse(self, data: dict) -> dict:
+        """{'text', 'usage', 'tokens'} from a decoded response."""
+    
+    @abstractmethod
+    def stream(self, template, payload: dict):
+        """Generator of normalized stream chunks (see STREAMING)."""
+
+
+class OpenAIAdapter(ProviderAdapter):
+    """OpenAI chat completions (OpenAI, Grok)."""
+    
+    def headers(self, engine: dict) -> dict:
+        return {'Authorization': f"Bearer {engine['key']}", 'Content-Type': 'application/json'}
+    
+    def static_payload(self, engine: dict) -> dict:
+        return {'model': engine['model']}
+    
+    def payload(self, engine: dict, prompt, max_tokens: int, context) -> dict:
+        return {'messages': openai_messages(prompt), 'max_tokens': max_tokens}
+    
+    def parse(self, data: dict) -> dict:
+        usage = data.get('usage') or {}
+        return {
+            'text': data['choices'][0]['message']['content'],
+            'usage': usage,
+            'tokens': usage.get('total_tokens', 0)
+        }
+    
+    def stream(self, template, payload: dict):
+        return stream_openai_compatible(template, payload)
+
+
+class OpenRouterAdapter(OpenAIAdapter):
+    """OpenRouter (Qwen, Mistral, DeepSeek, Llama, Gemma): OpenAI format plus attribution headers."""
+    
+    timeout = 60
+    
+    def headers(self, engine: dict) -> dict:
+        return dict(super().headers(engine), **{
+            'HTTP-Referer': 'https://fikanova.com',
+            'X-Title': 'Fikanova OS'
+        })
+
+
+class LocalOpenAIAdapter(OpenAIAdapter):
+    """Self-hosted OpenAI-compatible servers (vLLM, Ollama's /v1): the key is optional."""
+    
+    timeout = 120
+    requires_key = False
+    
+    def headers(self, engine: dict) -> dict:
+        if engine.get('key'):
+            return super().headers(engine)
+        return {'Content-Type': 'application/json'}
+
+
+class AnthropicAdapter(ProviderAdapter):
+    """Anthropic Messages API."""
+    
+    def headers(self, engine: dict) -> dict:
+        return {
+            'x-api-key': engine['key'],
+            'anthropic-version': '2023-06-01',
+            'Content-Type': 'application/json'
+        }
+    
+    def payload(self, engine: dict, prompt, max_tokens: int, context) -> dict:
+        return anthropic_payload(engine, prompt, max_tokens)
+    
+    def parse(self, data: dict) -> dict:
+        usage = data.get('usage') or {}
+        # input_tokens excludes the prompt-cache reads and writes
+        input_tokens = (usage.get('input_tokens', 0) + (usage.get('cache_creation_input_tokens') or 0)
+                        + (usage.get('cache_read_input_tokens') or 0))
+        return {
+            'text': data['content'][0]['text'],
+            'usage': usage,
+            'tokens': input_tokens + usage.get('output_tokens', 0)
+        }
+    
+    def stream(self, template, payload: dict):
+        return stream_anthropic(template, payload)
+
+
+class GeminiAdapter(ProviderAdapter):
+    """Google Gemini generateContent (the key rides in the URL)."""
+    
+    def stream_url(self, engine: dict) -> str:
+        return engine['url'].replace(':generateContent?', ':streamGenerateContent?alt=sse&')
+    
+    def payload(self, engine: dict, prompt, max_tokens: int, context) -> dict:
+        return gemini_payload(engine, prompt, max_tokens, context)
+    
+    async def payload_async(self, engine: dict, prompt, max_tokens: int, context) -> dict:
+        if split_prompt(prompt)[0]:
+            # May have to create a cachedContent first (a blocking round trip)
+            return await offload(gemini_payload, engine, prompt, max_tokens, context)
+        return gemini_payload(engine, prompt, max_tokens, context)
+    
+    def parse(self, data: dict) -> dict:
+        usage = data.get('usageMetadata') or {}
+        return {
+            'text': data['candidates'][0]['content']['parts'][0]['text'],
+            'usage': usage,
+            'tokens': usage.get('totalTokenCount', 0)
+        }
+    
+    def stream(self, template, payload: dict):
+        return stream_gemini(template, payload)
+
+
+ADAPTERS = {}
+
+
+def register_adapter(engine_type: str, adapter: ProviderAdapter):
+    """Make `adapter` handle engines whose 'type' is `engine_type`."""
+    if not isinstance(adapter, ProviderAdapter):
+        raise TypeError(f"{engine_type} adapter must be a ProviderAdapter instance, got {type(adapter).__name__}")
+    ADAPTERS[engine_type] = adapter
+
+
+register_adapter('openai', OpenAIAdapter())
+register_adapter('openrouter', OpenRouterAdapter())
+register_adapter('anthropic', AnthropicAdapter())
+register_adapter('gemini', GeminiAdapter())
+register_adapter('vllm', LocalOpenAIAdapter())
+register_adapter('ollama', LocalOpenAIAdapter())
+
+
+def adapter_for(engine: dict) -> ProviderAdapter:
+    engine_type = engine.get('type', 'openai')
+    adapter = ADAPTERS.get(engine_type)
+    if adapter is None:
+        raise ValueError(f"Unknown engine type: {engine_type}")
+    return adapter
+
+
+class RequestTemplate:
+    """
+    The prompt-independent parts of an engine's requests, encoded once.
+
+    The body is spliced from the pre-serialized static fields and the
+    per-request ones, so e.g. the model name isn't re-encoded per call.
+    """
+    
+    __slots__ = ('url', 'key', 'timeout', 'head', 'payload_prefix', 'stream_url', 'stream_headers')
+    
+    def __init__(self, engine: dict, adapter: ProviderAdapter):
+        headers = dict(adapter.headers(engine), **engine.get('headers', {}))
+        self.url = engine['url']
+        self.key, path = ConnectionPool._route(self.url)
+        self.timeout = engine.get('timeout', adapter.timeout)
+        self.head = AsyncConnectionPool.request_head('POST', self.key, path, headers)
+        static = adapter.static_payload(engine)
+        # '{"model": "x"' - left open for the per-request fields
+        self.payload_prefix = json.dumps(static)[:-1].encode() if static else b'{'
+        self.stream_url = adapter.stream_url(engine)
+        self.stream_headers = dict(headers, Accept='text/event-stream')
+    
+    def body(self, payload: dict) -> bytes:
+        if not payload:
+            return self.payload_prefix + b'}'
+        fields = json.dumps(payload)[1:].encode()  # '"messages": [...], ...}'
+        if self.payload_prefix == b'{':
+            return b'{' + fields
+        return self.payload_prefix + b', ' + fields
+
+
+_templates = {}
+
+
+def request_template(engine_id: str, engine: dict) -> RequestTemplate:
+    """The engine's compiled template, rebuilt if its URL has been changed."""
+    template = _templates.get(engine_id)
+    if template is None or template.url != engine['url']:
+        template = _templates[engine_id] = RequestTemplate(engine, adapter_for(engine))
+    return template
+
+
+# Compile every engine up front: a bad LLM_ENGINES entry fails at load,
+# not on the first request routed to it
+for _engine_id, _engine in ENGINES.items():
+    request_template(_engine_id, _engine)
+
+
+async def acall_adapter(engine_id: str, engine: dict, prompt, context, max_tokens: int = MAX_TOKENS) -> dict:
+    """One non-streaming call through the engine's adapter and template."""
+    adapter = adapter_for(engine)
+    template = request_template(engine_id, engine)
+    payload = await adapter.payload_async(engine, prompt, max_tokens, context)
+    
+    status, headers, body, reused = await async_http_pool.send(
+        template.key, template.head, template.body(payload), template.timeout
+    )
+    if status >= 400:
+        raise ProviderHTTPError(status, http.client.responses.get(status, ''), headers, body)
+    response_headers.set(headers)
+    # The pool's buffer goes to the parser as bytes; json decodes it once
+    return dict(adapter.parse(json.loads(body)), connection_reused=reused, timings=response_timings.get())
+
+
+# Per-engine concurrency caps, shared by single, hedged and batch calls.
+# asyncio semaphores, created on the engine loop the first time each is used.
+engine_slots = {}
+
+
+def _engine_slot(engine_id: str) -> asyncio.Semaphore:
+    slot = engine_slots.get(engine_id)
+    if slot is None:
+        engine = ENGINES.get(engine_id, {})
+        slot = engine_slots[engine_id] = asyncio.Semaphore(engine.get('max_concurrency', ENGINE_MAX_CONCURRENCY))
+    return slot
+
+
+async def acall_engine(engine_id: str, engine: dict, prompt, context, max_tokens: int = MAX_TOKENS) -> dict:
+    """Call an engine under its rate limit and concurrency cap."""
+    limiter = rate_limiters[engine_id]
+    if not await limiter.acquire_async(RATE_LIMIT_MAX_WAIT_S):
+        raise EngineThrottled(engine_id, limiter.wait_time())
+    
+    slot = _engine_slot(engine_id)
+    metrics.count('waiting', engine_id)
+    try:
+        await slot.acquire()
+    finally:
+        metrics.count('waiting', engine_id, -1)
+    metrics.count('active', engine_id)
+    try:
+        result = await acall_adapter(engine_id, engine, prompt, context, max_tokens)
+    except ProviderHTTPError as e:
+        limiter.observe(e.headers, e.status)
+        raise
+    finally:
+        metrics.count('active', engine_id, -1)
+        slot.release()
+    
+    limiter.observe(response_headers.get())
+    return result
+
+
+def call_engine(engine_id: str, engine: dict, prompt, context, max_tokens: int = MAX_TOKENS) -> dict:
+    """Sync facade over acall_engine."""
+    return engine_loop.run(acall_engine(engine_id, engine, prompt, context, max_tokens),
+                           timeout=remaining_budget())
+
+
+# ============================================================================
+# PROVIDER STREAMS (server-sent events)
+# ============================================================================
+#
+# Every provider speaks its own SSE dialect. The stream_* adapters below turn
+# them into one normalized chunk schema:
+#   {'type': 'delta', 'text': str}
+#   {'type': 'done', 'tokens': int, 'usage': dict, 'finish_reason': str|None}
+
+def iter_sse_events(lines):
+    """Parse raw SSE lines into (event, data) pairs."""
+    event, data = None, []
+    for raw in lines:
+        line = raw.decode('utf-8').rstrip('\r\n')
+        if not line:
+            if data:
+                yield event, '\n'.join(data)
+            event, data = None, []
+        elif line.startswith(':'):
+            continue  # comment / keep-alive (OpenRouter sends these)
+        elif line.startswith('event:'):
+            event = line[6:].strip()
+        elif line.startswith('data:'):
+            data.append(line[5:].lstrip())
+    if data:
+        yield event, '\n'.join(data)
+
+
+def open_template_stream(template: RequestTemplate, payload: dict) -> tuple:
+    """
+    (lines, reused, timings) for a streaming request.
+
+    Streams stay on the sync pool: send_stream hands each chunk to the
+    runtime's blocking writer on the request thread, so reading them on the
+    engine loop would add a cross-thread hop per chunk for no extra overlap.
+    """
+    lines, reused = http_pool.open_stream('POST', template.stream_url, template.body(payload),
+                                          template.stream_headers, timeout=template.timeout)
+    return lines, reused, dict(request_scope.timings)
+
+
+def stream_openai_compatible(template: RequestTemplate, payload: dict):
+    """Stream from OpenAI-style chat completions (OpenAI, Grok, OpenRouter, local servers)."""
+    lines, reused, timings = open_template_stream(
+        template, dict(payload, stream=True, stream_options={'include_usage': True})
+    )
+    usage, finish_reason = {}, None
+    
+    for _, data in iter_sse_events(lines):
+        if data == '[DONE]':
+            continue  # keep reading so the connection is drained for reuse
+        event = json.loads(data)
+        if event.get('error'):
+            raise RuntimeError(f"Stream error: {event['error']}")
+        if event.get('usage'):
+            usage = event['usage']
+        for choice in event.get('choices') or []:
+            text = (choice.get('delta') or {}).get('content')
+            if text:
+                yield {'type': 'delta', 'text': text}
+            finish_reason = choice.get('finish_reason') or finish_reason
+    
+    yield {
+        'type': 'done',
+        'tokens': usage.get('total_tokens', 0),
+        'usage': usage,
+        'finish_reason': finish_reason,
+        'connection_reused': reused,
+        'timings': timings
+    }
+
+
+def stream_anthropic(template: RequestTemplate, payload: dict):
+    """Stream from the Anthropic Messages API."""
+    lines, reused, timings = open_template_stream(template, dict(payload, stream=True))
+    usage, finish_reason = {}, None
+    
+    for event_type, data in iter_sse_events(lines):
+        event = json.loads(data)
+        event_type = event.get('type', event_type)
+        if event_type == 'message_start':
+            usage.update(event.get('message', {}).get('usage', {}))
+        elif event_type == 'content_block_delta':
+            delta = event.get('delta', {})
+            if delta.get('type') == 'text_delta' and delta.get('text'):
+                yield {'type': 'delta', 'text': delta['text']}
+        elif event_type == 'message_delta':
+            usage.update(event.get('usage', {}))
+            finish_reason = event.get('delta', {}).get('stop_reason') or finish_reason
+        elif event_type == 'error':
+            raise RuntimeError(f"Stream error: {event.get('error')}")
+    
+    yield {
+        'type': 'done',
+        'tokens': (usage.get('input_tokens', 0) + (usage.get('cache_creation_input_tokens') or 0)
+                   + (usage.get('cache_read_input_tokens') or 0) + usage.get('output_tokens', 0)),
+        'usage': usage,
+        'finish_reason': finish_reason,
+        'connection_reused': reused,
+        'timings': timings
+    }
+
+
+def stream_gemini(template: RequestTemplate, payload: dict):
+    """Stream from Gemini streamGenerateContent (SSE transport)."""
+    lines, reused, timings = open_template_stream(template, payload)
+    usage, finish_reason = {}, None
+    
+    for _, data in iter_sse_events(lines):
+        event = json.loads(data)
+        if event.get('error'):
+            raise RuntimeError(f"Stream error: {event['error']}")
+        usage = event.get('usageMetadata', usage)
+        for candidate in event.get('candidates') or []:
+            for part in candidate.get('content', {}).get('parts', []):
+                if part.get('text'):
+                    yield {'type': 'delta', 'text': part['text']}
+            finish_reason = candidate.get('finishReason') or finish_reason
+    
+    yield {
+        'type': 'done',
+        'tokens': usage.get('totalTokenCount', 0),
+        'usage': usage,
+        'finish_reason': finish_reason,
+        'connection_reused': reused,
+        'timings': timings
+    }
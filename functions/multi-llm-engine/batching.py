@@ -0,0 +1,59 @@
+"""Batch prompt requests with bounded, per-engine-capped concurrency."""
+import time
+import asyncio
+from appwrite.services.databases import Databases
+from pipeline import aexecute_request, plan_request
+from settings import BATCH_MAX_ITEMS, BATCH_WORKERS
+from transport import engine_loop, offload, remaining_budget
+
+
+async def ahandle_batch(data: dict, databases: Databases, context) -> tuple:
+    """
+    Run a `prompts` array through the normal pipeline concurrently.
+
+    Items inherit top-level options (task_type, cache, hedge, router and the
+    system/system_prompt/skills prefix) unless they set their own. Results
+    come back in input order; a failed item carries its own error and
+    status instead of failing the batch.
+    """
+    items = data.get('prompts')
+    if not isinstance(items, list) or not items:
+        return {'error': 'prompts must be a non-empty array'}, 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return {'error': f'Batch too large ({len(items)} > {BATCH_MAX_ITEMS})'}, 400
+    
+    defaults = {k: v for k, v in data.items()
+                if k in ('task_type', 'agent', 'cache', 'coalesce', 'hedge', 'router', 'system', 'system_prompt', 'skills')}
+    start_time = time.time()
+    
+    # Planning runs on worker threads; provider calls are tasks on the loop,
+    # capped per engine by engine_slots
+    planners = asyncio.Semaphore(BATCH_WORKERS)
+    
+    async def run_item(index: int, item) -> dict:
+        request = dict(defaults, **(item if isinstance(item, dict) else {'prompt': item}))
+        try:
+            async with planners:
+                plan, answered = await offload(plan_request, request, databases, context)
+            body, status = answered or await aexecute_request(plan, databases, context)
+        except Exception as e:
+            body, status = {'error': str(e)}, 500
+        return dict(body, index=index, status=status)
+    
+    results = await asyncio.gather(*(run_item(i, item) for i, item in enumerate(items)))
+    failed = sum(1 for r in results if r['status'] >= 400)
+    
+    return {
+        'success': failed == 0,
+        'count': len(results),
+        'failed': failed,
+        'tokens': sum(r.get('tokens', 0) for r in results),
+        'cost_usd': sum(r.get('cost_usd', 0) for r in results),
+        'latency_ms': int((time.time() - start_time) * 1000),
+        'results': results
+    }, 200
+
+
+def handle_batch(data: dict, databases: Databases, context) -> tuple:
+    """Sync facade over ahandle_batch."""
+    return engine_loop.run(ahandle_batch(data, databases, context), timeout=remaining_budget())
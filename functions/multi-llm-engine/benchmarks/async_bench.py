@@ -0,0 +1,164 @@
+"""
+Concurrency benchmark: blocking thread pool vs the asyncio engine core.
+
+Sends the same burst of provider calls to the local stub two ways:
+
+  threads  - a ThreadPoolExecutor over the blocking ConnectionPool
+             (one thread per in-flight call, as before the async core)
+  asyncio  - tasks on engine_loop over AsyncConnectionPool
+
+and then a `prompts` batch through main(), whose items now fan out on the
+loop. With the stub's fixed latency the ideal wall time is
+ceil(calls / concurrency) * latency, so the gap shows scheduling overhead.
+
+Usage:
+    python benchmarks/async_bench.py [--calls 512] [--concurrency 8,64,256] [--latency fixed:200]
+        [--batch 100] [--json]
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import stub_server  # noqa: E402
+from load_bench import DEFAULT_TASKS, BenchContext, load_engine, percentile  # noqa: E402
+
+PAYLOAD = {'model': 'bench', 'messages': [{'role': 'user', 'content': 'async bench'}], 'max_tokens': 64}
+HEADERS = {'Authorization': 'Bearer stub', 'Content-Type': 'application/json'}
+
+
+def client_threads() -> int:
+    """Live threads, not counting the stub server's per-connection handlers."""
+    return sum(1 for t in threading.enumerate() if 'process_request_thread' not in t.name)
+
+
+def summarize(mode: str, concurrency: int, latencies: list, wall_s: float, threads: int) -> dict:
+    return {
+        'mode': mode,
+        'concurrency': concurrency,
+        'calls': len(latencies),
+        'wall_s': round(wall_s, 3),
+        'rps': round(len(latencies) / wall_s, 1) if wall_s else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+        'threads': threads,
+    }
+
+
+def run_threads(transport, url: str, calls: int, concurrency: int) -> dict:
+    """The pre-async path: every in-flight call holds a thread and a pooled socket."""
+    pool = transport.ConnectionPool(max_per_host=concurrency)
+    latencies, lock = [], threading.Lock()
+    body = json.dumps(PAYLOAD).encode()
+
+    def one(_):
+        start = time.perf_counter()
+        status, _, _, _ = pool.request('POST', url, body, HEADERS, timeout=30)
+        with lock:
+            latencies.append((time.perf_counter() - start) * 1000)
+        return status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(calls)))
+        threads = client_threads()
+    return summarize('threads', concurrency, latencies, time.perf_counter() - start, threads)
+
+
+def run_asyncio(transport, url: str, calls: int, concurrency: int) -> dict:
+    """The async core: one loop thread, `concurrency` tasks in flight."""
+    transport.async_http_pool = transport.AsyncConnectionPool(max_per_host=concurrency)
+    latencies = []
+
+    async def burst():
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with slots:
+                start = time.perf_counter()
+                await transport.apost_json(url, PAYLOAD, HEADERS, timeout=30)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        await asyncio.gather(*(one() for _ in range(calls)))
+        return client_threads()
+
+    start = time.perf_counter()
+    threads = transport.engine_loop.run(burst())
+    return summarize('asyncio', concurrency, latencies, time.perf_counter() - start, threads)
+
+
+def run_batch(engine, size: int) -> dict:
+    """
+    A `prompts` batch through main(): items fan out on the engine loop.
+    Task types rotate so the items spread over engines (each is capped at
+    its max_concurrency).
+    """
+    tasks = DEFAULT_TASKS.split(',')
+    payload = {'cache': False, 'prompts': [
+        {'task_type': tasks[i % len(tasks)], 'prompt': f"Batch item {i}: two sentences on topic #{i}."}
+        for i in range(size)
+    ]}
+    start = time.perf_counter()
+    response = engine.main(BenchContext(payload))
+    wall_s = time.perf_counter() - start
+    body = response['body']
+    return {
+        'mode': 'batch',
+        'items': size,
+        'failed': body.get('failed'),
+        'wall_s': round(wall_s, 3),
+        'items_per_s': round(size / wall_s, 1) if wall_s else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=512)
+    parser.add_argument('--concurrency', default='8,64,256', help='comma-separated in-flight limits')
+    parser.add_argument('--batch', type=int, default=100, help='items in the main() batch run (0 to skip)')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    stub_server.add_arguments(parser)
+    parser.set_defaults(latency='fixed:200')
+    args = parser.parse_args()
+
+    config = stub_server.config_from_args(args)
+    server = stub_server.start(config)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    engine = load_engine(base_url, rate_limits=False)
+    transport = importlib.import_module('transport')
+    url = base_url + '/openai/v1/chat/completions'
+
+    report = []
+    for concurrency in (int(c) for c in args.concurrency.split(',')):
+        report.append(run_threads(transport, url, args.calls, concurrency))
+        report.append(run_asyncio(transport, url, args.calls, concurrency))
+    if args.batch:
+        report.append(run_batch(engine, args.batch))
+
+    engine.usage_logger.close()
+    server.shutdown()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    print(f"{'mode':<9}{'conc':>6}{'calls':>7}{'wall':>9}{'rps':>9}{'p50':>9}{'p99':>9}{'threads':>9}")
+    for row in report:
+        if row['mode'] == 'batch':
+            print(f"batch of {row['items']} via main(): {row['wall_s']}s "
+                  f"({row['items_per_s']} items/s, {row['failed']} failed)")
+            continue
+        print(f"{row['mode']:<9}{row['concurrency']:>6}{row['calls']:>7}{row['wall_s']:>8.2f}s{row['rps']:>9}"
+              f"{row['p50_ms']:>7.1f}ms{row['p99_ms']:>7.1f}ms{row['threads']:>9}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,253 @@
+"""
+Load benchmark for multi-llm-engine against the local provider stub.
+
+Drives main() at a fixed concurrency with a mix of task types and reports
+latency percentiles, throughput and how often requests fell back. Every
+provider and Appwrite call goes to benchmarks/stub_server.py, so it runs
+offline with no keys and no spend.
+
+Usage:
+    python benchmarks/load_bench.py [--requests 500] [--concurrency 16]
+        [--latency lognormal:300:0.5] [--error-rate 0.02] [--throttle-rate 0.01]
+        [--stream 0.2] [--hedge] [--router adaptive] [--json]
+        [--max-p99-ms 2000] [--max-error-rate 0.01]        # exit 1 if exceeded (CI)
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import stub_server  # noqa: E402
+
+PROVIDER_PATHS = {
+    'openai': '/openai/v1/chat/completions',
+    'openrouter': '/openrouter/api/v1/chat/completions',
+    'anthropic': '/anthropic/v1/messages',
+    'gemini': '/gemini/v1beta/models/{model}:generateContent?key=stub',
+    'vllm': '/openai/v1/chat/completions',
+    'ollama': '/openai/v1/chat/completions',
+}
+
+DEFAULT_TASKS = 'code,blog,summary,qa,prd,x_post,linkedin,simple'
+
+
+# ---------------------------------------------------------------------------
+# Appwrite function runtime stand-ins
+# ---------------------------------------------------------------------------
+
+class BenchRequest:
+    def __init__(self, payload: dict):
+        self.body = json.dumps(payload)
+        self.headers = {'content-type': 'application/json'}
+        self.method = 'POST'
+
+
+class BenchResponse:
+    def json(self, data, status: int = 200, headers: dict = None):
+        return {'status': status, 'body': data}
+
+    def send(self, body, status: int = 200, headers: dict = None):
+        return {'status': status, 'raw': body}
+
+
+class BenchContext:
+    def __init__(self, payload: dict):
+        self.req = BenchRequest(payload)
+        self.res = BenchResponse()
+
+    def log(self, message):
+        pass
+
+    def error(self, message):
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Harness
+# ---------------------------------------------------------------------------
+
+def load_engine(base_url: str, rate_limits: bool):
+    """Import main.py with every provider and Appwrite pointed at the stub."""
+    for key in ('XAI_API_KEY', 'OPENAI_API_KEY', 'ANTHROPIC_API_KEY', 'GOOGLE_API_KEY', 'OPENROUTER_API_KEY'):
+        os.environ[key] = 'stub'
+    os.environ['APPWRITE_ENDPOINT'] = f"{base_url}/v1"
+    os.environ['APPWRITE_PROJECT_ID'] = 'bench'
+    os.environ['APPWRITE_API_KEY'] = 'bench'
+    # In production the five provider hosts get a pool each; here they all
+    # share the stub's host, so give it room for all of them.
+    os.environ.setdefault('LLM_POOL_MAX_PER_HOST', '20')
+    os.environ.setdefault('LLM_USAGE_SPILL_PATH', os.path.join(tempfile.gettempdir(), 'bench_usage_spill.jsonl'))
+
+    spec = importlib.util.spec_from_file_location('multi_llm_engine', os.path.join(HERE, '..', 'main.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    # main.py put its directory on sys.path, so the modules it is split into import by name
+    settings, ratelimit = importlib.import_module('settings'), importlib.import_module('ratelimit')
+    for engine_id, engine in settings.ENGINES.items():
+        engine['url'] = base_url + PROVIDER_PATHS[engine['type']].format(model=engine['model'])
+        if not rate_limits:
+            ratelimit.rate_limiters[engine_id] = ratelimit.RateLimiter()
+    return module
+
+
+def percentile(samples: list, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def parse_stream(raw: str) -> dict:
+    """Summary fields from the final SSE event of a streamed response."""
+    events = [json.loads(line[5:]) for line in raw.splitlines() if line.startswith('data:')]
+    last = events[-1] if events else {}
+    if last.get('type') == 'done':
+        return dict(last, success=True)
+    return {'success': False, 'error': last.get('error', 'empty stream')}
+
+
+def run_one(engine, index: int, args, tasks: list) -> dict:
+    payload = {
+        'task_type': tasks[index % len(tasks)],
+        'prompt': f"Benchmark request {index}: write two sentences about topic #{index % 97}.",
+        'cache': args.cache,
+    }
+    if args.hedge:
+        payload['hedge'] = True
+    if args.router:
+        payload['router'] = args.router
+    if args.stream and (index % 100) < args.stream * 100:
+        payload['stream'] = True
+
+    start = time.perf_counter()
+    response = engine.main(BenchContext(payload))
+    latency_ms = (time.perf_counter() - start) * 1000
+
+    body = parse_stream(response['raw']) if 'raw' in response else response['body']
+    status = response['status']
+    if status == 200 and not body.get('success'):
+        status = 500  # a stream that ended in an error event
+    return {
+        'latency_ms': latency_ms,
+        'status': status,
+        'engine': body.get('engine'),
+        'fallback_used': bool(body.get('fallback_used')),
+        'hedged': bool(body.get('hedged')),
+        'hedge_won': bool(body.get('hedge_won')),
+        'stream': bool(payload.get('stream')),
+    }
+
+
+def summarize(results: list, wall_s: float, args, stub_stats: dict) -> dict:
+    latencies = [r['latency_ms'] for r in results]
+    ok = [r for r in results if r['status'] == 200]
+    statuses, engines = {}, {}
+    for r in results:
+        statuses[r['status']] = statuses.get(r['status'], 0) + 1
+        if r['engine'] and r['status'] == 200:
+            engines[r['engine']] = engines.get(r['engine'], 0) + 1
+    return {
+        'requests': len(results),
+        'concurrency': args.concurrency,
+        'wall_s': round(wall_s, 3),
+        'rps': round(len(results) / wall_s, 2) if wall_s else 0.0,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 1),
+            'p95': round(percentile(latencies, 95), 1),
+            'p99': round(percentile(latencies, 99), 1),
+            'max': round(max(latencies), 1) if latencies else 0.0,
+        },
+        'error_rate': round(1 - len(ok) / len(results), 4) if results else 0.0,
+        'fallback_rate': round(sum(r['fallback_used'] for r in ok) / len(ok), 4) if ok else 0.0,
+        'hedged': sum(r['hedged'] for r in ok),
+        'hedge_won': sum(r['hedge_won'] for r in ok),
+        'streamed': sum(r['stream'] for r in results),
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'engines': dict(sorted(engines.items(), key=lambda kv: -kv[1])),
+        'upstream': {p: {str(k): v for k, v in sorted(c.items())} for p, c in sorted(stub_stats.items())},
+    }
+
+
+def print_report(report: dict):
+    lat = report['latency_ms']
+    print(f"requests={report['requests']} concurrency={report['concurrency']} "
+          f"wall={report['wall_s']}s rps={report['rps']}")
+    print(f"latency: p50={lat['p50']}ms p95={lat['p95']}ms p99={lat['p99']}ms max={lat['max']}ms")
+    print(f"errors={report['error_rate']:.2%} fallback={report['fallback_rate']:.2%} "
+          f"hedged={report['hedged']} (won {report['hedge_won']}) streamed={report['streamed']}")
+    print(f"statuses: {report['statuses']}")
+    print(f"engines:  {report['engines']}")
+    print(f"upstream: {report['upstream']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--warmup', type=int, default=20, help='requests run first and left out of the report')
+    parser.add_argument('--tasks', default=DEFAULT_TASKS, help='comma-separated task types, used round-robin')
+    parser.add_argument('--stream', type=float, default=0.0, help='fraction of requests sent with "stream": true')
+    parser.add_argument('--hedge', action='store_true')
+    parser.add_argument('--router', choices=('static', 'adaptive', 'dry_run'))
+    parser.add_argument('--cache', action='store_true', help='leave the response cache on')
+    parser.add_argument('--rate-limits', action='store_true',
+                        help="keep the engines' configured rate limits (off by default: they cap RPS)")
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--max-p99-ms', type=float, help='fail (exit 1) if p99 latency is above this')
+    parser.add_argument('--max-error-rate', type=float, help='fail (exit 1) if the error rate is above this')
+    stub_server.add_arguments(parser)
+    args = parser.parse_args()
+
+    config = stub_server.config_from_args(args)
+    server = stub_server.start(config)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    engine = load_engine(base_url, args.rate_limits)
+    tasks = [t.strip() for t in args.tasks.split(',') if t.strip()]
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(lambda i: run_one(engine, i, args, tasks), range(args.warmup)))
+        config.reset()
+
+        lock = threading.Lock()
+        results = []
+
+        def worker(index):
+            result = run_one(engine, args.warmup + index, args, tasks)
+            with lock:
+                results.append(result)
+
+        start = time.perf_counter()
+        list(pool.map(worker, range(args.requests)))
+        wall_s = time.perf_counter() - start
+
+    engine.usage_logger.close()
+    server.shutdown()
+
+    report = summarize(results, wall_s, args, config.snapshot())
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    failed = []
+    if args.max_p99_ms is not None and report['latency_ms']['p99'] > args.max_p99_ms:
+        failed.append(f"p99 {report['latency_ms']['p99']}ms > {args.max_p99_ms}ms")
+    if args.max_error_rate is not None and report['error_rate'] > args.max_error_rate:
+        failed.append(f"error rate {report['error_rate']:.2%} > {args.max_error_rate:.2%}")
+    if failed:
+        print('FAILED: ' + '; '.join(failed), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
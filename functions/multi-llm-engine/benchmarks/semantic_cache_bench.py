@@ -0,0 +1,92 @@
+"""
+Semantic cache lookup benchmark.
+
+Fills a SemanticCache with synthetic prompts and times lookups for misses
+and near-duplicate hits. Runs offline - no provider keys or Appwrite needed.
+
+Usage:
+    python benchmarks/semantic_cache_bench.py [--entries 50000] [--lookups 2000]
+"""
+import argparse
+import importlib.util
+import os
+import random
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SYLLABLES = "ka ri mo na te shi lu ve do pa zu en or al it ou ba ge fi ny".split()
+
+
+def build_vocabulary(rng: random.Random, size: int = 5000) -> list:
+    """Pseudo-words with a realistic spread of shared and distinct trigrams."""
+    return [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))) for _ in range(size)]
+
+
+def load_caches():
+    """Import main.py without the Appwrite runtime and return its caches module."""
+    spec = importlib.util.spec_from_file_location('multi_llm_engine', os.path.join(HERE, '..', 'main.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # main.py put its directory on sys.path, so the modules it is split into import by name
+    return importlib.import_module('caches')
+
+
+def synthetic_prompt(rng: random.Random, vocabulary: list, words: int = 40) -> str:
+    return ' '.join(rng.choice(vocabulary) for _ in range(words))
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=50000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--dim', type=int, default=None)
+    args = parser.parse_args()
+
+    caches = load_caches()
+    dim = args.dim or caches.SEMANTIC_CACHE_DIM
+    cache = caches.SemanticCache(max_entries=args.entries, dim=dim, ttl=3600)
+    shard = caches.semantic_shard_key({'model': 'bench'}, 'qa', {'max_tokens': caches.MAX_TOKENS})
+    rng = random.Random(42)
+    vocabulary = build_vocabulary(rng)
+
+    stored = []
+    start = time.perf_counter()
+    for _ in range(args.entries):
+        prompt = synthetic_prompt(rng, vocabulary)
+        cache.store(shard, prompt, {'text': 'cached', 'tokens': 100})
+        stored.append(prompt)
+    fill_s = time.perf_counter() - start
+
+    threshold = caches.SEMANTIC_CACHE_THRESHOLDS['qa']
+    results = {}
+    for label, make_query in (
+        ('miss', lambda: synthetic_prompt(rng, vocabulary)),
+        ('near-duplicate hit', lambda: '  ' + rng.choice(stored[-args.entries:]).upper() + '  '),
+    ):
+        timings, hits = [], 0
+        for _ in range(args.lookups):
+            query = make_query()
+            t0 = time.perf_counter()
+            value, _ = cache.lookup(shard, query, threshold)
+            timings.append((time.perf_counter() - t0) * 1000)
+            hits += value is not None
+        results[label] = (timings, hits)
+
+    print(f"entries={args.entries} dim={dim} fill={fill_s:.1f}s "
+          f"matrix={cache._vectors.nbytes / 1e6:.1f}MB")
+    for label, (timings, hits) in results.items():
+        print(f"{label:>20}: p50={percentile(timings, 50):.3f}ms p95={percentile(timings, 95):.3f}ms "
+              f"p99={percentile(timings, 99):.3f}ms mean={statistics.mean(timings):.3f}ms "
+              f"hit_rate={hits / args.lookups:.2%}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,318 @@
+"""
+Local stand-in for the LLM providers (and the slice of Appwrite) that
+multi-llm-engine talks to, so it can be load-tested offline.
+
+Each provider is served under its own path prefix and speaks its own wire
+format, streaming included:
+
+    /openai/v1/chat/completions                   OpenAI / Grok
+    /openrouter/api/v1/chat/completions           OpenRouter
+    /anthropic/v1/messages                        Anthropic Messages
+    /gemini/v1beta/models/<m>:generateContent     Gemini (+ :streamGenerateContent?alt=sse)
+    /v1/databases/...                             Appwrite documents (accepts writes, empty reads)
+
+Latency is drawn per request from a distribution:
+    fixed:MS | uniform:LO:HI | lognormal:MEDIAN:SIGMA | exp:MEAN    (milliseconds)
+
+Usage:
+    python benchmarks/stub_server.py [--port 8900] [--latency lognormal:300:0.5]
+        [--latency-for anthropic=lognormal:900:0.4] [--error-rate 0.02] [--throttle-rate 0.01]
+"""
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROVIDERS = ('openai', 'openrouter', 'anthropic', 'gemini')
+
+REPLY_WORDS = "the engine answered this prompt with a short synthetic reply".split()
+
+
+def parse_distribution(spec: str):
+    """Turn 'lognormal:300:0.5' etc. into a sampler returning milliseconds."""
+    kind, *args = spec.split(':')
+    args = [float(a) for a in args]
+    if kind == 'fixed':
+        return lambda rng: args[0]
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(args[0], args[1])
+    if kind == 'lognormal':
+        mu = math.log(max(args[0], 1e-3))
+        return lambda rng: rng.lognormvariate(mu, args[1])
+    if kind == 'exp':
+        return lambda rng: rng.expovariate(1 / args[0]) if args[0] > 0 else 0.0
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class StubConfig:
+    """Behaviour knobs, shared by all handler threads."""
+
+    def __init__(self, latency: str = 'fixed:0', latency_for: dict = None, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: float = 1.0, stream_chunks: int = 8,
+                 reply_tokens: int = 60, seed: int = None):
+        self.default_latency = parse_distribution(latency)
+        self.latency = {p: parse_distribution(spec) for p, spec in (latency_for or {}).items()}
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.stream_chunks = stream_chunks
+        self.reply_tokens = reply_tokens
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {}  # provider -> {status: count}
+
+    def draw(self, provider: str) -> tuple:
+        """Pick (latency_s, injected_status) for one request."""
+        with self.lock:
+            latency_ms = self.latency.get(provider, self.default_latency)(self.rng)
+            roll = self.rng.random()
+        if roll < self.throttle_rate:
+            return latency_ms / 1000, 429
+        if roll < self.throttle_rate + self.error_rate:
+            return latency_ms / 1000, 500
+        return latency_ms / 1000, 200
+
+    def count(self, provider: str, status: int):
+        with self.lock:
+            bucket = self.stats.setdefault(provider, {})
+            bucket[status] = bucket.get(status, 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {p: dict(counts) for p, counts in self.stats.items()}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, a
+    # keep-alive client's delayed ACK adds ~40ms to every reused call
+    disable_nagle_algorithm = True
+    config = StubConfig()
+
+    def log_message(self, *args):
+        pass
+
+    # -- plumbing --------------------------------------------------------
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        return json.loads(raw) if raw else {}
+
+    def _send_json(self, status: int, payload, headers: dict = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_sse(self, events: list, delay_s: float):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for event in events:
+            data = event.encode()
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.flush()
+            if delay_s:
+                time.sleep(delay_s)
+        self.wfile.write(b'0\r\n\r\n')
+
+    # -- routing ---------------------------------------------------------
+
+    def do_GET(self):
+        if self.path.startswith('/v1/databases/'):
+            return self._appwrite('GET', {})
+        self._send_json(404, {'error': 'not found'})
+
+    def do_PATCH(self):
+        body = self._read_json()
+        if self.path.startswith('/v1/databases/'):
+            return self._appwrite('PATCH', body)
+        self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        body = self._read_json()
+        if self.path.startswith('/v1/databases/'):
+            return self._appwrite('POST', body)
+
+        provider = self.path.strip('/').split('/', 1)[0]
+        if provider not in PROVIDERS:
+            return self._send_json(404, {'error': f'unknown provider path {self.path}'})
+
+        latency_s, status = self.config.draw(provider)
+        self.config.count(provider, status)
+        streaming = body.get('stream') or 'streamGenerateContent' in self.path
+
+        if status != 200:
+            time.sleep(latency_s)
+            if status == 429:
+                return self._send_json(429, {'error': {'message': 'Rate limit exceeded', 'code': 429}},
+                                       {'Retry-After': f"{self.config.retry_after:g}"})
+            return self._send_json(status, {'error': {'message': 'Injected upstream error', 'code': status}})
+
+        words = [REPLY_WORDS[i % len(REPLY_WORDS)] for i in range(self.config.reply_tokens)]
+        prompt_tokens = max(1, len(json.dumps(body)) // 4)
+        if not streaming:
+            time.sleep(latency_s)
+            return self._send_json(200, self._completion(provider, ' '.join(words), prompt_tokens))
+
+        # Streaming: the latency draw is spread across the chunks, so TTFB
+        # is one chunk's worth and the total matches a non-streamed call.
+        chunks = max(1, self.config.stream_chunks)
+        per_chunk = len(words) // chunks or 1
+        pieces = [' '.join(words[i:i + per_chunk]) + ' ' for i in range(0, len(words), per_chunk)]
+        self._send_sse(self._stream_events(provider, pieces, prompt_tokens), latency_s / len(pieces))
+
+    # -- wire formats ----------------------------------------------------
+
+    def _completion(self, provider: str, text: str, prompt_tokens: int) -> dict:
+        completion_tokens = self.config.reply_tokens
+        if provider == 'anthropic':
+            return {
+                'id': f"msg_{uuid.uuid4().hex[:24]}",
+                'type': 'message',
+                'role': 'assistant',
+                'content': [{'type': 'text', 'text': text}],
+                'stop_reason': 'end_turn',
+                'usage': {'input_tokens': prompt_tokens, 'output_tokens': completion_tokens}
+            }
+        if provider == 'gemini':
+            return {
+                'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': 'STOP'}],
+                'usageMetadata': {'promptTokenCount': prompt_tokens, 'candidatesTokenCount': completion_tokens,
+                                  'totalTokenCount': prompt_tokens + completion_tokens}
+            }
+        return {
+            'id': f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            'object': 'chat.completion',
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens}
+        }
+
+    def _stream_events(self, provider: str, pieces: list, prompt_tokens: int) -> list:
+        completion_tokens = self.config.reply_tokens
+        if provider == 'anthropic':
+            events = [self._sse('message_start', {'type': 'message_start', 'message': {
+                'usage': {'input_tokens': prompt_tokens, 'output_tokens': 1}}})]
+            events += [self._sse('content_block_delta', {'type': 'content_block_delta', 'index': 0,
+                                                         'delta': {'type': 'text_delta', 'text': piece}})
+                       for piece in pieces]
+            events.append(self._sse('message_delta', {'type': 'message_delta', 'delta': {'stop_reason': 'end_turn'},
+                                                      'usage': {'output_tokens': completion_tokens}}))
+            events.append(self._sse('message_stop', {'type': 'message_stop'}))
+            return events
+        if provider == 'gemini':
+            total = prompt_tokens + completion_tokens
+            return [self._sse(None, {'candidates': [{'content': {'role': 'model', 'parts': [{'text': piece}]}}],
+                                     'usageMetadata': {'totalTokenCount': total}})
+                    for piece in pieces]
+        events = [': OPENROUTER PROCESSING\n\n'] if provider == 'openrouter' else []
+        events += [self._sse(None, {'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]})
+                   for piece in pieces]
+        events.append(self._sse(None, {'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+                                       'usage': {'prompt_tokens': prompt_tokens,
+                                                 'completion_tokens': completion_tokens,
+                                                 'total_tokens': prompt_tokens + completion_tokens}}))
+        events.append('data: [DONE]\n\n')
+        return events
+
+    @staticmethod
+    def _sse(event: str, payload: dict) -> str:
+        prefix = f"event: {event}\n" if event else ''
+        return f"{prefix}data: {json.dumps(payload)}\n\n"
+
+    # -- Appwrite --------------------------------------------------------
+
+    def _appwrite(self, method: str, body: dict):
+        """Just enough of the Databases API for the engine's reads and writes."""
+        match = re.search(r'/documents(?:/([^/?]+))?', self.path)
+        doc_id = match.group(1) if match else None
+        now = time.strftime('%Y-%m-%dT%H:%M:%S.000+00:00', time.gmtime())
+        if method == 'GET' and doc_id:
+            return self._send_json(404, {'message': 'Document not found', 'code': 404,
+                                         'type': 'document_not_found'})
+        if method == 'GET':
+            return self._send_json(200, {'total': 0, 'documents': []})
+        if 'documents' in body and isinstance(body['documents'], list):
+            docs = [dict(d, **{'$createdAt': now}) for d in body['documents']]
+            return self._send_json(201, {'total': len(docs), 'documents': docs})
+        document = dict(body.get('data') or {}, **{
+            '$id': doc_id or body.get('documentId') or uuid.uuid4().hex[:20],
+            '$createdAt': now,
+            '$updatedAt': now
+        })
+        return self._send_json(200 if method == 'PATCH' else 201, document)
+
+
+def start(config: StubConfig = None, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    """Start the stub on a background thread. Port 0 picks a free one."""
+    handler = type('ConfiguredStubHandler', (StubHandler,), {'config': config or StubConfig()})
+    # The default listen backlog (5) resets connections under a burst of connects
+    server_class = type('StubServer', (ThreadingHTTPServer,), {'request_queue_size': 1024})
+    server = server_class((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Stub behaviour flags, shared with the load benchmark."""
+    parser.add_argument('--latency', default='lognormal:300:0.5',
+                        help='default provider latency distribution (ms)')
+    parser.add_argument('--latency-for', action='append', default=[], metavar='PROVIDER=DIST',
+                        help=f"per-provider latency, provider one of {', '.join(PROVIDERS)}")
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of calls answered with 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of calls answered with 429')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--stream-chunks', type=int, default=8)
+    parser.add_argument('--reply-tokens', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def config_from_args(args) -> StubConfig:
+    return StubConfig(
+        latency=args.latency,
+        latency_for=dict(item.split('=', 1) for item in args.latency_for),
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        stream_chunks=args.stream_chunks,
+        reply_tokens=args.reply_tokens,
+        seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = start(config_from_args(args), args.host, args.port)
+    print(f"Provider stub listening on http://{args.host}:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(server.RequestHandlerClass.config.snapshot(), indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
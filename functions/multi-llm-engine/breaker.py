@@ -0,0 +1,199 @@
+"""Circuit breakers (closed/open/half-open), shared across instances via Engine_Status."""
+import time
+import threading
+from collections import deque
+from appwrite.services.databases import Databases
+from appwrite.query import Query
+from settings import (
+    BREAKER_BASE_COOLDOWN_S, BREAKER_CONSECUTIVE, BREAKER_FAILURE_RATE, BREAKER_MAX_COOLDOWN_S,
+    BREAKER_MIN_REQUESTS, BREAKER_RESET_AFTER_S, BREAKER_SYNC_TTL_S, BREAKER_WINDOW_S, DATABASE_ID,
+    ENGINES,
+)
+from timestamps import format_timestamp, parse_timestamp
+
+
+class CircuitBreaker:
+    """
+    Closed -> open -> half-open breaker for one engine.
+
+    Outcomes are judged over a local sliding time window. Every state
+    change is written to Engine_Status, so all instances share the same
+    verdict: a fresh instance won't hammer an open provider. Once the
+    cool-down expires the breaker is half-open: traffic is let through,
+    the first success closes it and the first failure re-opens it with a
+    doubled cool-down.
+    """
+
+    def __init__(self, engine_id: str):
+        self.engine_id = engine_id
+        self.state = 'closed'
+        self.open_until = 0.0
+        self.trip_count = 0
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.closed_at = time.time()
+        self.updated_at = 0.0
+        self._window = deque()  # (timestamp, ok)
+
+    def current_state(self, now: float = None) -> str:
+        now = now or time.time()
+        if self.state == 'open' and now >= self.open_until:
+            return 'half_open'
+        return self.state
+
+    def allows(self) -> bool:
+        return self.current_state() != 'open'
+
+    def _trim(self, now: float):
+        while self._window and self._window[0][0] < now - BREAKER_WINDOW_S:
+            self._window.popleft()
+
+    def failure_rate(self) -> float:
+        self._trim(time.time())
+        if not self._window:
+            return 0.0
+        return sum(1 for _, ok in self._window if not ok) / len(self._window)
+
+    def on_success(self) -> bool:
+        """Record a success. Returns True if the state changed."""
+        now = time.time()
+        self._window.append((now, True))
+        self._trim(now)
+        self.consecutive_failures = 0
+        if self.current_state(now) == 'half_open':
+            self.state = 'closed'
+            self.closed_at = now
+            self.updated_at = now
+            return True
+        return False
+
+    def on_failure(self, error: str) -> bool:
+        """Record a failure. Returns True if the state changed."""
+        now = time.time()
+        self._window.append((now, False))
+        self._trim(now)
+        self.consecutive_failures += 1
+        self.last_error = (error or '')[:500]
+        
+        state = self.current_state(now)
+        if state == 'open':
+            return False
+        if state == 'half_open' or self.consecutive_failures >= BREAKER_CONSECUTIVE or (
+                len(self._window) >= BREAKER_MIN_REQUESTS
+                and self.failure_rate() >= BREAKER_FAILURE_RATE):
+            self._trip(now)
+            return True
+        return False
+
+    def _trip(self, now: float):
+        if self.state == 'closed' and now - self.closed_at > BREAKER_RESET_AFTER_S:
+            self.trip_count = 0
+        self.trip_count += 1
+        cooldown = min(BREAKER_BASE_COOLDOWN_S * 2 ** (self.trip_count - 1), BREAKER_MAX_COOLDOWN_S)
+        self.state = 'open'
+        self.open_until = now + cooldown
+        self.updated_at = now
+
+    def to_document(self) -> dict:
+        return {
+            'engine': self.engine_id,
+            'available': self.state != 'open',
+            'state': self.state,
+            'consecutive_failures': min(self.consecutive_failures, 100),
+            'trip_count': self.trip_count,
+            'open_until': format_timestamp(self.open_until) if self.open_until else None,
+            'last_error': self.last_error,
+            'last_check': format_timestamp(self.updated_at or time.time())
+        }
+
+    def merge_document(self, doc: dict):
+        """Adopt the shared state if another instance changed it more recently."""
+        updated_at = parse_timestamp(doc.get('last_check'))
+        if updated_at <= self.updated_at:
+            return
+        self.state = doc.get('state') or ('closed' if doc.get('available', True) else 'open')
+        self.open_until = parse_timestamp(doc.get('open_until'))
+        self.trip_count = doc.get('trip_count') or 0
+        self.last_error = doc.get('last_error')
+        self.updated_at = updated_at
+        if self.state == 'closed':
+            self.closed_at = updated_at
+
+
+class BreakerRegistry:
+    """
+    All engines' breakers plus their Engine_Status sync.
+
+    Reads are one list_documents for every engine, cached for
+    BREAKER_SYNC_TTL_S, so the hot path normally never touches the
+    database. Writes happen only on state changes.
+    """
+
+    def __init__(self):
+        self.breakers = {engine_id: CircuitBreaker(engine_id) for engine_id in ENGINES}
+        self._databases = None
+        self._document_ids = {}
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    def bind(self, databases: Databases):
+        self._databases = databases
+
+    def get(self, engine_id: str) -> CircuitBreaker:
+        breaker = self.breakers.get(engine_id)
+        if breaker is None:
+            breaker = self.breakers[engine_id] = CircuitBreaker(engine_id)
+        return breaker
+
+    def sync(self, force: bool = False):
+        """Refresh from Engine_Status if the cached view is stale."""
+        if self._databases is None:
+            return
+        now = time.time()
+        if not force and now - self._synced_at < BREAKER_SYNC_TTL_S:
+            return
+        with self._lock:
+            if not force and now - self._synced_at < BREAKER_SYNC_TTL_S:
+                return
+            self._synced_at = now
+            try:
+                docs = self._databases.list_documents(DATABASE_ID, 'Engine_Status', [Query.limit(100)])
+            except Exception:
+                return  # keep the local view; a broken status store must not stop routing
+            for doc in docs.get('documents', []):
+                engine_id = doc.get('engine')
+                if engine_id:
+                    self._document_ids[engine_id] = doc['$id']
+                    self.get(engine_id).merge_document(doc)
+
+    def persist(self, engine_id: str, context=None):
+        """Write one breaker's state to Engine_Status (upsert by engine)."""
+        if self._databases is None:
+            return
+        data = self.get(engine_id).to_document()
+        document_id = self._document_ids.get(engine_id, engine_id)
+        try:
+            try:
+                self._databases.update_document(DATABASE_ID, 'Engine_Status', document_id, data)
+            except Exception as e:
+                if getattr(e, 'code', None) != 404:
+                    raise
+                self._databases.create_document(DATABASE_ID, 'Engine_Status', document_id, data)
+            self._document_ids[engine_id] = document_id
+        except Exception as e:
+            if context:
+                context.log(f"Failed to persist breaker state for {engine_id}: {e}")
+
+    def snapshot(self) -> dict:
+        return {
+            engine_id: {
+                'state': breaker.current_state(),
+                'trip_count': breaker.trip_count,
+                'failure_rate': round(breaker.failure_rate(), 3),
+                'open_until': format_timestamp(breaker.open_until) if breaker.state == 'open' else None
+            }
+            for engine_id, breaker in self.breakers.items()
+        }
+
+
+circuit_breakers = BreakerRegistry()
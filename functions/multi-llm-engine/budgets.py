@@ -0,0 +1,208 @@
+"""Daily/monthly spend budgets per task and agent, with downgrade to cheap engines."""
+import calendar
+import time
+import threading
+from datetime import datetime, timezone
+from appwrite.services.databases import Databases
+from appwrite.query import Query
+from estimation import fits_context
+from routing import is_engine_available
+from settings import (
+    BUDGETS, BUDGET_DOWNGRADE_AT, BUDGET_DOWNGRADE_ENGINES, BUDGET_RECONCILE_PAGE, BUDGET_RECONCILE_S,
+    DATABASE_ID, ENGINES,
+)
+from timestamps import format_timestamp
+
+
+class BudgetEngine:
+    """
+    Running spend per scope and period, checked before every provider call.
+
+    Scopes are 'total', 'task:<type>' and 'agent:<name>'; periods are the
+    UTC day and month. Each call is charged here as it is logged, and every
+    BUDGET_RECONCILE_S the month's Engine_Usage rows are summed in the
+    background. A total then becomes the larger of the two figures: the
+    collection sees every instance, but lags this one's queued writes.
+    """
+
+    PERIODS = ('daily', 'monthly')
+
+    def __init__(self, limits: dict = None):
+        self.limits = BUDGETS if limits is None else limits
+        self.spend = {}   # (scope, period key) -> USD
+        self.stats = {'downgraded': 0, 'rejected': 0, 'reconciles': 0, 'last_error': None}
+        self._databases = None
+        self._reconciled_at = 0.0
+        self._reconciling = False
+        self._lock = threading.Lock()
+
+    def bind(self, databases: Databases):
+        self._databases = databases
+
+    @staticmethod
+    def period_keys(now: datetime = None) -> dict:
+        now = now or datetime.now(timezone.utc)
+        return {'daily': now.strftime('%Y-%m-%d'), 'monthly': now.strftime('%Y-%m')}
+
+    @staticmethod
+    def scopes(task_type: str, agent: str = None) -> list:
+        scopes = ['total', f"task:{task_type}"]
+        if agent:
+            scopes.append(f"agent:{agent}")
+        return scopes
+
+    def limit_for(self, scope: str, period: str):
+        """The configured USD limit, or None when the scope is unlimited."""
+        if scope == 'total':
+            return self.limits.get(period) or None
+        kind, name = scope.split(':', 1)
+        return (self.limits.get(kind + 's') or {}).get(name, {}).get(period) or None
+
+    def charge(self, task_type: str, agent: str, cost: float):
+        if cost <= 0:
+            return
+        keys = self.period_keys()
+        with self._lock:
+            for scope in self.scopes(task_type, agent):
+                for key in keys.values():
+                    self.spend[(scope, key)] = self.spend.get((scope, key), 0.0) + cost
+
+    def check(self, task_type: str, agent: str, cost: float):
+        """
+        The tightest budget this request touches, as if `cost` were spent:
+        {'scope', 'period', 'spent_usd', 'limit_usd', 'ratio'}. None when
+        every scope is unlimited.
+        """
+        self.reconcile_if_stale()
+        keys = self.period_keys()
+        tightest = None
+        with self._lock:
+            for scope in self.scopes(task_type, agent):
+                for period, key in keys.items():
+                    limit = self.limit_for(scope, period)
+                    if not limit:
+                        continue
+                    spent = self.spend.get((scope, key), 0.0)
+                    ratio = (spent + cost) / limit
+                    if tightest is None or ratio > tightest['ratio']:
+                        tightest = {'scope': scope, 'period': period, 'spent_usd': round(spent, 6),
+                                    'limit_usd': limit, 'ratio': round(ratio, 4)}
+        return tightest
+
+    def reconcile_if_stale(self, wait: bool = False):
+        """Reconcile if the last run is older than BUDGET_RECONCILE_S; in the background unless `wait`."""
+        if self._databases is None or time.time() - self._reconciled_at < BUDGET_RECONCILE_S:
+            return
+        with self._lock:
+            if self._reconciling:
+                return
+            self._reconciling = True
+        if wait:
+            self.reconcile()
+        else:
+            threading.Thread(target=self.reconcile, name='budget-reconcile', daemon=True).start()
+
+    def reconcile(self):
+        """Sum this month's Engine_Usage spend by scope and adopt any total above ours."""
+        try:
+            now = datetime.now(timezone.utc)
+            totals = {}
+            cursor = None
+            while True:
+                queries = [
+                    Query.greater_than_equal('created_at', now.strftime('%Y-%m-01T00:00:00')),
+                    Query.limit(BUDGET_RECONCILE_PAGE),
+                    Query.select(['$id', 'task_type', 'agent', 'cost_usd', 'created_at'])
+                ]
+                if cursor:
+                    queries.append(Query.cursor_after(cursor))
+                docs = self._databases.list_documents(DATABASE_ID, 'Engine_Usage', queries).get('documents', [])
+                for doc in docs:
+                    cost = doc.get('cost_usd') or 0.0
+                    created_at = doc.get('created_at') or ''
+                    if cost <= 0 or not created_at:
+                        continue
+                    for scope in self.scopes(doc.get('task_type') or 'default', doc.get('agent')):
+                        for key in (created_at[:10], created_at[:7]):
+                            totals[(scope, key)] = totals.get((scope, key), 0.0) + cost
+                if len(docs) < BUDGET_RECONCILE_PAGE:
+                    break
+                cursor = docs[-1]['$id']
+            
+            current = set(self.period_keys().values())
+            with self._lock:
+                for key, total in totals.items():
+                    if total > self.spend.get(key, 0.0):
+                        self.spend[key] = total
+                # Drop days and months that have rolled over
+                self.spend = {key: spent for key, spent in self.spend.items() if key[1] in current}
+            self.stats['reconciles'] += 1
+            self.stats['last_error'] = None
+        except Exception as e:
+            self.stats['last_error'] = str(e)
+        finally:
+            self._reconciled_at = time.time()
+            self._reconciling = False
+
+    def projection(self) -> dict:
+        """
+        Spend to date and the straight-line projection to the end of the
+        current day and month, per scope - the CFO agent's view of LLM spend.
+        """
+        now = datetime.now(timezone.utc)
+        keys = self.period_keys(now)
+        day_elapsed = (now.hour * 3600 + now.minute * 60 + now.second) / 86400
+        days_in_month = calendar.monthrange(now.year, now.month)[1]
+        elapsed = {'daily': day_elapsed, 'monthly': (now.day - 1 + day_elapsed) / days_in_month}
+        
+        with self._lock:
+            spend = dict(self.spend)
+        scopes = {'total'} | {scope for scope, key in spend if key in keys.values()}
+        for kind in ('tasks', 'agents'):
+            scopes |= {f"{kind[:-1]}:{name}" for name in self.limits.get(kind) or {}}
+        
+        report = {}
+        for scope in sorted(scopes):
+            report[scope] = {}
+            for period in self.PERIODS:
+                spent = spend.get((scope, keys[period]), 0.0)
+                # Floor the elapsed fraction so the first minutes of a period don't explode
+                projected = spent / max(elapsed[period], 0.01)
+                limit = self.limit_for(scope, period)
+                report[scope][period] = {
+                    'spent_usd': round(spent, 6),
+                    'projected_usd': round(projected, 6),
+                    'limit_usd': limit,
+                    'remaining_usd': round(max(limit - spent, 0.0), 6) if limit else None,
+                    'projected_over_limit': bool(limit) and projected > limit
+                }
+        return {
+            'as_of': now.isoformat(),
+            'periods': keys,
+            'reconciled_at': format_timestamp(self._reconciled_at) if self._reconciled_at else None,
+            'downgrade_at': BUDGET_DOWNGRADE_AT,
+            'downgrade_engines': BUDGET_DOWNGRADE_ENGINES,
+            'scopes': report,
+            'stats': dict(self.stats)
+        }
+
+
+budgets = BudgetEngine()
+
+
+def select_budget_engine(engine: dict, prompt, max_tokens: int, free_only: bool = False) -> tuple:
+    """
+    Cheapest of BUDGET_DOWNGRADE_ENGINES that is cheaper than `engine` and
+    can take the request (free engines only once a budget is spent).
+    (None, None) if none qualify.
+    """
+    current_cost = engine.get('cost_per_1k', 0)
+    for engine_id in sorted((e for e in BUDGET_DOWNGRADE_ENGINES if e in ENGINES),
+                            key=lambda e: ENGINES[e].get('cost_per_1k', 0)):
+        candidate = ENGINES[engine_id]
+        cost = candidate.get('cost_per_1k', 0)
+        if cost >= current_cost or (free_only and cost > 0):
+            continue
+        if is_engine_available(engine_id) and fits_context(candidate, prompt, max_tokens):
+            return engine_id, candidate
+    return None, None
@@ -0,0 +1,314 @@
+"""Response caches: exact match (in-process LRU + optional Appwrite tier) and semantic."""
+import json
+import time
+import hashlib
+import unicodedata
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from appwrite.services.databases import Databases
+from prompts import prompt_text
+from settings import (
+    CACHE_COLLECTION_ID, CACHE_MAX_ENTRIES, CACHE_PERSIST, CACHE_TTLS, DATABASE_ID, MAX_TOKENS,
+    SEMANTIC_CACHE_DIM, SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_MAX_PROMPT_CHARS, SEMANTIC_CACHE_THRESHOLDS, SEMANTIC_CACHE_TTL,
+)
+from timestamps import format_timestamp, parse_timestamp
+
+
+# ============================================================================
+# RESPONSE CACHE (exact match)
+# ============================================================================
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Canonical form of a prompt for cache keying.
+
+    Only changes that can't alter the model's reading are applied (unicode
+    form, line endings, surrounding whitespace) - formatting and spelling
+    tasks are sensitive to inner whitespace.
+    """
+    text = unicodedata.normalize('NFC', prompt).replace('\r\n', '\n')
+    return text.strip()
+
+
+def cache_key(engine: dict, task_type: str, prompt, params: dict) -> str:
+    """Hash of (model, task type, normalized prompt, generation params)."""
+    material = json.dumps({
+        'model': engine['model'],
+        'task_type': task_type,
+        'prompt': hashlib.sha256(normalize_prompt(prompt_text(prompt)).encode()).hexdigest(),
+        'params': params
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier completion cache.
+
+    Tier 1 is a bounded in-process LRU that survives warm invocations.
+    Tier 2 (LLM_CACHE_PERSIST=1) is the Engine_Cache collection, shared by
+    all instances; tier 2 hits are promoted into tier 1.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, persist: bool = CACHE_PERSIST):
+        self.max_entries = max_entries
+        self.persist = persist
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'persistent_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    @staticmethod
+    def ttl_for(task_type: str) -> int:
+        return int(CACHE_TTLS.get(task_type, 0))
+
+    @staticmethod
+    def _document_id(key: str) -> str:
+        # Appwrite document IDs are capped at 36 characters
+        return key[:36]
+
+    def get(self, key: str, databases: Databases = None, context=None):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+        
+        if self.persist and databases is not None:
+            try:
+                doc = databases.get_document(DATABASE_ID, CACHE_COLLECTION_ID, self._document_id(key))
+                expires_at = parse_timestamp(doc['expires_at'])
+                if doc.get('cache_key') == key and expires_at > now:
+                    value = {'text': doc['response_text'], 'tokens': doc.get('tokens', 0)}
+                    self._put_local(key, value, expires_at)
+                    with self._lock:
+                        self.stats['hits'] += 1
+                        self.stats['persistent_hits'] += 1
+                    return value
+            except Exception as e:
+                # 404 is the normal miss path; anything else is worth a log line
+                if getattr(e, 'code', None) != 404 and context:
+                    context.log(f"Cache read failed: {e}")
+        
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def _put_local(self, key: str, value: dict, expires_at: float):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def put(self, key: str, value: dict, ttl: int, engine_id: str, engine: dict,
+            task_type: str, databases: Databases = None, context=None):
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        self._put_local(key, value, expires_at)
+        with self._lock:
+            self.stats['stores'] += 1
+        
+        if self.persist and databases is not None:
+            doc = {
+                'cache_key': key,
+                'engine': engine_id,
+                'model': engine['model'],
+                'task_type': task_type,
+                'response_text': value['text'],
+                'tokens': value.get('tokens', 0),
+                'expires_at': format_timestamp(expires_at),
+                'created_at': datetime.utcnow().isoformat()
+            }
+            try:
+                try:
+                    databases.create_document(DATABASE_ID, CACHE_COLLECTION_ID, self._document_id(key), doc)
+                except Exception as e:
+                    if getattr(e, 'code', None) != 409:
+                        raise
+                    databases.update_document(DATABASE_ID, CACHE_COLLECTION_ID, self._document_id(key), doc)
+            except Exception as e:
+                if context:
+                    context.log(f"Cache write failed: {e}")
+
+
+response_cache = ResponseCache()
+
+
+# ============================================================================
+# SEMANTIC CACHE (near-duplicate prompts)
+# ============================================================================
+#
+# Prompts are embedded locally as signed, hashed character trigrams and kept
+# in a fixed-size NumPy ring buffer. A lookup is one matrix-vector product
+# over the buffer (the coarse cosine), then a re-check of the few candidates
+# that clear the coarse bar using a wide embedding where hash collisions are
+# negligible. The narrow coarse pass keeps lookups sub-millisecond at tens of
+# thousands of entries; the wide pass keeps collisions from turning into
+# wrong answers.
+
+def semantic_normalize(prompt: str) -> str:
+    """Casefold and collapse whitespace - the differences this cache forgives."""
+    return ' '.join(unicodedata.normalize('NFKC', prompt).casefold().split())
+
+
+class SemanticCache:
+    """
+    Bounded near-duplicate completion cache.
+
+    Capacity is fixed at construction: the embedding matrix is preallocated
+    and new entries overwrite the oldest slot, so memory never grows past
+    `max_entries` rows plus their texts. Entries are sharded by
+    (model, task type, generation params) so a hit never crosses engines.
+    """
+
+    COARSE_MARGIN = 0.15
+    TOP_K = 2
+    VERIFY_DIM = 4096
+
+    def __init__(self, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 dim: int = SEMANTIC_CACHE_DIM, ttl: int = SEMANTIC_CACHE_TTL):
+        import numpy as np  # deferred: only paid for when the cache is enabled
+        self._np = np
+        self.max_entries = max_entries
+        self.dim = dim
+        self.ttl = ttl
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._shards = np.full(max_entries, -1, dtype=np.int32)
+        self._entries = [None] * max_entries   # slot -> (normalized prompt, value, expires_at)
+        self._shard_ids = {}
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    @staticmethod
+    def threshold_for(task_type: str):
+        return SEMANTIC_CACHE_THRESHOLDS.get(task_type)
+
+    def embed(self, normalized: str, dim: int = None):
+        """Signed feature-hashed trigram embedding, L2-normalized."""
+        np = self._np
+        dim = dim or self.dim
+        codes = np.frombuffer(f" {normalized} ".encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+        vector = np.zeros(dim, dtype=np.float32)
+        if codes.size < 3:
+            return vector
+        # FNV-style chain over each trigram, then a multiply-xorshift finalizer
+        # so the low bits used for the bucket depend on every character
+        prime = np.uint64(0x100000001B3)
+        h = ((codes[:-2] * prime) ^ codes[1:-1]) * prime ^ codes[2:]
+        h ^= h >> np.uint64(29)
+        h *= np.uint64(0x9E3779B97F4A7C15)
+        h ^= h >> np.uint64(32)
+        buckets = (h % np.uint64(dim)).astype(np.intp)
+        signs = ((h >> np.uint64(40)) & np.uint64(1)).astype(np.float32) * 2 - 1
+        vector += np.bincount(buckets, weights=signs, minlength=dim).astype(np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def _shard(self, shard_key: str, create: bool):
+        shard = self._shard_ids.get(shard_key)
+        if shard is None and create:
+            shard = self._shard_ids[shard_key] = len(self._shard_ids)
+        return shard
+
+    def lookup(self, shard_key: str, prompt: str, threshold: float):
+        """Return (value, similarity) for the best match above threshold, else (None, 0)."""
+        np = self._np
+        normalized = semantic_normalize(prompt)
+        if len(normalized) > SEMANTIC_CACHE_MAX_PROMPT_CHARS:
+            return None, 0.0
+        query = self.embed(normalized)
+        now = time.time()
+        
+        with self._lock:
+            shard = self._shard(shard_key, create=False)
+            if shard is None or not self._size:
+                self.stats['misses'] += 1
+                return None, 0.0
+            
+            scores = self._vectors[:self._size] @ query
+            scores[self._shards[:self._size] != shard] = -1.0
+            candidates = np.flatnonzero(scores >= threshold - self.COARSE_MARGIN)
+            if candidates.size > self.TOP_K:
+                top = np.argpartition(scores[candidates], -self.TOP_K)[-self.TOP_K:]
+                candidates = candidates[top]
+            candidates = candidates[np.argsort(-scores[candidates])]
+            
+            matches = []
+            for slot in candidates:
+                entry = self._entries[slot]
+                if entry is None:
+                    continue
+                if entry[2] <= now:
+                    self._evict(slot)
+                    continue
+                matches.append(entry)
+            if not matches:
+                self.stats['misses'] += 1
+                return None, 0.0
+        
+        # The wide re-check embeds every candidate: do it outside the lock so
+        # concurrent lookups and stores don't queue behind it. Entries are
+        # immutable tuples, so an overwritten slot can't change them here.
+        wide_query = self.embed(normalized, self.VERIFY_DIM)
+        for text, value, _ in matches:
+            similarity = 1.0 if text == normalized else float(self.embed(text, self.VERIFY_DIM) @ wide_query)
+            if similarity >= threshold:
+                with self._lock:
+                    self.stats['hits'] += 1
+                return value, similarity
+        
+        with self._lock:
+            self.stats['misses'] += 1
+        return None, 0.0
+
+    def _evict(self, slot: int):
+        self._entries[slot] = None
+        self._shards[slot] = -1
+        self._vectors[slot] = 0.0
+        self.stats['evictions'] += 1
+
+    def store(self, shard_key: str, prompt: str, value: dict):
+        normalized = semantic_normalize(prompt)
+        if len(normalized) > SEMANTIC_CACHE_MAX_PROMPT_CHARS:
+            return
+        vector = self.embed(normalized)
+        with self._lock:
+            slot = self._next
+            if self._entries[slot] is not None:
+                self.stats['evictions'] += 1
+            self._vectors[slot] = vector
+            self._shards[slot] = self._shard(shard_key, create=True)
+            self._entries[slot] = (normalized, value, time.time() + self.ttl)
+            self._next = (slot + 1) % self.max_entries
+            self._size = max(self._size, slot + 1)
+            self.stats['stores'] += 1
+
+
+semantic_cache = SemanticCache() if SEMANTIC_CACHE_ENABLED else None
+
+
+def semantic_shard_key(engine: dict, task_type: str, params: dict) -> str:
+    return json.dumps({'model': engine['model'], 'task_type': task_type, 'params': params}, sort_keys=True)
+
+
+def store_cached_response(databases: Databases, engine_id: str, engine: dict, task_type: str,
+                          prompt, value: dict, use_cache: bool, use_semantic: bool, context,
+                          max_tokens: int = MAX_TOKENS):
+    """Write a fresh completion to whichever cache tiers apply to this request."""
+    params = {'max_tokens': max_tokens}
+    if use_cache:
+        response_cache.put(cache_key(engine, task_type, prompt, params), value,
+                           response_cache.ttl_for(task_type), engine_id, engine, task_type,
+                           databases, context)
+    if use_semantic:
+        semantic_cache.store(semantic_shard_key(engine, task_type, params), prompt_text(prompt), value)
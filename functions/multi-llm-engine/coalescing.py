@@ -0,0 +1,49 @@
+"""Single-flight coalescing of identical in-flight requests."""
+import asyncio
+
+
+class SingleFlight:
+    """
+    At most one in-flight call per key. Later callers with the same key
+    await the first call's task instead of starting their own, and get its
+    result or exception. Lives on the engine loop, so needs no lock.
+    """
+
+    def __init__(self):
+        self._calls = {}   # key -> asyncio.Task
+        self.stats = {'calls': 0, 'coalesced': 0, 'shared_errors': 0}
+
+    async def run(self, key: str, factory, failed=None) -> tuple:
+        """
+        (result of factory(), coalesced) - factory only runs for the first
+        caller. failed(result) marks a returned result as an error, so it is
+        counted in shared_errors like a raised one.
+        """
+        task = self._calls.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self.stats['coalesced'] += 1
+        else:
+            task = self._calls[key] = asyncio.ensure_future(factory())
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.stats['calls'] += 1
+        try:
+            # Shielded: one caller timing out must not cancel the others' call
+            result = await asyncio.shield(task)
+        except Exception:
+            if coalesced:
+                self.stats['shared_errors'] += 1
+            raise
+        if coalesced and failed and failed(result):
+            self.stats['shared_errors'] += 1
+        return result, coalesced
+
+    def _forget(self, key: str, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def snapshot(self) -> dict:
+        return dict(self.stats, in_flight=len(self._calls))
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,121 @@
+"""
+Token estimates before dispatch and call cost after it.
+
+A character-ratio estimate per tokenizer family rather than a vendored BPE:
+it is O(len) in C (one UTF-8 encode), needs no tokenizer files at cold
+start, and lands within ~10-15% on English prose, which is enough for cost
+prediction and context-window checks padded by TOKEN_SAFETY_MARGIN.
+Engine_Usage logs estimated vs actual prompt tokens to keep it honest.
+"""
+from prompts import prompt_text
+from settings import (
+    ANTHROPIC_CACHE_WRITE_PREMIUM, CACHED_TOKEN_DISCOUNT, DEFAULT_CONTEXT_WINDOW, ECHO_TASKS, MAX_TOKENS,
+    TASK_MAX_TOKENS, TOKEN_CHARS_PER_TOKEN, TOKEN_MESSAGE_OVERHEAD, TOKEN_SAFETY_MARGIN,
+)
+
+
+# Recent tokens per call, by (engine, task type)
+task_tokens = {}
+
+
+def token_family(engine: dict) -> str:
+    """Tokenizer family for an engine ('tokenizer' key, else from the model name)."""
+    if engine.get('tokenizer'):
+        return engine['tokenizer']
+    model = engine['model'].lower()
+    for marker, family in (('claude', 'anthropic'), ('gemini', 'gemini'), ('gemma', 'gemini'),
+                           ('llama', 'llama'), ('qwen', 'qwen'), ('mistral', 'mistral'),
+                           ('deepseek', 'deepseek')):
+        if marker in model:
+            return family
+    return 'openai'
+
+
+def estimate_tokens(text: str, family: str = 'openai') -> int:
+    """
+    Approximate token count. Multi-byte characters cost extra: each byte
+    beyond the first adds half a token, so accented Latin lands near 0.8
+    and CJK near 1.3 tokens per character.
+    """
+    if not text:
+        return TOKEN_MESSAGE_OVERHEAD
+    chars = len(text)
+    extra_bytes = 0 if text.isascii() else len(text.encode('utf-8')) - chars
+    ratio = TOKEN_CHARS_PER_TOKEN.get(family, TOKEN_CHARS_PER_TOKEN['openai'])
+    return int(chars / ratio + extra_bytes * 0.5) + TOKEN_MESSAGE_OVERHEAD
+
+
+def task_max_tokens(task_type: str, prompt) -> int:
+    """Completion budget for a task; rewrite tasks are sized from their input."""
+    cap = TASK_MAX_TOKENS.get(task_type, MAX_TOKENS)
+    if task_type in ECHO_TASKS:
+        return min(cap, int(estimate_tokens(prompt_text(prompt)) * 1.5) + 64)
+    return cap
+
+
+def context_window(engine: dict) -> int:
+    return engine.get('context_window', DEFAULT_CONTEXT_WINDOW)
+
+
+def fits_context(engine: dict, prompt, max_tokens: int) -> bool:
+    """True if the (padded) prompt estimate plus the completion budget fit."""
+    prompt_tokens = estimate_tokens(prompt_text(prompt), token_family(engine)) * TOKEN_SAFETY_MARGIN
+    return prompt_tokens + max_tokens <= context_window(engine)
+
+
+def estimate_request(engine_id: str, engine: dict, task_type: str, prompt, max_tokens: int) -> dict:
+    """
+    Pre-dispatch token and cost prediction. The expected completion is this
+    engine's recent average for the task (capped at the budget), else half
+    the budget; max_cost_usd assumes the whole budget is used.
+    """
+    prompt_tokens = estimate_tokens(prompt_text(prompt), token_family(engine))
+    history = task_tokens.get((engine_id, task_type))
+    completion = min(max_tokens, int(sum(history) / len(history))) if history else max_tokens // 2
+    cost_per_token = engine.get('cost_per_1k', 0) / 1000
+    return {
+        'prompt_tokens': prompt_tokens,
+        'max_tokens': max_tokens,
+        'completion_tokens': completion,
+        'cost_usd': round((prompt_tokens + completion) * cost_per_token, 8),
+        'max_cost_usd': round((prompt_tokens + max_tokens) * cost_per_token, 8)
+    }
+
+
+def actual_prompt_tokens(usage: dict) -> int:
+    """Prompt-side token count from any provider's usage block."""
+    usage = usage or {}
+    if 'input_tokens' in usage:
+        # Anthropic reports prompt-cache reads and writes separately
+        return (usage['input_tokens'] + (usage.get('cache_creation_input_tokens') or 0)
+                + (usage.get('cache_read_input_tokens') or 0))
+    return usage.get('prompt_tokens') or usage.get('promptTokenCount') or 0
+
+
+# ============================================================================
+# CALL COST (net of provider prompt caching)
+# ============================================================================
+
+def prompt_cache_usage(engine: dict, usage: dict) -> tuple:
+    """
+    (cached prompt tokens, USD saved by provider prompt caching) from a
+    provider usage block. Anthropic cache writes count against the saving.
+    """
+    usage = usage or {}
+    cached = (
+        (usage.get('prompt_tokens_details') or {}).get('cached_tokens')
+        or usage.get('cache_read_input_tokens')
+        or usage.get('cachedContentTokenCount')
+        or 0
+    )
+    family = token_family(engine)
+    rate = engine.get('cost_per_1k', 0) / 1000
+    saved = cached * rate * CACHED_TOKEN_DISCOUNT.get(family, CACHED_TOKEN_DISCOUNT['default'])
+    saved -= (usage.get('cache_creation_input_tokens') or 0) * rate * ANTHROPIC_CACHE_WRITE_PREMIUM
+    return cached, saved
+
+
+def call_cost(engine: dict, result: dict) -> float:
+    """USD for a completed call, net of prompt-cache savings."""
+    _, saved = prompt_cache_usage(engine, result.get('usage'))
+    return max(0.0, (result.get('tokens', 0) / 1000) * engine.get('cost_per_1k', 0) - saved)
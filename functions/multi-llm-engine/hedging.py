@@ -0,0 +1,125 @@
+"""Hedged requests: race a cheap fallback when the primary runs slow."""
+import time
+import asyncio
+from adapters import acall_engine
+from estimation import fits_context
+from routing import is_engine_available, latency_percentile, record_failure, record_latency
+from settings import (
+    ENGINES, HEDGE_COST_CEILING, HEDGE_DEFAULT_DELAY_MS, HEDGE_MIN_DELAY_MS, HEDGE_PERCENTILE, MAX_TOKENS,
+)
+from transport import engine_loop, offload, remaining_budget
+
+
+def hedge_delay_ms(engine_id: str) -> int:
+    """How long to give the primary before firing the hedge."""
+    observed = latency_percentile(engine_id, HEDGE_PERCENTILE)
+    if observed is None:
+        return HEDGE_DEFAULT_DELAY_MS
+    return max(int(observed), HEDGE_MIN_DELAY_MS)
+
+
+def select_hedge_engine(primary_id: str, task_type: str, prompt='',
+                        max_tokens: int = MAX_TOKENS) -> tuple:
+    """
+    Pick the engine to race against the primary.
+
+    Prefers the primary's own fallback chain, then the cheapest engine
+    overall, but never anything above the task's hedge cost ceiling -
+    a hedge doubles spend, so it is only worth it on cheap engines.
+    """
+    ceiling = HEDGE_COST_CEILING.get(task_type, HEDGE_COST_CEILING['default'])
+    
+    def eligible(engine_id):
+        return (engine_id != primary_id and is_engine_available(engine_id)
+                and ENGINES[engine_id].get('cost_per_1k', 0) <= ceiling
+                and fits_context(ENGINES[engine_id], prompt, max_tokens))
+    
+    current_id, visited = primary_id, set()
+    while current_id and current_id not in visited:
+        visited.add(current_id)
+        fallback_id = ENGINES.get(current_id, {}).get('fallback')
+        if fallback_id and eligible(fallback_id):
+            return fallback_id, ENGINES[fallback_id]
+        current_id = fallback_id
+    
+    for engine_id in sorted(ENGINES, key=lambda e: ENGINES[e].get('cost_per_1k', 0)):
+        if eligible(engine_id):
+            return engine_id, ENGINES[engine_id]
+    
+    return None, None
+
+
+async def _timed_call(engine_id: str, engine: dict, prompt, context, max_tokens: int) -> tuple:
+    start_time = time.time()
+    result = await acall_engine(engine_id, engine, prompt, context, max_tokens)
+    return result, int((time.time() - start_time) * 1000)
+
+
+async def acall_engine_hedged(engine_id: str, engine: dict, prompt, task_type: str, context,
+                              max_tokens: int = MAX_TOKENS) -> dict:
+    """
+    Call the primary engine and, if it hasn't answered within its hedge
+    delay, race a cheap fallback; a primary that fails sooner starts the
+    fallback straight away. The first success wins and the loser's task is
+    cancelled, closing its connection.
+
+    Returns {'engine_id', 'engine', 'result', 'latency_ms', 'hedge_engine',
+    'hedge_won'}. Raises the primary's error if every racer fails.
+    """
+    start_time = time.time()
+    primary = asyncio.ensure_future(_timed_call(engine_id, engine, prompt, context, max_tokens))
+    tasks = {primary: engine_id}
+    done, _ = await asyncio.wait(tasks, timeout=hedge_delay_ms(engine_id) / 1000)
+    
+    hedge_id = None
+    if not done or primary.exception() is not None:
+        hedge_id, hedge_engine = await offload(select_hedge_engine, engine_id, task_type, prompt, max_tokens)
+        if hedge_id:
+            reason = 'failed' if done else 'slow'
+            context.log(f"Hedging {engine_id} ({reason}) with {hedge_id} after {int((time.time() - start_time) * 1000)}ms")
+            tasks[asyncio.ensure_future(_timed_call(hedge_id, hedge_engine, prompt, context, max_tokens))] = hedge_id
+    
+    errors = {}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                winner_id = tasks[task]
+                try:
+                    result, latency_ms = task.result()
+                except Exception as e:
+                    errors[winner_id] = e
+                    if winner_id != engine_id:
+                        # The primary's failure is counted by the caller's retry loop
+                        await offload(record_failure, winner_id, e, context)
+                    continue
+                
+                for loser in pending:
+                    # Censored sample: the loser took at least this long. Keeps the
+                    # percentile from drifting down as slow calls get cancelled.
+                    record_latency(tasks[loser], int((time.time() - start_time) * 1000))
+                return {
+                    'engine_id': winner_id,
+                    'engine': ENGINES[winner_id],
+                    'result': result,
+                    'latency_ms': latency_ms,
+                    'hedge_engine': hedge_id,
+                    'hedge_won': winner_id != engine_id
+                }
+    finally:
+        # Losers, or every racer if we were cancelled ourselves; wait for them
+        # to unwind so their connections and slots are released before we return
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    
+    raise errors.get(engine_id) or next(iter(errors.values()))
+
+
+def call_engine_hedged(engine_id: str, engine: dict, prompt, task_type: str, context,
+                       max_tokens: int = MAX_TOKENS) -> dict:
+    """Sync facade over acall_engine_hedged."""
+    return engine_loop.run(acall_engine_hedged(engine_id, engine, prompt, task_type, context, max_tokens),
+                           timeout=remaining_budget())
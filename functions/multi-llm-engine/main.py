@@ -6,360 +6,116 @@ Features:
 - Task-specific model routing (Grok for X, ChatGPT for LinkedIn, etc.)
 - Automatic fallback when model unavailable or out of credits
 - Cost tracking to Engine_Usage collection
-- Circuit breaker pattern for reliability
+- Circuit breaker (closed/open/half-open) shared across instances via Engine_Status
+- Keep-alive connection pool shared across warm invocations
+- Streaming (SSE) responses with one chunk schema across providers
+- Exact-match response cache (in-process LRU + optional Appwrite tier)
+- Opt-in semantic cache for near-duplicate prompts
+- Hedged requests: race a cheap fallback when the primary runs slow
+- Adaptive latency/cost-aware routing (with a dry-run shadow mode)
+- Background, batched Engine_Usage logging with on-disk spill
+- Batch prompt requests with bounded, per-engine-capped concurrency
+- Per-engine token-bucket rate limits that honour Retry-After
+- Appwrite client built once per warm instance
+- Local token estimates: pre-dispatch cost, context-window routing, per-task max_tokens
+- Structured system/skills/messages input with provider prompt caching
+- asyncio engine core: one event loop multiplexes provider calls, hedges and batches
+- Provider adapter registry with precompiled request templates; config-defined engines (vLLM, Ollama)
+- Single-flight coalescing of identical in-flight requests
+- In-process metrics (latency histograms, throughput, breakers, caches, queues) as Prometheus text or JSON
+- Daily/monthly spend budgets per task and agent, with downgrade to cheap engines and projected spend
 """
 import os
+import sys
 import json
 import time
-from datetime import datetime
+import threading
 from appwrite.client import Client
 from appwrite.services.databases import Databases
-from appwrite.id import ID
-
-# Environment
-APPWRITE_ENDPOINT = os.environ.get('APPWRITE_ENDPOINT', 'https://fra.cloud.appwrite.io/v1')
-APPWRITE_PROJECT_ID = os.environ.get('APPWRITE_PROJECT_ID')
-APPWRITE_API_KEY = os.environ.get('APPWRITE_API_KEY')
-DATABASE_ID = os.environ.get('DATABASE_ID', '693703ef001133c62d78')
-
-# LLM API Keys
-XAI_API_KEY = os.environ.get('XAI_API_KEY', '')
-OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
-ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY', '')
-GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY', '')
-OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY', '')
-
-# Engine definitions with cost metadata
-ENGINES = {
-    # === Premium Engines ===
-    'grok': {
-        'name': 'Grok (xAI)',
-        'url': 'https://api.x.ai/v1/chat/completions',
-        'key': XAI_API_KEY,
-        'model': 'grok-2',
-        'cost_per_1k': 0.002,
-        'best_for': ['x_post', 'x_thread', 'twitter', 'meme', 'edgy'],
-        'fallback': 'mistral',
-        'type': 'openai'
-    },
-    'chatgpt': {
-        'name': 'ChatGPT (OpenAI)',
-        'url': 'https://api.openai.com/v1/chat/completions',
-        'key': OPENAI_API_KEY,
-        'model': 'gpt-4o',
-        'cost_per_1k': 0.005,
-        'best_for': ['linkedin', 'newsletter', 'professional', 'formal'],
-        'fallback': 'qwen',
-        'type': 'openai'
-    },
-    'claude': {
-        'name': 'Claude (Anthropic)',
-        'url': 'https://api.anthropic.com/v1/messages',
-        'key': ANTHROPIC_API_KEY,
-        'model': 'claude-3-5-sonnet-20241022',
-        'cost_per_1k': 0.003,
-        'best_for': ['prd', 'code', 'security', 'analysis', 'long_form'],
-        'fallback': 'deepseek',
-        'type': 'anthropic'
-    },
-    'gemini': {
-        'name': 'Gemini (Google)',
-        'url': f'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GOOGLE_API_KEY}',
-        'key': GOOGLE_API_KEY,
-        'model': 'gemini-2.0-flash',
-        'cost_per_1k': 0.00035,
-        'best_for': ['general', 'summary', 'qa'],
-        'fallback': 'qwen',
-        'type': 'gemini'
-    },
-    
-    # === OpenRouter Models (FREE or very cheap) ===
-    'qwen': {
-        'name': 'Qwen 2.5 (OpenRouter)',
-        'url': 'https://openrouter.ai/api/v1/chat/completions',
-        'key': OPENROUTER_API_KEY,
-        'model': 'qwen/qwen-2.5-72b-instruct:free',
-        'cost_per_1k': 0.0,  # FREE tier
-        'best_for': ['simple', 'translation', 'summary'],
-        'fallback': 'mistral',
-        'type': 'openrouter'
-    },
-    'mistral': {
-        'name': 'Mistral Large (OpenRouter)',
-        'url': 'https://openrouter.ai/api/v1/chat/completions',
-        'key': OPENROUTER_API_KEY,
-        'model': 'mistralai/mistral-large-2411',
-        'cost_per_1k': 0.002,
-        'best_for': ['reasoning', 'multilingual', 'european'],
-        'fallback': 'gemini',
-        'type': 'openrouter'
-    },
-    'deepseek': {
-        'name': 'DeepSeek V3 (OpenRouter)',
-        'url': 'https://openrouter.ai/api/v1/chat/completions',
-        'key': OPENROUTER_API_KEY,
-        'model': 'deepseek/deepseek-chat',
-        'cost_per_1k': 0.00014,  # VERY cheap
-        'best_for': ['code', 'math', 'reasoning', 'chinese'],
-        'fallback': 'qwen',
-        'type': 'openrouter'
-    },
-    'llama': {
-        'name': 'Llama 3.3 70B (OpenRouter)',
-        'url': 'https://openrouter.ai/api/v1/chat/completions',
-        'key': OPENROUTER_API_KEY,
-        'model': 'meta-llama/llama-3.3-70b-instruct:free',
-        'cost_per_1k': 0.0,  # FREE tier
-        'best_for': ['general', 'chat', 'instruction'],
-        'fallback': 'qwen',
-        'type': 'openrouter'
-    },
-    'gemma': {
-        'name': 'Gemma 2 27B (OpenRouter)',
-        'url': 'https://openrouter.ai/api/v1/chat/completions',
-        'key': OPENROUTER_API_KEY,
-        'model': 'google/gemma-2-27b-it:free',
-        'cost_per_1k': 0.0,  # FREE 
-        'best_for': ['simple', 'formatting', 'spelling'],
-        'fallback': None,
-        'type': 'openrouter'
-    }
-}
-
-# Task-to-engine routing (cost-optimized)
-ROUTING = {
-    # Premium tasks → Premium engines
-    'x_post': 'grok',
-    'x_thread': 'grok',
-    'twitter': 'grok',
-    'linkedin': 'chatgpt',
-    'linkedin_newsletter': 'chatgpt',
-    'newsletter': 'chatgpt',
-    
-    # Code/Analysis → Claude or DeepSeek (cheap)
-    'prd': 'claude',
-    'code': 'deepseek',       # DeepSeek is great for code + cheap
-    'security_audit': 'claude',
-    'analysis': 'claude',
-    
-    # General tasks → Free/Cheap models
-    'blog': 'qwen',           # Qwen is free
-    'summary': 'llama',       # Llama is free
-    'qa': 'gemini',
-    'general': 'gemini',
-    'simple': 'gemma',        # Gemma is free
-    
-    # Formatting → Cheapest
-    'spelling': 'gemma',
-    'formatting': 'gemma',
-    'translation': 'qwen',
-    
-    'default': 'gemini'
-}
-
-# In-memory circuit breaker state (reset on cold start)
-engine_status = {engine_id: {'failures': 0, 'last_error': None} for engine_id in ENGINES}
-
-
-def is_engine_available(engine_id: str) -> bool:
-    """Check if an engine is available (has key and not circuit-broken)."""
-    engine = ENGINES.get(engine_id)
-    if not engine:
-        return False
-    
-    # Check if API key is configured
-    if not engine['key']:
-        return False
-    
-    # Circuit breaker: 3 failures = disabled for this invocation
-    if engine_status[engine_id]['failures'] >= 3:
-        return False
-    
-    return True
-
-
-def select_engine(task_type: str) -> tuple:
-    """Select the best available engine for the task type."""
-    preferred_id = ROUTING.get(task_type, ROUTING['default'])
-    
-    # Try preferred engine
-    if is_engine_available(preferred_id):
-        return preferred_id, ENGINES[preferred_id], False
-    
-    # Walk fallback chain
-    current_id = preferred_id
-    visited = set()
-    
-    while current_id and current_id not in visited:
-        visited.add(current_id)
-        engine = ENGINES.get(current_id)
-        if not engine:
-            break
-        
-        fallback_id = engine.get('fallback')
-        if fallback_id and is_engine_available(fallback_id):
-            return fallback_id, ENGINES[fallback_id], True
-        
-        current_id = fallback_id
-    
-    # Emergency: find any available engine
-    for engine_id, engine in ENGINES.items():
-        if is_engine_available(engine_id):
-            return engine_id, engine, True
-    
-    return None, None, False
-
-
-def call_openai_compatible(engine: dict, prompt: str, context) -> dict:
-    """Call OpenAI-compatible API (OpenAI, Grok)."""
-    import urllib.request
-    import urllib.error
-    
-    payload = json.dumps({
-        'model': engine['model'],
-        'messages': [{'role': 'user', 'content': prompt}],
-        'max_tokens': 2000
-    }).encode()
-    
-    headers = {
-        'Authorization': f"Bearer {engine['key']}",
-        'Content-Type': 'application/json'
-    }
-    
-    req = urllib.request.Request(engine['url'], data=payload, headers=headers)
-    response = urllib.request.urlopen(req, timeout=30)
-    data = json.loads(response.read().decode())
-    
-    return {
-        'text': data['choices'][0]['message']['content'],
-        'usage': data.get('usage', {}),
-        'tokens': data.get('usage', {}).get('total_tokens', 0)
-    }
-
-
-def call_anthropic(engine: dict, prompt: str, context) -> dict:
-    """Call Anthropic Claude API."""
-    import urllib.request
-    
-    payload = json.dumps({
-        'model': engine['model'],
-        'max_tokens': 2000,
-        'messages': [{'role': 'user', 'content': prompt}]
-    }).encode()
-    
-    headers = {
-        'x-api-key': engine['key'],
-        'anthropic-version': '2023-06-01',
-        'Content-Type': 'application/json'
-    }
-    
-    req = urllib.request.Request(engine['url'], data=payload, headers=headers)
-    response = urllib.request.urlopen(req, timeout=30)
-    data = json.loads(response.read().decode())
-    
-    input_tokens = data.get('usage', {}).get('input_tokens', 0)
-    output_tokens = data.get('usage', {}).get('output_tokens', 0)
-    
-    return {
-        'text': data['content'][0]['text'],
-        'usage': data.get('usage', {}),
-        'tokens': input_tokens + output_tokens
-    }
-
-
-def call_gemini(engine: dict, prompt: str, context) -> dict:
-    """Call Google Gemini API."""
-    import urllib.request
-    
-    payload = json.dumps({
-        'contents': [{'parts': [{'text': prompt}]}]
-    }).encode()
-    
-    headers = {'Content-Type': 'application/json'}
-    
-    req = urllib.request.Request(engine['url'], data=payload, headers=headers)
-    response = urllib.request.urlopen(req, timeout=30)
-    data = json.loads(response.read().decode())
-    
-    usage = data.get('usageMetadata', {})
-    tokens = usage.get('totalTokenCount', 0)
-    
-    return {
-        'text': data['candidates'][0]['content']['parts'][0]['text'],
-        'usage': usage,
-        'tokens': tokens
-    }
-
-
-def call_openrouter(engine: dict, prompt: str, context) -> dict:
-    """Call OpenRouter API (Qwen, Mistral, DeepSeek, Llama, Gemma)."""
-    import urllib.request
-    
-    payload = json.dumps({
-        'model': engine['model'],
-        'messages': [{'role': 'user', 'content': prompt}],
-        'max_tokens': 2000
-    }).encode()
-    
-    headers = {
-        'Authorization': f"Bearer {engine['key']}",
-        'Content-Type': 'application/json',
-        'HTTP-Referer': 'https://fikanova.com',
-        'X-Title': 'Fikanova OS'
-    }
-    
-    req = urllib.request.Request(engine['url'], data=payload, headers=headers)
-    response = urllib.request.urlopen(req, timeout=60)
-    data = json.loads(response.read().decode())
-    
-    return {
-        'text': data['choices'][0]['message']['content'],
-        'usage': data.get('usage', {}),
-        'tokens': data.get('usage', {}).get('total_tokens', 0)
-    }
-
-
-def call_engine(engine_id: str, engine: dict, prompt: str, context) -> dict:
-    """Route to the appropriate API caller based on engine type."""
-    engine_type = engine.get('type', 'openai')
-    
-    if engine_type == 'openai':
-        return call_openai_compatible(engine, prompt, context)
-    elif engine_type == 'anthropic':
-        return call_anthropic(engine, prompt, context)
-    elif engine_type == 'gemini':
-        return call_gemini(engine, prompt, context)
-    elif engine_type == 'openrouter':
-        return call_openrouter(engine, prompt, context)
-    else:
-        raise ValueError(f"Unknown engine type: {engine_type}")
-
-
-def log_usage(databases: Databases, engine_id: str, engine: dict, result: dict, 
-              task_type: str, latency_ms: int, fallback_used: bool, context):
-    """Log usage to Engine_Usage collection."""
-    try:
-        tokens = result.get('tokens', 0)
-        cost = (tokens / 1000) * engine.get('cost_per_1k', 0)
-        
-        databases.create_document(
-            database_id=DATABASE_ID,
-            collection_id='Engine_Usage',
-            document_id=ID.unique(),
-            data={
-                'engine': engine_id,
-                'model': engine['model'],
-                'task_type': task_type,
-                'tokens_used': tokens,
-                'cost_usd': cost,
-                'latency_ms': latency_ms,
-                'fallback_used': fallback_used,
-                'created_at': datetime.utcnow().isoformat()
-            }
-        )
-    except Exception as e:
-        context.log(f"Failed to log usage: {e}")
 
+# The runtime loads this file by path; make its sibling modules importable
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from batching import handle_batch  # noqa: E402
+from breaker import circuit_breakers  # noqa: E402
+from budgets import budgets  # noqa: E402
+from caches import response_cache, semantic_cache  # noqa: E402
+from coalescing import single_flight  # noqa: E402
+from metrics import metrics, render_prometheus  # noqa: E402
+from pipeline import plan_request, run_request  # noqa: E402
+from ratelimit import rate_limiters  # noqa: E402
+from settings import APPWRITE_API_KEY, APPWRITE_ENDPOINT, APPWRITE_PROJECT_ID, REQUEST_TIMEOUT_S  # noqa: E402
+from streaming import generate_stream, send_stream  # noqa: E402
+from transport import async_http_pool, http_pool, request_scope  # noqa: E402
+from usage import usage_logger  # noqa: E402
+
+
+# ============================================================================
+# APPWRITE CLIENT (built once per warm instance)
+# ============================================================================
+
+_appwrite_lock = threading.Lock()
+_databases = None
+
+
+def get_databases() -> Databases:
+    """Databases service on a module-cached Appwrite client."""
+    global _databases
+    if _databases is None:
+        with _appwrite_lock:
+            if _databases is None:
+                client = Client()
+                client.set_endpoint(APPWRITE_ENDPOINT)
+                client.set_project(APPWRITE_PROJECT_ID)
+                client.set_key(APPWRITE_API_KEY)
+                _databases = Databases(client)
+                circuit_breakers.bind(_databases)
+                budgets.bind(_databases)
+    return _databases
+
+
+# ============================================================================
+# METRICS (served by action "metrics")
+# ============================================================================
+
+def collect_metrics() -> dict:
+    """
+    metrics.snapshot() plus the state other components own (breakers,
+    caches, coalescing, usage queue, rate limits, pools), read from their
+    own snapshots at scrape time.
+    """
+    snapshot = metrics.snapshot()
+    caches = {'exact': dict(response_cache.stats)}
+    if semantic_cache is not None:
+        caches['semantic'] = dict(semantic_cache.stats)
+    for stats in caches.values():
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+
+    snapshot['queues']['usage_log'] = usage_logger.depth()
+    snapshot.update({
+        'breakers': circuit_breakers.snapshot(),
+        'caches': caches,
+        'coalescing': single_flight.snapshot(),
+        'usage_log': {k: v for k, v in usage_logger.stats.items() if k != 'last_error'},
+        'rate_limits': {engine_id: limiter.snapshot() for engine_id, limiter in rate_limiters.items()},
+        'connection_pools': {'sync': http_pool.snapshot(), 'async': async_http_pool.snapshot()},
+    })
+    return snapshot
+
+
+def handle_metrics(data: dict, query: dict, context):
+    """Serve the metrics snapshot: Prometheus text by default, JSON with format=json."""
+    snapshot = collect_metrics()
+    if (data.get('format') or query.get('format')) == 'json':
+        return context.res.json(snapshot)
+    return context.res.send(render_prometheus(snapshot), 200,
+                            {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+# ============================================================================
+# ENTRY POINT
+# ============================================================================
 
 def main(context):
     """
@@ -368,10 +124,37 @@ def main(context):
     Request body:
     {
         "task_type": "x_post|linkedin|prd|code|summary|etc",
-        "prompt": "Your prompt here",
-        "engine": "optional - force specific engine"
+        "prompt": "Your prompt here (optional with messages)",
+        "system": "optional - system instructions",
+        "system_prompt": "optional - name of an agents/prompts/*.md file, e.g. system_prompt",
+        "skills": "optional - [\"skill_name\", ...] from agents/L3_skills/*/instructions.md",
+        "messages": "optional - prior turns [{\"role\": \"user|assistant\", \"content\": \"...\"}]",
+        "engine": "optional - force specific engine",
+        "stream": "optional - true to receive text/event-stream chunks",
+        "cache": "optional - false to bypass the response cache",
+        "hedge": "optional - true to race a cheap fallback if the primary is slow",
+        "router": "optional - static|adaptive|dry_run (defaults to LLM_ROUTER_MODE)",
+        "estimate_only": "optional - true to return the token/cost estimate without calling an engine",
+        "coalesce": "optional - true/false to share an identical in-flight request's provider call (default: on for COALESCE_TASKS)",
+        "agent": "optional - calling agent (e.g. cmo), for per-agent spend budgets"
     }
+    
+    Batch form - replaces "prompt"; results are returned in input order:
+    {
+        "task_type": "optional default for items",
+        "prompts": [{"prompt": "...", "task_type": "x_post"}, "plain prompt", ...]
+    }
+    
+    Metrics for this warm instance (body or query string):
+    {
+        "action": "metrics",
+        "format": "optional - json for a JSON snapshot instead of Prometheus text"
+    }
+    
+    Spend to date and projected day/month spend per budget scope (for the CFO agent):
+    {"action": "budget"}
     """
+    request_scope.deadline = time.monotonic() + REQUEST_TIMEOUT_S
     try:
         # Parse request
         req = context.req
@@ -382,83 +165,53 @@ def main(context):
         else:
             data = body or {}
         
-        task_type = data.get('task_type', 'default')
-        prompt = data.get('prompt', '')
-        force_engine = data.get('engine')
+        query = getattr(req, 'query', None) or {}
+        action = data.get('action') or query.get('action')
+        if action == 'metrics':
+            return handle_metrics(data, query, context)
         
-        if not prompt:
+        if action != 'budget' and not data.get('prompt') and not data.get('prompts') and not data.get('messages'):
             return context.res.json({'error': 'Missing prompt'}, 400)
         
-        # Initialize Appwrite
-        client = Client()
-        client.set_endpoint(APPWRITE_ENDPOINT)
-        client.set_project(APPWRITE_PROJECT_ID)
-        client.set_key(APPWRITE_API_KEY)
-        databases = Databases(client)
-        
-        # Select engine
-        if force_engine and is_engine_available(force_engine):
-            engine_id = force_engine
-            engine = ENGINES[force_engine]
-            fallback_used = False
-        else:
-            engine_id, engine, fallback_used = select_engine(task_type)
+        # Reuse the warm instance's Appwrite client
+        databases = get_databases()
+        usage_logger.bind(databases)
         
-        if not engine_id:
-            return context.res.json({'error': 'No LLM engines available'}, 503)
+        if action == 'budget':
+            budgets.reconcile_if_stale(wait=True)
+            return context.res.json(budgets.projection())
         
-        context.log(f"Using engine: {engine['name']} for task: {task_type}")
-        if fallback_used:
-            context.log("(fallback from preferred engine)")
+        if 'prompts' in data:
+            result, status = handle_batch(data, databases, context)
+            return context.res.json(result, status)
         
-        # Call engine with retry
-        max_retries = 3
-        last_error = None
+        if not data.get('stream'):
+            result, status = run_request(data, databases, context)
+            return context.res.json(result, status)
         
-        for attempt in range(max_retries):
-            try:
-                start_time = time.time()
-                result = call_engine(engine_id, engine, prompt, context)
-                latency_ms = int((time.time() - start_time) * 1000)
-                
-                # Reset failure count on success
-                engine_status[engine_id]['failures'] = 0
-                
-                # Log usage
-                log_usage(databases, engine_id, engine, result, task_type, 
-                         latency_ms, fallback_used, context)
-                
-                return context.res.json({
-                    'success': True,
-                    'engine': engine_id,
-                    'model': engine['model'],
-                    'text': result['text'],
-                    'tokens': result.get('tokens', 0),
-                    'cost_usd': (result.get('tokens', 0) / 1000) * engine.get('cost_per_1k', 0),
-                    'latency_ms': latency_ms,
-                    'fallback_used': fallback_used
-                })
-                
-            except Exception as e:
-                last_error = str(e)
-                engine_status[engine_id]['failures'] += 1
-                engine_status[engine_id]['last_error'] = last_error
-                context.log(f"Engine {engine_id} failed (attempt {attempt + 1}): {last_error}")
-                
-                # Try fallback on failure
-                if attempt < max_retries - 1:
-                    fallback_id = engine.get('fallback')
-                    if fallback_id and is_engine_available(fallback_id):
-                        engine_id = fallback_id
-                        engine = ENGINES[fallback_id]
-                        fallback_used = True
-                        context.log(f"Falling back to: {engine['name']}")
+        plan, answered = plan_request(data, databases, context)
+        if answered:
+            hit, status = answered
+            # Errors and estimate_only answers carry no text to stream
+            if status != 200 or 'text' not in hit:
+                return context.res.json(hit, status)
+            done = {k: v for k, v in hit.items() if k not in ('success', 'text')}
+            return send_stream(context, [
+                {'type': 'delta', 'engine': hit['engine'], 'index': 0, 'text': hit['text']},
+                dict(done, type='done', chunks=1, finish_reason=None, ttft_ms=0)
+            ])
         
-        return context.res.json({
-            'error': f'All engines failed: {last_error}',
-            'last_engine': engine_id
-        }, 500)
+        chunks = generate_stream(databases, plan['engine_id'], plan['engine'], plan['prompt'],
+                                 plan['task_type'], plan['fallback_used'], context,
+                                 plan['use_cache'], plan['use_semantic'],
+                                 plan['max_tokens'], plan['estimate'], plan['agent'])
+        return send_stream(context, chunks)
         
+    except TimeoutError as e:
+        context.log(f"Timed out in multi-llm-engine: {str(e)}")
+        return context.res.json({'error': str(e)}, 504)
     except Exception as e:
         context.log(f"Error in multi-llm-engine: {str(e)}")
         return context.res.json({'error': str(e)}, 500)
+    finally:
+        request_scope.deadline = None
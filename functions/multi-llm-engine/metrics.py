@@ -0,0 +1,226 @@
+"""In-process metrics: latency histograms and counters, rendered as Prometheus text."""
+import time
+import threading
+from settings import METRICS_QUANTILES, METRICS_SIGNIFICANT_BITS
+
+
+class LatencyHistogram:
+    """
+    HDR-style latency histogram. Values are recorded in microseconds into
+    log-linear buckets that keep METRICS_SIGNIFICANT_BITS of the value, so
+    memory stays at a few hundred buckets from 1us to hours while any
+    quantile is within one bucket width (~3% at 5 bits) of the true value.
+    """
+
+    def __init__(self, significant_bits: int = METRICS_SIGNIFICANT_BITS):
+        self.significant_bits = significant_bits
+        self.buckets = {}   # bucket floor (us) -> count
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_us = 0
+
+    def _bucket(self, micros: int) -> int:
+        shift = max(micros.bit_length() - self.significant_bits, 0)
+        return (micros >> shift) << shift
+
+    def _bucket_ceiling(self, floor: int) -> int:
+        return floor + (1 << max(floor.bit_length() - self.significant_bits, 0)) - 1
+
+    def record(self, ms: float):
+        micros = max(int(ms * 1000), 0)
+        bucket = self._bucket(micros)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.sum_ms += ms
+        self.max_us = max(self.max_us, micros)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound (ms) of the bucket holding the q-th value, capped at the max seen."""
+        if not self.count:
+            return 0.0
+        rank = max(q * self.count, 1)
+        seen = 0
+        for floor in sorted(self.buckets):
+            seen += self.buckets[floor]
+            if seen >= rank:
+                return min(self._bucket_ceiling(floor), self.max_us) / 1000
+        return self.max_us / 1000
+
+    def snapshot(self) -> dict:
+        summary = {'count': self.count, 'sum_ms': round(self.sum_ms, 3),
+                   'mean_ms': round(self.sum_ms / self.count, 3) if self.count else 0.0,
+                   'max_ms': self.max_us / 1000}
+        for q in METRICS_QUANTILES:
+            summary[f"p{q * 100:g}_ms"] = round(self.quantile(q), 3)
+        return summary
+
+
+class Metrics:
+    """
+    Counters, gauges and latency histograms for this warm instance.
+
+    Provider calls are recorded per (engine, task type) and phase:
+    connect (TCP/TLS, 0 on a reused connection), ttfb (request sent to
+    first response byte) and total (the call as the router saw it,
+    including rate-limit and concurrency-slot waits). State owned by other
+    components (breakers, caches, pools, queues) is read from their
+    snapshots at scrape time rather than duplicated here - see
+    collect_metrics in main.py.
+    """
+
+    PHASES = ('connect', 'ttfb', 'total')
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.latency = {}      # (engine, task, phase) -> LatencyHistogram
+        self.calls = {}        # (engine, task) -> successful calls
+        self.tokens = {}       # (engine, task) -> completion + prompt tokens
+        self.seconds = {}      # (engine, task) -> seconds spent in those calls
+        self.errors = {}       # engine -> failed calls (throttles excluded)
+        self.throttled = {}    # engine -> rate-limited calls
+        self.waiting = {}      # engine -> calls queued for a concurrency slot
+        self.active = {}       # engine -> calls holding a slot
+        self._lock = threading.Lock()
+
+    def observe_call(self, engine_id: str, task_type: str, latency_ms: float, tokens: int,
+                     timings: dict = None):
+        timings = timings or {}
+        phases = {'connect': timings.get('connect_ms'), 'ttfb': timings.get('ttfb_ms'), 'total': latency_ms}
+        with self._lock:
+            for phase, value in phases.items():
+                if value is None:
+                    continue
+                histogram = self.latency.get((engine_id, task_type, phase))
+                if histogram is None:
+                    histogram = self.latency[(engine_id, task_type, phase)] = LatencyHistogram()
+                histogram.record(value)
+            key = (engine_id, task_type)
+            self.calls[key] = self.calls.get(key, 0) + 1
+            self.tokens[key] = self.tokens.get(key, 0) + (tokens or 0)
+            self.seconds[key] = self.seconds.get(key, 0.0) + latency_ms / 1000
+
+    def count(self, name: str, engine_id: str, delta: int = 1):
+        """Bump a per-engine counter or gauge: errors, throttled, waiting or active."""
+        with self._lock:
+            counter = getattr(self, name)
+            counter[engine_id] = counter.get(engine_id, 0) + delta
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latency = {}
+            for (engine_id, task_type, phase), histogram in sorted(self.latency.items()):
+                latency.setdefault(engine_id, {}).setdefault(task_type, {})[phase] = histogram.snapshot()
+            throughput = {}
+            for (engine_id, task_type), calls in sorted(self.calls.items()):
+                seconds = self.seconds[(engine_id, task_type)]
+                throughput.setdefault(engine_id, {})[task_type] = {
+                    'calls': calls,
+                    'tokens': self.tokens[(engine_id, task_type)],
+                    'seconds': round(seconds, 3),
+                    'tokens_per_s': round(self.tokens[(engine_id, task_type)] / seconds, 1) if seconds else 0.0
+                }
+            errors, throttled = dict(self.errors), dict(self.throttled)
+            waiting, active = dict(self.waiting), dict(self.active)
+
+        return {
+            'uptime_s': round(time.time() - self.started_at, 1),
+            'latency': latency,
+            'throughput': throughput,
+            'errors': errors,
+            'throttled': throttled,
+            'queues': {
+                'engine_waiting': waiting,
+                'engine_active': active,
+            },
+        }
+
+
+metrics = Metrics()
+
+BREAKER_STATE_VALUES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+def _label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(snapshot: dict) -> str:
+    """Prometheus text exposition (format 0.0.4) of a full metrics snapshot (main.collect_metrics)."""
+    lines = []
+
+    def family(name: str, kind: str, help_text: str, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            label_text = ','.join(f'{k}="{_label_value(v)}"' for k, v in labels.items())
+            value = round(value, 6) if isinstance(value, float) else value
+            lines.append(f"{name}{suffix}{{{label_text}}} {value}" if label_text else f"{name}{suffix} {value}")
+
+    latency = []
+    for engine_id, tasks in snapshot['latency'].items():
+        for task_type, phases in tasks.items():
+            for phase, summary in phases.items():
+                labels = {'engine': engine_id, 'task': task_type, 'phase': phase}
+                for q in METRICS_QUANTILES:
+                    latency.append(('', dict(labels, quantile=f"{q:g}"), summary[f"p{q * 100:g}_ms"] / 1000))
+                latency.append(('_sum', labels, summary['sum_ms'] / 1000))
+                latency.append(('_count', labels, summary['count']))
+    family('llm_call_latency_seconds', 'summary',
+           'Provider call latency by phase (connect, ttfb, total) from HDR histograms', latency)
+
+    throughput = [(engine_id, task_type, row) for engine_id, tasks in snapshot['throughput'].items()
+                  for task_type, row in tasks.items()]
+    family('llm_calls_total', 'counter', 'Successful provider calls',
+           [('', {'engine': e, 'task': t}, row['calls']) for e, t, row in throughput])
+    family('llm_tokens_total', 'counter', 'Tokens processed by successful provider calls',
+           [('', {'engine': e, 'task': t}, row['tokens']) for e, t, row in throughput])
+    family('llm_token_throughput', 'gauge', 'Tokens per second of provider call time',
+           [('', {'engine': e, 'task': t}, row['tokens_per_s']) for e, t, row in throughput])
+    family('llm_call_errors_total', 'counter', 'Failed provider calls (rate limiting excluded)',
+           [('', {'engine': e}, n) for e, n in sorted(snapshot['errors'].items())])
+    family('llm_throttled_total', 'counter', 'Provider calls rejected by rate limiting',
+           [('', {'engine': e}, n) for e, n in sorted(snapshot['throttled'].items())])
+
+    breakers = sorted(snapshot['breakers'].items())
+    family('llm_breaker_state', 'gauge', 'Circuit breaker state (0 closed, 1 half-open, 2 open)',
+           [('', {'engine': e}, BREAKER_STATE_VALUES.get(b['state'], 0)) for e, b in breakers])
+    family('llm_breaker_trips', 'gauge', 'Consecutive breaker trips (drives the cool-down)',
+           [('', {'engine': e}, b['trip_count']) for e, b in breakers])
+    family('llm_breaker_failure_rate', 'gauge', 'Failure rate over the breaker window',
+           [('', {'engine': e}, b['failure_rate']) for e, b in breakers])
+
+    caches = sorted(snapshot['caches'].items())
+    family('llm_cache_hits_total', 'counter', 'Response cache hits',
+           [('', {'cache': c}, s['hits']) for c, s in caches])
+    family('llm_cache_misses_total', 'counter', 'Response cache misses',
+           [('', {'cache': c}, s['misses']) for c, s in caches])
+    family('llm_cache_hit_ratio', 'gauge', 'Response cache hit ratio',
+           [('', {'cache': c}, s['hit_ratio']) for c, s in caches])
+
+    coalescing = snapshot['coalescing']
+    family('llm_coalesced_total', 'counter', 'Requests that shared an identical in-flight call',
+           [('', {}, coalescing['coalesced'])])
+    family('llm_coalesce_in_flight', 'gauge', 'Distinct provider calls currently shared',
+           [('', {}, coalescing['in_flight'])])
+
+    queues = snapshot['queues']
+    family('llm_engine_queue_depth', 'gauge', 'Calls waiting for an engine concurrency slot',
+           [('', {'engine': e}, n) for e, n in sorted(queues['engine_waiting'].items())])
+    family('llm_engine_in_flight', 'gauge', 'Calls holding an engine concurrency slot',
+           [('', {'engine': e}, n) for e, n in sorted(queues['engine_active'].items())])
+    family('llm_usage_queue_depth', 'gauge', 'Engine_Usage records not yet written',
+           [('', {}, queues['usage_log'])])
+    family('llm_rate_limit_wait_seconds', 'gauge', 'Wait before the rate limiter admits the next call',
+           [('', {'engine': e}, s['wait_s']) for e, s in sorted(snapshot['rate_limits'].items())])
+
+    pools = [(pool, host, stats) for pool, hosts in snapshot['connection_pools'].items()
+             for host, stats in sorted(hosts.items())]
+    family('llm_pool_connections_opened_total', 'counter', 'Provider connections opened',
+           [('', {'pool': p, 'host': h}, s['opened']) for p, h, s in pools])
+    family('llm_pool_connections_reused_total', 'counter', 'Provider requests on a reused connection',
+           [('', {'pool': p, 'host': h}, s['reused']) for p, h, s in pools])
+    family('llm_pool_connections_idle', 'gauge', 'Idle pooled provider connections',
+           [('', {'pool': p, 'host': h}, s['idle']) for p, h, s in pools])
+
+    family('llm_uptime_seconds', 'gauge', 'Seconds since this instance loaded', [('', {}, snapshot['uptime_s'])])
+    return '\n'.join(lines) + '\n'
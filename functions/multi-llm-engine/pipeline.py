@@ -0,0 +1,292 @@
+"""The request pipeline: plan a prompt request, then execute it through the engines."""
+import time
+from urllib.parse import urlsplit
+from appwrite.services.databases import Databases
+from adapters import acall_engine
+from budgets import budgets, select_budget_engine
+from caches import (
+    SemanticCache, cache_key, response_cache, semantic_cache, semantic_shard_key, store_cached_response,
+)
+from coalescing import single_flight
+from estimation import (
+    call_cost, context_window, estimate_request, estimate_tokens, fits_context, prompt_cache_usage,
+    task_max_tokens, token_family,
+)
+from hedging import acall_engine_hedged
+from prompts import build_prompt, prompt_text
+from routing import (
+    fallback_engine, is_engine_available, record_failure, record_success, route_request,
+    select_long_context_engine,
+)
+from settings import (
+    BUDGET_DOWNGRADE_AT, COALESCE_ENABLED, COALESCE_TASKS, ENGINES, HEDGE_ENABLED, ROUTER_MODE,
+)
+from transport import async_http_pool, engine_loop, offload, remaining_budget
+from usage import log_usage
+
+
+def plan_request(data: dict, databases: Databases, context) -> tuple:
+    """
+    Validate one prompt request, pick its engine and consult the caches.
+
+    Returns (plan, None) when a provider call is needed, or (None, (body,
+    status)) when the request is already answered - a validation error, no
+    engine, or a cache hit (whose body carries the cached 'text').
+    """
+    task_type = data.get('task_type', 'default')
+    agent = data.get('agent')
+    force_engine = data.get('engine')
+    
+    try:
+        prompt = build_prompt(data)
+    except ValueError as e:
+        return None, ({'error': str(e)}, 400)
+    if not prompt:
+        return None, ({'error': 'Missing prompt'}, 400)
+    
+    # Select engine
+    if force_engine and is_engine_available(force_engine):
+        engine_id = force_engine
+        engine = ENGINES[force_engine]
+        fallback_used = False
+    else:
+        engine_id, engine, fallback_used = route_request(
+            task_type, data.get('router', ROUTER_MODE), databases, context
+        )
+    
+    if not engine_id:
+        return None, ({'error': 'No LLM engines available'}, 503)
+    
+    # Size the request before any network call: oversized prompts move to a
+    # long-context engine, or are rejected if nothing can hold them
+    max_tokens = task_max_tokens(task_type, prompt)
+    if not fits_context(engine, prompt, max_tokens):
+        too_large = {
+            'estimated_prompt_tokens': estimate_tokens(prompt_text(prompt), token_family(engine)),
+            'max_tokens': max_tokens
+        }
+        if engine_id == force_engine:
+            return None, (dict(too_large, error=f'Prompt too large for {engine_id}',
+                               context_window=context_window(engine)), 413)
+        long_id, long_engine = select_long_context_engine(task_type, prompt, max_tokens)
+        if not long_id:
+            return None, (dict(too_large, error='Prompt exceeds the context window of every available engine'), 413)
+        context.log(f"Prompt too large for {engine_id}; routing to {long_id}")
+        engine_id, engine, fallback_used = long_id, long_engine, True
+    estimate = estimate_request(engine_id, engine, task_type, prompt, max_tokens)
+    
+    # Near a spend limit, paid engines give way to cheaper ones (even a
+    # forced engine); past it only free engines run
+    budget = budgets.check(task_type, agent, estimate['cost_usd'])
+    if budget and budget['ratio'] >= BUDGET_DOWNGRADE_AT and engine.get('cost_per_1k', 0) > 0:
+        exhausted = budget['ratio'] >= 1
+        cheap_id, cheap = select_budget_engine(engine, prompt, max_tokens, free_only=exhausted)
+        if cheap_id:
+            context.log(f"{budget['scope']} {budget['period']} budget at {budget['ratio']:.0%}; "
+                        f"downgrading {engine_id} to {cheap_id}")
+            budgets.stats['downgraded'] += 1
+            engine_id, engine, fallback_used = cheap_id, cheap, True
+            estimate = estimate_request(engine_id, engine, task_type, prompt, max_tokens)
+        elif exhausted:
+            budgets.stats['rejected'] += 1
+            return None, ({'error': f"{budget['scope']} {budget['period']} budget exhausted", 'budget': budget}, 429)
+    
+    context.log(f"Using engine: {engine['name']} for task: {task_type}")
+    if fallback_used:
+        context.log("(fallback from preferred engine)")
+    
+    if data.get('estimate_only'):
+        return None, ({
+            'success': True,
+            'engine': engine_id,
+            'model': engine['model'],
+            'fallback_used': fallback_used,
+            'estimate': estimate,
+            'budget': budget
+        }, 200)
+    
+    # Serve repeated prompts from cache
+    params = {'max_tokens': max_tokens}
+    allow_cache = data.get('cache', True) is not False
+    use_cache = allow_cache and response_cache.ttl_for(task_type) > 0
+    semantic_threshold = SemanticCache.threshold_for(task_type)
+    use_semantic = allow_cache and semantic_cache is not None and semantic_threshold is not None
+    
+    coalesce = COALESCE_ENABLED and data.get('coalesce', task_type in COALESCE_TASKS) is not False
+    key = cache_key(engine, task_type, prompt, params) if use_cache or coalesce else None
+    
+    cached, cache_tier, similarity = None, None, None
+    if use_cache:
+        cached = response_cache.get(key, databases, context)
+        cache_tier = 'exact'
+    if not cached and use_semantic:
+        cached, similarity = semantic_cache.lookup(
+            semantic_shard_key(engine, task_type, params), prompt_text(prompt), semantic_threshold
+        )
+        cache_tier = 'semantic'
+    
+    if cached:
+        context.log(f"Cache hit ({cache_tier}) for task: {task_type}")
+        log_usage(databases, engine_id, engine, cached, task_type, 0,
+                  fallback_used, context, cache_hit=True, agent=agent)
+        hit = {
+            'success': True,
+            'engine': engine_id,
+            'model': engine['model'],
+            'text': cached['text'],
+            'tokens': cached.get('tokens', 0),
+            'cost_usd': 0.0,
+            'latency_ms': 0,
+            'connection_reused': False,
+            'fallback_used': fallback_used,
+            'cache_hit': True,
+            'cache_tier': cache_tier
+        }
+        if similarity is not None:
+            hit['similarity'] = round(similarity, 4)
+        return None, (hit, 200)
+    
+    return {
+        'task_type': task_type,
+        'prompt': prompt,
+        'engine_id': engine_id,
+        'engine': engine,
+        'fallback_used': fallback_used,
+        'use_cache': use_cache,
+        'use_semantic': use_semantic,
+        'hedge': bool(data.get('hedge', HEDGE_ENABLED)),
+        'max_tokens': max_tokens,
+        'estimate': estimate,
+        'agent': agent,
+        'coalesce_key': key if coalesce else None
+    }, None
+
+
+def _finish_request(databases: Databases, plan: dict, engine_id: str, engine: dict, result: dict,
+                    latency_ms: int, fallback_used: bool, context) -> dict:
+    """Bookkeeping after a successful call; returns the estimate to report."""
+    task_type, prompt, max_tokens = plan['task_type'], plan['prompt'], plan['max_tokens']
+    
+    # Close / keep closed the breaker and update routing stats
+    record_success(engine_id, task_type, latency_ms, result.get('tokens', 0), context, result.get('timings'))
+    
+    # Log usage (with the estimate for the engine that answered)
+    estimate = plan['estimate']
+    if engine_id != plan['engine_id']:
+        estimate = estimate_request(engine_id, engine, task_type, prompt, max_tokens)
+    log_usage(databases, engine_id, engine, result, task_type, 
+             latency_ms, fallback_used, context, estimate=estimate, agent=plan['agent'])
+    
+    store_cached_response(databases, engine_id, engine, task_type, prompt,
+                          {'text': result['text'], 'tokens': result.get('tokens', 0)},
+                          plan['use_cache'], plan['use_semantic'], context, max_tokens)
+    return estimate
+
+
+async def _execute_plan(plan: dict, databases: Databases, context) -> tuple:
+    """Call the planned engine with retry and fallback. Returns (body, status)."""
+    task_type, prompt, max_tokens = plan['task_type'], plan['prompt'], plan['max_tokens']
+    engine_id, engine, fallback_used = plan['engine_id'], plan['engine'], plan['fallback_used']
+    
+    # Call engine with retry
+    max_retries = 3
+    last_error = None
+    hedge = plan['hedge']
+    hedge_engine, hedge_won = None, False
+    
+    for attempt in range(max_retries):
+        try:
+            if hedge:
+                outcome = await acall_engine_hedged(engine_id, engine, prompt, task_type, context, max_tokens)
+                hedge_engine, hedge_won = outcome['hedge_engine'], outcome['hedge_won']
+                if hedge_won:
+                    engine_id, engine, fallback_used = outcome['engine_id'], outcome['engine'], True
+                result, latency_ms = outcome['result'], outcome['latency_ms']
+            else:
+                start_time = time.time()
+                result = await acall_engine(engine_id, engine, prompt, context, max_tokens)
+                latency_ms = int((time.time() - start_time) * 1000)
+            
+            # Breaker and cache writes may touch Appwrite: keep them off the loop
+            estimate = await offload(_finish_request, databases, plan, engine_id, engine, result,
+                                     latency_ms, fallback_used, context)
+            
+            return {
+                'success': True,
+                'engine': engine_id,
+                'model': engine['model'],
+                'text': result['text'],
+                'tokens': result.get('tokens', 0),
+                'cost_usd': call_cost(engine, result),
+                'cached_tokens': prompt_cache_usage(engine, result.get('usage'))[0],
+                'latency_ms': latency_ms,
+                'connection_reused': result.get('connection_reused', False),
+                'connection_pool': async_http_pool.snapshot().get(urlsplit(engine['url']).hostname, {}),
+                'fallback_used': fallback_used,
+                'hedged': hedge_engine is not None,
+                'hedge_engine': hedge_engine,
+                'hedge_won': hedge_won,
+                'cache_hit': False,
+                'estimate': estimate
+            }, 200
+            
+        except Exception as e:
+            last_error = str(e)
+            await offload(record_failure, engine_id, e, context)
+            context.log(f"Engine {engine_id} failed (attempt {attempt + 1}): {last_error}")
+            
+            # Try fallback on failure
+            if attempt < max_retries - 1:
+                fallback_id, fallback = await offload(fallback_engine, engine, prompt, max_tokens)
+                if fallback_id:
+                    engine_id, engine, fallback_used = fallback_id, fallback, True
+                    context.log(f"Falling back to: {engine['name']}")
+    
+    return {
+        'error': f'All engines failed: {last_error}',
+        'last_engine': engine_id
+    }, 500
+
+
+async def aexecute_request(plan: dict, databases: Databases, context) -> tuple:
+    """
+    Execute a plan, sharing one provider call with any identical request
+    already in flight. Followers get the leader's text (or error) marked
+    'coalesced', with tokens and cost zeroed to match their Engine_Usage
+    rows, so batch totals and budgets count the call once.
+    """
+    if not plan.get('coalesce_key'):
+        body, status = await _execute_plan(plan, databases, context)
+        return dict(body, coalesced=False), status
+    
+    start_time = time.time()
+    (body, status), coalesced = await single_flight.run(
+        plan['coalesce_key'], lambda: _execute_plan(plan, databases, context),
+        failed=lambda outcome: outcome[1] != 200
+    )
+    if not coalesced:
+        return dict(body, coalesced=False), status
+    
+    context.log(f"Coalesced with an in-flight {plan['task_type']} request")
+    if status != 200:
+        return dict(body, coalesced=True), status
+    
+    # The leader's body and usage row carry the call; a follower used none of it
+    body = dict(body, coalesced=True, tokens=0, cost_usd=0.0, cached_tokens=0)
+    await offload(log_usage, databases, body['engine'], ENGINES[body['engine']], body, plan['task_type'],
+                  int((time.time() - start_time) * 1000), body['fallback_used'], context, coalesced=True,
+                  agent=plan['agent'])
+    return body, status
+
+
+def execute_request(plan: dict, databases: Databases, context) -> tuple:
+    """Sync facade over aexecute_request."""
+    return engine_loop.run(aexecute_request(plan, databases, context), timeout=remaining_budget())
+
+
+def run_request(data: dict, databases: Databases, context) -> tuple:
+    """Plan and execute one non-streaming prompt request. Returns (body, status)."""
+    plan, answered = plan_request(data, databases, context)
+    if answered:
+        return answered
+    return execute_request(plan, databases, context)
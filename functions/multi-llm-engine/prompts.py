@@ -0,0 +1,96 @@
+"""
+Structured prompt input: plain prompts, system prompts, skills and message
+history.
+
+A request's prompt is either the plain "prompt" string or, when it uses
+system/system_prompt/skills/messages, a dict {'system': str|None,
+'messages': [{'role', 'content'}]}. The system text is the stable prefix
+that providers cache: Anthropic via cache_control, OpenAI-style APIs
+automatically (the prefix always comes first), Gemini via cachedContent
+(see adapters.py).
+"""
+import os
+import re
+import threading
+from settings import AGENTS_DIR
+
+
+_prompt_files = {}
+_prompt_files_lock = threading.Lock()
+_SAFE_NAME = re.compile(r'^[A-Za-z0-9_\-]+(/[A-Za-z0-9_\-]+)*$')
+
+
+def load_prompt_file(relative_path: str) -> str:
+    """Read a file under AGENTS_DIR once per warm instance."""
+    text = _prompt_files.get(relative_path)
+    if text is None:
+        with _prompt_files_lock:
+            text = _prompt_files.get(relative_path)
+            if text is None:
+                with open(os.path.join(AGENTS_DIR, relative_path), encoding='utf-8') as f:
+                    text = _prompt_files[relative_path] = f.read().strip()
+    return text
+
+
+def _resolve_prompt_file(kind: str, name: str, relative_path: str) -> str:
+    if not isinstance(name, str) or not _SAFE_NAME.match(name):
+        raise ValueError(f"Invalid {kind} name: {name!r}")
+    try:
+        return load_prompt_file(relative_path)
+    except FileNotFoundError:
+        raise ValueError(f"Unknown {kind}: {name}")
+
+
+def build_prompt(data: dict):
+    """
+    The request's prompt: the plain string when only "prompt" is given,
+    else a structured dict. Raises ValueError on a non-string prompt,
+    unknown or malformed skills/prompts, or malformed messages.
+    """
+    prompt = data.get('prompt', '')
+    if not isinstance(prompt, str):
+        raise ValueError('prompt must be a string')
+    skills = data.get('skills') or []
+    if not isinstance(skills, list) or not all(isinstance(name, str) for name in skills):
+        raise ValueError('skills must be a list of skill names')
+    if not any(data.get(k) for k in ('system', 'system_prompt', 'skills', 'messages')):
+        return prompt
+    
+    # Stable parts first: the cache key is the exact prefix
+    system_parts = []
+    if data.get('system_prompt'):
+        name = data['system_prompt']
+        system_parts.append(_resolve_prompt_file('system prompt', name, os.path.join('prompts', f"{name}.md")))
+    for name in skills:
+        system_parts.append(_resolve_prompt_file('skill', name, os.path.join('L3_skills', name, 'instructions.md')))
+    if data.get('system'):
+        system_parts.append(str(data['system']))
+    
+    messages = []
+    for message in data.get('messages') or []:
+        if (not isinstance(message, dict) or message.get('role') not in ('user', 'assistant')
+                or not isinstance(message.get('content'), str)):
+            raise ValueError("messages must be [{'role': 'user'|'assistant', 'content': str}, ...]")
+        messages.append({'role': message['role'], 'content': message['content']})
+    if prompt:
+        messages.append({'role': 'user', 'content': prompt})
+    if not messages:
+        raise ValueError('Missing prompt')
+    
+    return {'system': '\n\n---\n\n'.join(system_parts) or None, 'messages': messages}
+
+
+def prompt_text(prompt) -> str:
+    """Flat text of a prompt, for estimates and cache keys."""
+    if isinstance(prompt, str):
+        return prompt
+    parts = [f"system: {prompt['system']}"] if prompt['system'] else []
+    parts.extend(f"{m['role']}: {m['content']}" for m in prompt['messages'])
+    return '\n\n'.join(parts)
+
+
+def split_prompt(prompt) -> tuple:
+    """(system text or None, messages) for any prompt."""
+    if isinstance(prompt, str):
+        return None, [{'role': 'user', 'content': prompt}]
+    return prompt['system'], prompt['messages']
@@ -0,0 +1,164 @@
+"""Per-engine token buckets that honour provider rate-limit headers and Retry-After."""
+import re
+import time
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from settings import (
+    ENGINES, RATE_LIMIT_DEFAULT_BACKOFF_S, RATE_LIMIT_MAX_BACKOFF_S, RATE_LIMIT_MAX_WAIT_S,
+    RATE_LIMIT_OVERRIDES,
+)
+from timestamps import parse_timestamp
+from transport import ProviderHTTPError
+
+
+class EngineThrottled(Exception):
+    """An engine's rate limiter had no capacity within the queueing budget."""
+
+    def __init__(self, engine_id: str, wait_s: float):
+        self.engine_id = engine_id
+        self.wait_s = wait_s
+        super().__init__(f"{engine_id} rate limited (next slot in {wait_s:.1f}s)")
+
+
+def is_rate_limited(error) -> bool:
+    """True for a local throttle or a provider 429 - not a health failure."""
+    return isinstance(error, EngineThrottled) or (
+        isinstance(error, ProviderHTTPError) and error.status == 429)
+
+
+def _reset_seconds(value: str):
+    """
+    Seconds until a provider's rate-limit reset, from any of the formats in
+    use: durations ("1s", "6m0s", "20ms"), delay seconds, epoch seconds or
+    milliseconds, RFC 3339 or HTTP dates. None if unparseable.
+    """
+    value = str(value).strip()
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|s|m|h)', value)
+    if parts and ''.join(n + u for n, u in parts) == value:
+        scale = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+        return sum(float(n) * scale[u] for n, u in parts)
+    try:
+        number = float(value)
+    except ValueError:
+        number = None
+    if number is not None:
+        if number > 1e12:
+            return number / 1000 - time.time()
+        if number > 1e9:
+            return number - time.time()
+        return number
+    for parse in (parse_timestamp, lambda v: parsedate_to_datetime(v).timestamp()):
+        try:
+            return parse(value) - time.time()
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+class RateLimiter:
+    """
+    Token bucket for one engine, plus a block set by the provider.
+
+    With an `rpm` the bucket refills continuously and holds up to `burst`
+    requests (default: ten seconds' worth). Independently, a 429 with
+    Retry-After, or rate-limit headers reporting no requests remaining,
+    block the engine until the provider's reset - even engines without a
+    configured limit.
+    """
+
+    def __init__(self, rpm: float = None, burst: float = None):
+        self.rate = rpm / 60 if rpm else None
+        self.capacity = float(burst or max(1.0, rpm / 6)) if rpm else None
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _wait(self, now: float) -> float:
+        """Seconds until a request may go out (caller holds the lock)."""
+        wait = max(self.blocked_until - now, 0.0)
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def wait_time(self) -> float:
+        with self._lock:
+            return self._wait(time.monotonic())
+
+    def try_acquire(self) -> float:
+        """Take a slot if one is free (returns 0), else the seconds to wait."""
+        with self._lock:
+            wait = self._wait(time.monotonic())
+            if wait <= 0 and self.rate:
+                self.tokens -= 1
+            return max(wait, 0.0)
+
+    def acquire(self, max_wait: float) -> bool:
+        """Take a slot, queueing up to `max_wait` seconds. False if none came free."""
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, max_wait: float) -> bool:
+        """acquire() for the event loop: queues with asyncio.sleep."""
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+    def block(self, seconds: float):
+        seconds = min(max(seconds, 0.0), RATE_LIMIT_MAX_BACKOFF_S)
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            if self.rate:
+                self.tokens = min(self.tokens, 0.0)
+
+    def observe(self, headers: dict, status: int = None):
+        """Apply Retry-After / rate-limit headers from a provider response."""
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        if status == 429:
+            retry_after = _reset_seconds(headers['retry-after']) if 'retry-after' in headers else None
+            self.block(retry_after if retry_after is not None else RATE_LIMIT_DEFAULT_BACKOFF_S)
+            return
+        for header in ('x-ratelimit-remaining-requests', 'anthropic-ratelimit-requests-remaining',
+                       'x-ratelimit-remaining'):
+            if headers.get(header) in ('0', 0):
+                reset_header = header.replace('remaining', 'reset')
+                reset = _reset_seconds(headers[reset_header]) if reset_header in headers else None
+                self.block(reset if reset is not None else RATE_LIMIT_DEFAULT_BACKOFF_S)
+                return
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            wait = self._wait(now)
+            return {
+                'rpm': round(self.rate * 60, 2) if self.rate else None,
+                'tokens': round(self.tokens, 2) if self.rate else None,
+                'blocked_for_s': round(max(self.blocked_until - now, 0.0), 2),
+                'wait_s': round(wait, 2)
+            }
+
+
+rate_limiters = {
+    engine_id: RateLimiter(**RATE_LIMIT_OVERRIDES.get(engine_id, engine.get('rate_limit') or {}))
+    for engine_id, engine in ENGINES.items()
+}
+
+
+def is_engine_throttled(engine_id: str) -> bool:
+    """True when a call would have to queue longer than RATE_LIMIT_MAX_WAIT_S."""
+    return rate_limiters[engine_id].wait_time() > RATE_LIMIT_MAX_WAIT_S
@@ -0,0 +1,304 @@
+"""
+Engine selection: availability, the static fallback chain, long-context
+and latency/cost-aware adaptive routing, and the per-engine call stats
+they read.
+"""
+import random
+import threading
+from collections import deque
+from appwrite.services.databases import Databases
+from appwrite.query import Query
+from adapters import adapter_for
+from breaker import circuit_breakers
+from estimation import fits_context, task_tokens
+from metrics import metrics
+from ratelimit import is_engine_throttled, is_rate_limited, rate_limiters
+from settings import (
+    DATABASE_ID, ENGINES, HEDGE_MIN_SAMPLES, LATENCY_WINDOW, ROUTER_ALLOWED, ROUTER_COST_WEIGHT,
+    ROUTER_DEFAULT_TOKENS, ROUTER_EXPLORE_RATE, ROUTER_LATENCY_PERCENTILE, ROUTER_LATENCY_WEIGHT,
+    ROUTER_MIN_SAMPLES, ROUTER_SEED_ROWS, ROUTING,
+)
+from timestamps import format_timestamp
+
+
+# ============================================================================
+# STATIC ROUTING (availability + fallback chain)
+# ============================================================================
+
+def is_engine_available(engine_id: str) -> bool:
+    """Check if an engine is available (has key and not circuit-broken)."""
+    engine = ENGINES.get(engine_id)
+    if not engine:
+        return False
+    
+    # Check if API key is configured (self-hosted engines may not need one)
+    if not engine.get('key') and adapter_for(engine).requires_key:
+        return False
+    
+    # Circuit breaker (shared state, refreshed at most every few seconds)
+    circuit_breakers.sync()
+    if not circuit_breakers.get(engine_id).allows():
+        return False
+    
+    # Out of rate-limit capacity: route elsewhere before provoking a 429
+    if is_engine_throttled(engine_id):
+        return False
+    
+    return True
+
+
+def select_engine(task_type: str) -> tuple:
+    """Select the best available engine for the task type."""
+    preferred_id = ROUTING.get(task_type, ROUTING['default'])
+    
+    # Try preferred engine
+    if is_engine_available(preferred_id):
+        return preferred_id, ENGINES[preferred_id], False
+    
+    # Walk fallback chain
+    current_id = preferred_id
+    visited = set()
+    
+    while current_id and current_id not in visited:
+        visited.add(current_id)
+        engine = ENGINES.get(current_id)
+        if not engine:
+            break
+        
+        fallback_id = engine.get('fallback')
+        if fallback_id and is_engine_available(fallback_id):
+            return fallback_id, ENGINES[fallback_id], True
+        
+        current_id = fallback_id
+    
+    # Emergency: find any available engine
+    for engine_id, engine in ENGINES.items():
+        if is_engine_available(engine_id):
+            return engine_id, engine, True
+    
+    return None, None, False
+
+
+def select_long_context_engine(task_type: str, prompt, max_tokens: int) -> tuple:
+    """
+    Cheapest-first pick among available engines whose window holds the
+    request, preferring the task's own candidates. (None, None) if none do.
+    """
+    preferred = allowed_engines(task_type)
+    others = sorted((e for e in ENGINES if e not in preferred), key=lambda e: ENGINES[e].get('cost_per_1k', 0))
+    for engine_id in preferred + others:
+        engine = ENGINES[engine_id]
+        if is_engine_available(engine_id) and fits_context(engine, prompt, max_tokens):
+            return engine_id, engine
+    return None, None
+
+
+def fallback_engine(engine: dict, prompt, max_tokens: int) -> tuple:
+    """The engine's configured fallback if it can take this prompt, else (None, None)."""
+    fallback_id = engine.get('fallback')
+    if (fallback_id and is_engine_available(fallback_id)
+            and fits_context(ENGINES[fallback_id], prompt, max_tokens)):
+        return fallback_id, ENGINES[fallback_id]
+    return None, None
+
+
+# ============================================================================
+# CALL STATS (rolling latency and outcome windows per engine)
+# ============================================================================
+
+# Recent successful call latencies per engine (ms), newest last
+engine_latency = {engine_id: deque(maxlen=LATENCY_WINDOW) for engine_id in ENGINES}
+
+# Recent call outcomes per engine (True = success), for error rates
+engine_outcomes = {engine_id: deque(maxlen=LATENCY_WINDOW) for engine_id in ENGINES}
+
+
+def record_latency(engine_id: str, latency_ms: int):
+    """Add a latency sample to the engine's rolling window."""
+    engine_latency[engine_id].append(latency_ms)
+
+
+def latency_percentile(engine_id: str, pct: float, min_samples: int = HEDGE_MIN_SAMPLES):
+    """Percentile of the engine's recent latencies, or None with too few samples."""
+    samples = engine_latency.get(engine_id)
+    if not samples or len(samples) < min_samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+# ============================================================================
+# ADAPTIVE ROUTING
+# ============================================================================
+
+def _record_sample(engine_id: str, task_type: str, latency_ms: int, tokens: int):
+    record_latency(engine_id, latency_ms)
+    engine_outcomes[engine_id].append(True)
+    task_tokens.setdefault((engine_id, task_type), deque(maxlen=50)).append(tokens)
+
+
+def record_success(engine_id: str, task_type: str, latency_ms: int, tokens: int, context=None,
+                   timings: dict = None):
+    """Feed a successful provider call into the routing stats, breaker and metrics."""
+    _record_sample(engine_id, task_type, latency_ms, tokens)
+    metrics.observe_call(engine_id, task_type, latency_ms, tokens, timings)
+    if circuit_breakers.get(engine_id).on_success():
+        if context:
+            context.log(f"Circuit closed for {engine_id}")
+        circuit_breakers.persist(engine_id, context)
+
+
+def record_failure(engine_id: str, error=None, context=None):
+    """
+    Feed a failed provider call into the routing stats and breaker.
+    
+    Rate limiting (a 429 or a local throttle) says nothing about the
+    engine's health, so it neither counts as an error nor trips the
+    breaker; the rate limiter already steers traffic away.
+    """
+    if is_rate_limited(error):
+        metrics.count('throttled', engine_id)
+        if context:
+            context.log(f"Engine {engine_id} throttled for {rate_limiters[engine_id].wait_time():.1f}s")
+        return
+    engine_outcomes[engine_id].append(False)
+    metrics.count('errors', engine_id)
+    breaker = circuit_breakers.get(engine_id)
+    if breaker.on_failure(str(error) if error is not None else None):
+        if context:
+            context.log(f"Circuit opened for {engine_id} until {format_timestamp(breaker.open_until)}")
+        circuit_breakers.persist(engine_id, context)
+
+
+def allowed_engines(task_type: str) -> list:
+    """Engines the adaptive router may pick for a task, static choice first."""
+    preferred_id = ROUTING.get(task_type, ROUTING['default'])
+    allowed = [preferred_id]
+    
+    current_id = preferred_id
+    while current_id:
+        current_id = ENGINES.get(current_id, {}).get('fallback')
+        if current_id and current_id not in allowed:
+            allowed.append(current_id)
+        else:
+            break
+    
+    for engine_id, engine in ENGINES.items():
+        if task_type in engine.get('best_for', []) and engine_id not in allowed:
+            allowed.append(engine_id)
+    for engine_id in ROUTER_ALLOWED.get(task_type, []):
+        if engine_id in ENGINES and engine_id not in allowed:
+            allowed.append(engine_id)
+    
+    return allowed
+
+
+def engine_error_rate(engine_id: str) -> float:
+    outcomes = engine_outcomes[engine_id]
+    return (len(outcomes) - sum(outcomes)) / len(outcomes) if outcomes else 0.0
+
+
+def expected_cost(engine_id: str, task_type: str) -> float:
+    """Expected USD per request, from this engine's token use on this task."""
+    samples = task_tokens.get((engine_id, task_type))
+    if not samples:
+        # Fall back to the engine's average across all tasks
+        samples = [t for (e, _), window in task_tokens.items() if e == engine_id for t in window]
+    tokens = sum(samples) / len(samples) if samples else ROUTER_DEFAULT_TOKENS
+    return (tokens / 1000) * ENGINES[engine_id].get('cost_per_1k', 0)
+
+
+def routing_score(engine_id: str, task_type: str):
+    """
+    Objective to minimize: weighted cost + tail latency, inflated by the
+    chance of having to retry. None when the engine has too little history.
+    """
+    latency_ms = latency_percentile(engine_id, ROUTER_LATENCY_PERCENTILE, ROUTER_MIN_SAMPLES)
+    if latency_ms is None:
+        return None
+    # Time spent queueing for rate-limit capacity counts as latency
+    base = (ROUTER_COST_WEIGHT * expected_cost(engine_id, task_type)
+            + ROUTER_LATENCY_WEIGHT * (latency_ms / 1000 + rate_limiters[engine_id].wait_time()))
+    return base / max(1 - engine_error_rate(engine_id), 0.05)
+
+
+def select_engine_adaptive(task_type: str) -> tuple:
+    """
+    Pick the allowed engine with the best routing score.
+
+    Engines without enough history get a small exploration share so they
+    can earn a score; if nothing has history yet, this defers to the
+    static table.
+    """
+    candidates = [e for e in allowed_engines(task_type) if is_engine_available(e)]
+    if not candidates:
+        return select_engine(task_type)
+    
+    scored = [(routing_score(e, task_type), e) for e in candidates]
+    unscored = [e for score, e in scored if score is None]
+    scored = [(score, e) for score, e in scored if score is not None]
+    
+    if not scored:
+        return select_engine(task_type)
+    if unscored and random.random() < ROUTER_EXPLORE_RATE:
+        engine_id = random.choice(unscored)
+    else:
+        engine_id = min(scored)[1]
+    
+    return engine_id, ENGINES[engine_id], False
+
+
+_router_seeded = False
+_router_seed_lock = threading.Lock()
+
+
+def seed_router_stats(databases: Databases, context):
+    """
+    Warm the rolling stats from recent Engine_Usage rows, once per process,
+    so a cold instance doesn't route blind.
+    """
+    global _router_seeded
+    if _router_seeded:
+        return
+    with _router_seed_lock:
+        if _router_seeded:
+            return
+        _router_seeded = True
+        try:
+            rows = databases.list_documents(DATABASE_ID, 'Engine_Usage', [
+                Query.order_desc('created_at'),
+                Query.limit(ROUTER_SEED_ROWS),
+                Query.select(['engine', 'task_type', 'tokens_used', 'latency_ms', 'cache_hit'])
+            ])
+        except Exception as e:
+            context.log(f"Router seed failed: {e}")
+            return
+        
+        seeded = 0
+        for doc in reversed(rows.get('documents', [])):
+            engine_id = doc.get('engine')
+            if engine_id not in ENGINES or doc.get('cache_hit'):
+                continue
+            _record_sample(engine_id, doc.get('task_type', 'default'),
+                           doc.get('latency_ms', 0), doc.get('tokens_used', 0))
+            seeded += 1
+        context.log(f"Router seeded with {seeded} Engine_Usage rows")
+
+
+def route_request(task_type: str, mode: str, databases: Databases, context) -> tuple:
+    """Select an engine under the given router mode. Returns select_engine's tuple."""
+    static_choice = select_engine(task_type)
+    if mode not in ('adaptive', 'dry_run'):
+        return static_choice
+    
+    seed_router_stats(databases, context)
+    adaptive_choice = select_engine_adaptive(task_type)
+    
+    if mode == 'dry_run':
+        if adaptive_choice[0] != static_choice[0]:
+            scores = {e: routing_score(e, task_type) for e in allowed_engines(task_type)}
+            context.log(f"Router dry-run for {task_type}: static={static_choice[0]} "
+                        f"adaptive={adaptive_choice[0]} scores={scores}")
+        return static_choice
+    
+    return adaptive_choice if adaptive_choice[0] else static_choice
@@ -0,0 +1,384 @@
+"""
+Environment and tuning for the engine: Appwrite, provider keys, the engine
+catalogue and task routing, and every LLM_* knob the subsystems read.
+"""
+import os
+import json
+
+
+# Environment
+APPWRITE_ENDPOINT = os.environ.get('APPWRITE_ENDPOINT', 'https://fra.cloud.appwrite.io/v1')
+APPWRITE_PROJECT_ID = os.environ.get('APPWRITE_PROJECT_ID')
+APPWRITE_API_KEY = os.environ.get('APPWRITE_API_KEY')
+DATABASE_ID = os.environ.get('DATABASE_ID', '693703ef001133c62d78')
+
+# LLM API Keys
+XAI_API_KEY = os.environ.get('XAI_API_KEY', '')
+OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
+ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY', '')
+GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY', '')
+OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY', '')
+
+# Engine definitions with cost metadata
+ENGINES = {
+    # === Premium Engines ===
+    'grok': {
+        'name': 'Grok (xAI)',
+        'url': 'https://api.x.ai/v1/chat/completions',
+        'key': XAI_API_KEY,
+        'model': 'grok-2',
+        'context_window': 131072,
+        'cost_per_1k': 0.002,
+        'best_for': ['x_post', 'x_thread', 'twitter', 'meme', 'edgy'],
+        'fallback': 'mistral',
+        'type': 'openai'
+    },
+    'chatgpt': {
+        'name': 'ChatGPT (OpenAI)',
+        'url': 'https://api.openai.com/v1/chat/completions',
+        'key': OPENAI_API_KEY,
+        'model': 'gpt-4o',
+        'context_window': 128000,
+        'cost_per_1k': 0.005,
+        'best_for': ['linkedin', 'newsletter', 'professional', 'formal'],
+        'fallback': 'qwen',
+        'type': 'openai'
+    },
+    'claude': {
+        'name': 'Claude (Anthropic)',
+        'url': 'https://api.anthropic.com/v1/messages',
+        'key': ANTHROPIC_API_KEY,
+        'model': 'claude-3-5-sonnet-20241022',
+        'context_window': 200000,
+        'cost_per_1k': 0.003,
+        'best_for': ['prd', 'code', 'security', 'analysis', 'long_form'],
+        'fallback': 'deepseek',
+        'type': 'anthropic'
+    },
+    'gemini': {
+        'name': 'Gemini (Google)',
+        'url': f'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GOOGLE_API_KEY}',
+        'key': GOOGLE_API_KEY,
+        'model': 'gemini-2.0-flash',
+        'context_window': 1048576,
+        'cost_per_1k': 0.00035,
+        'best_for': ['general', 'summary', 'qa'],
+        'fallback': 'qwen',
+        'type': 'gemini'
+    },
+    
+    # === OpenRouter Models (FREE or very cheap) ===
+    'qwen': {
+        'name': 'Qwen 2.5 (OpenRouter)',
+        'url': 'https://openrouter.ai/api/v1/chat/completions',
+        'key': OPENROUTER_API_KEY,
+        'model': 'qwen/qwen-2.5-72b-instruct:free',
+        'context_window': 32768,
+        'cost_per_1k': 0.0,  # FREE tier
+        'best_for': ['simple', 'translation', 'summary'],
+        'fallback': 'mistral',
+        'type': 'openrouter',
+        'rate_limit': {'rpm': 20}  # OpenRouter free-tier limit
+    },
+    'mistral': {
+        'name': 'Mistral Large (OpenRouter)',
+        'url': 'https://openrouter.ai/api/v1/chat/completions',
+        'key': OPENROUTER_API_KEY,
+        'model': 'mistralai/mistral-large-2411',
+        'context_window': 131072,
+        'cost_per_1k': 0.002,
+        'best_for': ['reasoning', 'multilingual', 'european'],
+        'fallback': 'gemini',
+        'type': 'openrouter'
+    },
+    'deepseek': {
+        'name': 'DeepSeek V3 (OpenRouter)',
+        'url': 'https://openrouter.ai/api/v1/chat/completions',
+        'key': OPENROUTER_API_KEY,
+        'model': 'deepseek/deepseek-chat',
+        'context_window': 65536,
+        'cost_per_1k': 0.00014,  # VERY cheap
+        'best_for': ['code', 'math', 'reasoning', 'chinese'],
+        'fallback': 'qwen',
+        'type': 'openrouter'
+    },
+    'llama': {
+        'name': 'Llama 3.3 70B (OpenRouter)',
+        'url': 'https://openrouter.ai/api/v1/chat/completions',
+        'key': OPENROUTER_API_KEY,
+        'model': 'meta-llama/llama-3.3-70b-instruct:free',
+        'context_window': 131072,
+        'cost_per_1k': 0.0,  # FREE tier
+        'best_for': ['general', 'chat', 'instruction'],
+        'fallback': 'qwen',
+        'type': 'openrouter',
+        'rate_limit': {'rpm': 20}  # OpenRouter free-tier limit
+    },
+    'gemma': {
+        'name': 'Gemma 2 27B (OpenRouter)',
+        'url': 'https://openrouter.ai/api/v1/chat/completions',
+        'key': OPENROUTER_API_KEY,
+        'model': 'google/gemma-2-27b-it:free',
+        'context_window': 8192,
+        'cost_per_1k': 0.0,  # FREE 
+        'best_for': ['simple', 'formatting', 'spelling'],
+        'fallback': None,
+        'type': 'openrouter',
+        'rate_limit': {'rpm': 20}  # OpenRouter free-tier limit
+    }
+}
+
+# Engines added or overridden by config, e.g. a self-hosted vLLM server:
+# LLM_ENGINES='{"local-llama": {"type": "vllm", "model": "meta-llama/Llama-3.1-8B-Instruct",
+#   "url": "http://10.0.0.5:8000/v1/chat/completions", "context_window": 8192}}'
+# "type" picks the adapter (openai, openrouter, anthropic, gemini, vllm,
+# ollama); "key_env" names the env var holding its API key. Fields given
+# for an existing engine replace just those fields.
+for _engine_id, _config in json.loads(os.environ.get('LLM_ENGINES', '{}')).items():
+    _config = dict(_config)
+    if 'key_env' in _config:
+        _config['key'] = os.environ.get(_config.pop('key_env'), '')
+    _base = ENGINES.get(_engine_id) or {
+        'name': _engine_id, 'key': '', 'cost_per_1k': 0.0, 'best_for': [], 'fallback': None, 'type': 'openai'
+    }
+    ENGINES[_engine_id] = dict(_base, **_config)
+
+# Task-to-engine routing (cost-optimized)
+ROUTING = {
+    # Premium tasks → Premium engines
+    'x_post': 'grok',
+    'x_thread': 'grok',
+    'twitter': 'grok',
+    'linkedin': 'chatgpt',
+    'linkedin_newsletter': 'chatgpt',
+    'newsletter': 'chatgpt',
+    
+    # Code/Analysis → Claude or DeepSeek (cheap)
+    'prd': 'claude',
+    'code': 'deepseek',       # DeepSeek is great for code + cheap
+    'security_audit': 'claude',
+    'analysis': 'claude',
+    
+    # General tasks → Free/Cheap models
+    'blog': 'qwen',           # Qwen is free
+    'summary': 'llama',       # Llama is free
+    'qa': 'gemini',
+    'general': 'gemini',
+    'simple': 'gemma',        # Gemma is free
+    
+    # Formatting → Cheapest
+    'spelling': 'gemma',
+    'formatting': 'gemma',
+    'translation': 'qwen',
+    
+    'default': 'gemini'
+}
+# Point tasks at other engines (including LLM_ENGINES ones):
+# LLM_ROUTING='{"summary": "local-llama"}'
+ROUTING.update(json.loads(os.environ.get('LLM_ROUTING', '{}')))
+
+# Completion length (max_tokens) requested per task type; unlisted tasks get
+# MAX_TOKENS. Override with LLM_TASK_MAX_TOKENS='{"blog": 4000}'.
+MAX_TOKENS = 2000
+TASK_MAX_TOKENS = {
+    'x_post': 300,
+    'twitter': 300,
+    'x_thread': 1200,
+    'linkedin': 800,
+    'linkedin_newsletter': 2500,
+    'newsletter': 2500,
+    'prd': 4000,
+    'code': 4000,
+    'security_audit': 3000,
+    'analysis': 3000,
+    'blog': 3000,
+    'summary': 600,
+    'qa': 800,
+    'simple': 400,
+}
+TASK_MAX_TOKENS.update(json.loads(os.environ.get('LLM_TASK_MAX_TOKENS', '{}')))
+# Rewrite tasks answer with about as much text as they were given, so their
+# budget is sized from the prompt (still capped by TASK_MAX_TOKENS/MAX_TOKENS)
+ECHO_TASKS = ('spelling', 'formatting', 'translation')
+
+# Token estimation: characters per token for each tokenizer family, used
+# before dispatch. Estimates are padded by TOKEN_SAFETY_MARGIN when checking
+# context windows; engines without a 'context_window' are assumed to have
+# DEFAULT_CONTEXT_WINDOW.
+TOKEN_CHARS_PER_TOKEN = {
+    'openai': 4.0,
+    'anthropic': 3.5,
+    'gemini': 4.0,
+    'llama': 3.8,
+    'qwen': 3.7,
+    'mistral': 3.5,
+    'deepseek': 3.7,
+}
+TOKEN_MESSAGE_OVERHEAD = 8
+TOKEN_SAFETY_MARGIN = float(os.environ.get('LLM_TOKEN_SAFETY_MARGIN', '1.1'))
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Response cache: only task types listed here are cached (TTL in seconds).
+# Override with LLM_CACHE_TTLS='{"summary": 600, ...}'; a TTL of 0 disables a task.
+CACHE_TTLS = {
+    'spelling': 7 * 86400,
+    'formatting': 7 * 86400,
+    'translation': 7 * 86400,
+    'summary': 86400,
+}
+CACHE_TTLS.update(json.loads(os.environ.get('LLM_CACHE_TTLS', '{}')))
+CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', '512'))
+CACHE_PERSIST = os.environ.get('LLM_CACHE_PERSIST', '').lower() in ('1', 'true', 'yes')
+CACHE_COLLECTION_ID = os.environ.get('LLM_CACHE_COLLECTION', 'Engine_Cache')
+
+# Semantic (near-duplicate) cache - opt-in with LLM_SEMANTIC_CACHE=1.
+# Only task types with a similarity threshold are eligible; override with
+# LLM_SEMANTIC_THRESHOLDS='{"qa": 0.97}'.
+SEMANTIC_CACHE_ENABLED = os.environ.get('LLM_SEMANTIC_CACHE', '').lower() in ('1', 'true', 'yes')
+SEMANTIC_CACHE_THRESHOLDS = {
+    'qa': 0.95,
+    'summary': 0.93,
+}
+SEMANTIC_CACHE_THRESHOLDS.update(json.loads(os.environ.get('LLM_SEMANTIC_THRESHOLDS', '{}')))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_SEMANTIC_CACHE_MAX_ENTRIES', '5000'))
+SEMANTIC_CACHE_TTL = int(os.environ.get('LLM_SEMANTIC_CACHE_TTL', '21600'))
+SEMANTIC_CACHE_DIM = int(os.environ.get('LLM_SEMANTIC_CACHE_DIM', '64'))
+SEMANTIC_CACHE_MAX_PROMPT_CHARS = 8000
+
+# Hedged requests - on per request with "hedge": true, or for every
+# request with LLM_HEDGE=1. The hedge fires once the primary has been
+# running longer than this percentile of its recent latencies.
+HEDGE_ENABLED = os.environ.get('LLM_HEDGE', '').lower() in ('1', 'true', 'yes')
+HEDGE_PERCENTILE = float(os.environ.get('LLM_HEDGE_PERCENTILE', '95'))
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY_MS = int(os.environ.get('LLM_HEDGE_DEFAULT_DELAY_MS', '8000'))
+HEDGE_MIN_DELAY_MS = 250
+# Most a hedge engine may cost per 1K tokens, by task type
+HEDGE_COST_CEILING = {
+    'default': 0.0005,   # deepseek, qwen, llama, gemma, gemini
+}
+HEDGE_COST_CEILING.update(json.loads(os.environ.get('LLM_HEDGE_COST_CEILING', '{}')))
+LATENCY_WINDOW = 200
+
+# Adaptive routing: 'static' (ROUTING table only), 'adaptive', or 'dry_run'
+# (route statically but log what the adaptive router would have picked).
+# A request can override with "router": "adaptive" etc.
+ROUTER_MODE = os.environ.get('LLM_ROUTER_MODE', 'static')
+ROUTER_COST_WEIGHT = float(os.environ.get('LLM_ROUTER_COST_WEIGHT', '100'))        # per USD
+ROUTER_LATENCY_WEIGHT = float(os.environ.get('LLM_ROUTER_LATENCY_WEIGHT', '1'))    # per second
+ROUTER_LATENCY_PERCENTILE = float(os.environ.get('LLM_ROUTER_LATENCY_PERCENTILE', '90'))
+ROUTER_MIN_SAMPLES = 10
+ROUTER_EXPLORE_RATE = float(os.environ.get('LLM_ROUTER_EXPLORE_RATE', '0.05'))
+ROUTER_SEED_ROWS = int(os.environ.get('LLM_ROUTER_SEED_ROWS', '500'))
+ROUTER_DEFAULT_TOKENS = 1000
+# Extra engines a task may be routed to, beyond its ROUTING entry, fallback
+# chain and best_for matches: LLM_ROUTER_ALLOWED='{"blog": ["mistral"]}'
+ROUTER_ALLOWED = json.loads(os.environ.get('LLM_ROUTER_ALLOWED', '{}'))
+
+# Engine_Usage logging runs in the background: records are queued and
+# written in batches of LLM_USAGE_BATCH_SIZE or every LLM_USAGE_FLUSH_S
+# seconds. Batches that can't reach Appwrite go to the spill file and are
+# replayed once it is reachable again.
+USAGE_BATCH_SIZE = int(os.environ.get('LLM_USAGE_BATCH_SIZE', '20'))
+USAGE_FLUSH_S = float(os.environ.get('LLM_USAGE_FLUSH_S', '2'))
+USAGE_QUEUE_MAX = int(os.environ.get('LLM_USAGE_QUEUE_MAX', '5000'))
+USAGE_SPILL_PATH = os.environ.get('LLM_USAGE_SPILL_PATH', '/tmp/engine_usage_spill.jsonl')
+USAGE_SHUTDOWN_TIMEOUT_S = 5.0
+
+# Single-flight: concurrent requests with the same cache key share one
+# provider call. Only task types listed here coalesce by default - creative
+# tasks (x_post, blog, ...) would otherwise hand every caller the same text.
+# Override with LLM_COALESCE_TASKS='spelling,summary,...'; a request can opt
+# in or out with "coalesce": true/false.
+COALESCE_ENABLED = os.environ.get('LLM_COALESCE', '1').lower() in ('1', 'true', 'yes')
+COALESCE_TASKS = {'spelling', 'formatting', 'translation', 'summary', 'qa', 'code', 'security_audit', 'analysis'}
+if os.environ.get('LLM_COALESCE_TASKS') is not None:
+    COALESCE_TASKS = {t.strip() for t in os.environ['LLM_COALESCE_TASKS'].split(',') if t.strip()}
+
+# In-process metrics (action "metrics"). Latencies go into HDR-style
+# histograms whose buckets keep METRICS_SIGNIFICANT_BITS of precision
+# (~3% relative error at 5 bits), reported at METRICS_QUANTILES.
+METRICS_SIGNIFICANT_BITS = int(os.environ.get('LLM_METRICS_SIGNIFICANT_BITS', '5'))
+METRICS_QUANTILES = (0.5, 0.9, 0.99)
+
+# Spend budgets in USD per UTC day/month: overall, per task type and per
+# calling agent ("agent" in the request), e.g. LLM_BUDGETS='{"tasks":
+# {"code": {"daily": 5}}, "agents": {"cmo": {"monthly": 40}}}'. Past
+# BUDGET_DOWNGRADE_AT of a limit, paid engines give way to the cheapest of
+# BUDGET_DOWNGRADE_ENGINES; at the limit only free engines may run.
+BUDGETS = {
+    'daily': float(os.environ.get('LLM_BUDGET_DAILY_USD', '25')),
+    'monthly': float(os.environ.get('LLM_BUDGET_MONTHLY_USD', '500')),
+    'tasks': {},
+    'agents': {},
+}
+BUDGETS.update(json.loads(os.environ.get('LLM_BUDGETS', '{}')))
+BUDGET_DOWNGRADE_AT = float(os.environ.get('LLM_BUDGET_DOWNGRADE_AT', '0.8'))
+BUDGET_DOWNGRADE_ENGINES = [e.strip() for e in os.environ.get('LLM_BUDGET_DOWNGRADE_ENGINES', 'deepseek,qwen').split(',')
+                            if e.strip()]
+BUDGET_RECONCILE_S = float(os.environ.get('LLM_BUDGET_RECONCILE_S', '300'))
+BUDGET_RECONCILE_PAGE = 500
+
+# Batch requests ("prompts": [...]) and per-engine concurrency. Up to
+# BATCH_WORKERS items are planned (cache lookups) at once; their provider
+# calls then run on the engine loop. An engine may set its own
+# 'max_concurrency'; the rest share ENGINE_MAX_CONCURRENCY.
+BATCH_WORKERS = int(os.environ.get('LLM_BATCH_WORKERS', '8'))
+BATCH_MAX_ITEMS = int(os.environ.get('LLM_BATCH_MAX_ITEMS', '100'))
+ENGINE_MAX_CONCURRENCY = int(os.environ.get('LLM_ENGINE_MAX_CONCURRENCY', '4'))
+
+# Rate limiting: engines with a 'rate_limit' ({'rpm': N, 'burst': M}) get a
+# token bucket; override or add limits with LLM_RATE_LIMITS='{"qwen": {"rpm": 10}}'.
+# A call waits up to LLM_RATE_LIMIT_MAX_WAIT_S for capacity before falling
+# back. A 429 without Retry-After blocks the engine for the default backoff.
+RATE_LIMIT_OVERRIDES = json.loads(os.environ.get('LLM_RATE_LIMITS', '{}'))
+RATE_LIMIT_MAX_WAIT_S = float(os.environ.get('LLM_RATE_LIMIT_MAX_WAIT_S', '2'))
+RATE_LIMIT_DEFAULT_BACKOFF_S = float(os.environ.get('LLM_RATE_LIMIT_DEFAULT_BACKOFF_S', '10'))
+RATE_LIMIT_MAX_BACKOFF_S = 3600.0
+
+# Structured prompts: "system_prompt" and "skills" name files under
+# LLM_AGENTS_DIR (prompts/<name>.md, L3_skills/<name>/instructions.md).
+# They are read once per warm instance and form the cacheable prefix.
+AGENTS_DIR = os.environ.get(
+    'LLM_AGENTS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'agents')
+)
+# Gemini needs an explicit cachedContent object, which has a minimum size
+# and costs a request to create, so only prefixes this large get one
+GEMINI_CACHE_MIN_TOKENS = int(os.environ.get('LLM_GEMINI_CACHE_MIN_TOKENS', '4096'))
+GEMINI_CACHE_TTL_S = int(os.environ.get('LLM_GEMINI_CACHE_TTL_S', '3600'))
+# Share of the input price saved on cached prompt tokens, by tokenizer
+# family; Anthropic also bills cache writes at +25%
+CACHED_TOKEN_DISCOUNT = {
+    'openai': 0.5,
+    'anthropic': 0.9,
+    'gemini': 0.75,
+    'deepseek': 0.9,
+    'default': 0.5,
+}
+ANTHROPIC_CACHE_WRITE_PREMIUM = 0.25
+
+# Connection pool tuning
+POOL_MAX_PER_HOST = int(os.environ.get('LLM_POOL_MAX_PER_HOST', '4'))
+POOL_IDLE_TIMEOUT = float(os.environ.get('LLM_POOL_IDLE_TIMEOUT', '90'))
+POOL_ACQUIRE_TIMEOUT = float(os.environ.get('LLM_POOL_ACQUIRE_TIMEOUT', '10'))
+# Non-streaming calls run on the asyncio core, where an open connection costs
+# a socket rather than a thread, so its per-host cap can be much higher
+ASYNC_POOL_MAX_PER_HOST = int(os.environ.get('LLM_ASYNC_POOL_MAX_PER_HOST', '32'))
+# Wall-clock budget for one invocation's engine calls: a little under the
+# function timeout in appwrite.json (60s), so a stuck call is cancelled and
+# answered with a 504 before the runtime kills the execution
+REQUEST_TIMEOUT_S = float(os.environ.get('LLM_REQUEST_TIMEOUT_S', '55'))
+
+# Circuit breaker: trips on LLM_BREAKER_CONSECUTIVE failures in a row, or
+# a failure rate at/above LLM_BREAKER_FAILURE_RATE over the sliding window.
+# Cool-down doubles on each re-trip up to LLM_BREAKER_MAX_COOLDOWN_S.
+BREAKER_WINDOW_S = float(os.environ.get('LLM_BREAKER_WINDOW_S', '60'))
+BREAKER_MIN_REQUESTS = int(os.environ.get('LLM_BREAKER_MIN_REQUESTS', '5'))
+BREAKER_FAILURE_RATE = float(os.environ.get('LLM_BREAKER_FAILURE_RATE', '0.5'))
+BREAKER_CONSECUTIVE = int(os.environ.get('LLM_BREAKER_CONSECUTIVE', '3'))
+BREAKER_BASE_COOLDOWN_S = float(os.environ.get('LLM_BREAKER_BASE_COOLDOWN_S', '30'))
+BREAKER_MAX_COOLDOWN_S = float(os.environ.get('LLM_BREAKER_MAX_COOLDOWN_S', '900'))
+# A breaker that has stayed closed this long forgets its trip history
+BREAKER_RESET_AFTER_S = float(os.environ.get('LLM_BREAKER_RESET_AFTER_S', '1800'))
+# How long the shared Engine_Status view is trusted before re-reading it
+BREAKER_SYNC_TTL_S = float(os.environ.get('LLM_BREAKER_SYNC_TTL_S', '5'))
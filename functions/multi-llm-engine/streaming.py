@@ -0,0 +1,123 @@
+"""Streaming (server-sent events) requests with fallback until the first chunk."""
+import json
+import time
+from appwrite.services.databases import Databases
+from adapters import adapter_for, request_template
+from caches import store_cached_response
+from estimation import call_cost, estimate_request, prompt_cache_usage
+from ratelimit import EngineThrottled, rate_limiters
+from routing import fallback_engine, record_failure, record_success
+from settings import MAX_TOKENS, RATE_LIMIT_MAX_WAIT_S
+from transport import ProviderHTTPError, request_scope
+from usage import log_usage
+
+
+def stream_engine(engine_id: str, engine: dict, prompt, context, max_tokens: int = MAX_TOKENS):
+    """Stream from an engine through its adapter, under its rate limit."""
+    adapter = adapter_for(engine)
+    limiter = rate_limiters[engine_id]
+    if not limiter.acquire(RATE_LIMIT_MAX_WAIT_S):
+        raise EngineThrottled(engine_id, limiter.wait_time())
+    
+    chunks = adapter.stream(request_template(engine_id, engine),
+                            adapter.payload(engine, prompt, max_tokens, context))
+    
+    try:
+        first = next(chunks)
+    except ProviderHTTPError as e:
+        limiter.observe(e.headers, e.status)
+        raise
+    limiter.observe(getattr(request_scope, 'response_headers', None))
+    yield first
+    yield from chunks
+
+
+def generate_stream(databases: Databases, engine_id: str, engine: dict, prompt,
+                    task_type: str, fallback_used: bool, context, use_cache: bool = True,
+                    use_semantic: bool = False, max_tokens: int = MAX_TOKENS, estimate: dict = None,
+                    agent: str = None):
+    """
+    Yield normalized chunks for one request, falling back between engines
+    until the first chunk arrives. Usage is logged (and the full text
+    cached) once the stream ends.
+    """
+    max_retries = 3
+    last_error = None
+    
+    for attempt in range(max_retries):
+        start_time = time.time()
+        index = 0
+        ttft_ms = None
+        parts = []
+        try:
+            for chunk in stream_engine(engine_id, engine, prompt, context, max_tokens):
+                if chunk['type'] == 'delta':
+                    if ttft_ms is None:
+                        ttft_ms = int((time.time() - start_time) * 1000)
+                    parts.append(chunk['text'])
+                    yield {'type': 'delta', 'engine': engine_id, 'index': index, 'text': chunk['text']}
+                    index += 1
+                    continue
+                
+                latency_ms = int((time.time() - start_time) * 1000)
+                record_success(engine_id, task_type, latency_ms, chunk.get('tokens', 0), context,
+                               chunk.get('timings'))
+                if attempt > 0:
+                    estimate = estimate_request(engine_id, engine, task_type, prompt, max_tokens)
+                log_usage(databases, engine_id, engine, chunk, task_type,
+                          latency_ms, fallback_used, context, estimate=estimate, agent=agent)
+                store_cached_response(databases, engine_id, engine, task_type, prompt,
+                                      {'text': ''.join(parts), 'tokens': chunk.get('tokens', 0)},
+                                      use_cache, use_semantic, context, max_tokens)
+                yield {
+                    'type': 'done',
+                    'engine': engine_id,
+                    'model': engine['model'],
+                    'chunks': index,
+                    'tokens': chunk.get('tokens', 0),
+                    'cost_usd': call_cost(engine, chunk),
+                    'cached_tokens': prompt_cache_usage(engine, chunk.get('usage'))[0],
+                    'finish_reason': chunk.get('finish_reason'),
+                    'ttft_ms': ttft_ms if ttft_ms is not None else latency_ms,
+                    'latency_ms': latency_ms,
+                    'connection_reused': chunk.get('connection_reused', False),
+                    'fallback_used': fallback_used,
+                    'cache_hit': False
+                }
+            return
+        except Exception as e:
+            last_error = str(e)
+            record_failure(engine_id, e, context)
+            context.log(f"Engine {engine_id} stream failed (attempt {attempt + 1}): {last_error}")
+            
+            # Once text has reached the caller we can't splice in another engine
+            if index > 0:
+                break
+            
+            if attempt < max_retries - 1:
+                fallback_id, fallback = fallback_engine(engine, prompt, max_tokens)
+                if fallback_id:
+                    engine_id, engine, fallback_used = fallback_id, fallback, True
+                    context.log(f"Falling back to: {engine['name']}")
+    
+    yield {'type': 'error', 'engine': engine_id, 'error': f'All engines failed: {last_error}'}
+
+
+def send_stream(context, chunks):
+    """
+    Write chunks to the caller as text/event-stream.
+
+    Uses the runtime's incremental response writer when it has one; older
+    runtimes only accept a complete body, so the events are buffered there.
+    """
+    headers = {'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'}
+    res = context.res
+    
+    if hasattr(res, 'start') and hasattr(res, 'writeText'):
+        res.start(200, headers)
+        for chunk in chunks:
+            res.writeText(f"data: {json.dumps(chunk)}\n\n")
+        return res.end()
+    
+    body = ''.join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks)
+    return res.send(body, 200, headers)
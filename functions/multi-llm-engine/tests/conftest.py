@@ -0,0 +1,54 @@
+"""
+Shared fixtures: main.py loaded once against the offline provider/Appwrite
+stub from benchmarks/, so the suite needs no keys or network.
+"""
+import importlib
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('appwrite')
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+sys.path.insert(0, BENCH_DIR)
+
+import stub_server  # noqa: E402
+from load_bench import BenchContext, load_engine  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def stub():
+    # Slow enough that concurrent identical requests overlap and coalesce
+    server = stub_server.start(stub_server.StubConfig(latency='fixed:50'))
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture(scope='session')
+def engine(stub):
+    module = load_engine(f"http://127.0.0.1:{stub.server_port}", rate_limits=False)
+    yield module
+    module.usage_logger.close()
+
+
+@pytest.fixture(scope='session')
+def module(engine):
+    """Import one of main.py's sibling modules, once load_engine has configured the environment."""
+    return importlib.import_module
+
+
+@pytest.fixture
+def call(engine):
+    """Run one request through main() and return the runtime response dict."""
+    def run(payload: dict) -> dict:
+        return engine.main(BenchContext(payload))
+    return run
+
+
+@pytest.fixture
+def provider_calls(stub):
+    """Provider requests the stub has answered since the test started."""
+    config = stub.RequestHandlerClass.config
+    config.reset()
+    return lambda: sum(sum(counts.values()) for counts in config.snapshot().values())
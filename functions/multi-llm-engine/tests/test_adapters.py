@@ -0,0 +1,21 @@
+import pytest
+
+
+def test_incomplete_adapter_fails_at_registration(module):
+    adapters = module('adapters')
+
+    class HalfAdapter(adapters.ProviderAdapter):
+        def payload(self, engine_config, prompt, max_tokens, context):
+            return {}
+
+    with pytest.raises(TypeError):
+        adapters.register_adapter('half', HalfAdapter())
+    with pytest.raises(TypeError):
+        adapters.register_adapter('half', HalfAdapter)
+    assert 'half' not in adapters.ADAPTERS
+
+
+def test_builtin_adapters_are_registered(module):
+    adapters = module('adapters')
+    for engine_config in adapters.ENGINES.values():
+        assert isinstance(adapters.adapter_for(engine_config), adapters.ProviderAdapter)
@@ -0,0 +1,131 @@
+import time
+
+import pytest
+
+
+class NotFound(Exception):
+    code = 404
+
+
+class StatusDatabases:
+    """An Engine_Status collection in a dict, shared by every registry given it."""
+
+    def __init__(self):
+        self.docs = {}
+        self.lists = 0
+        self.down = False
+
+    def list_documents(self, database_id, collection_id, queries=None):
+        self.lists += 1
+        if self.down:
+            raise ConnectionError('Appwrite unreachable')
+        return {'documents': [dict(doc, **{'$id': doc_id}) for doc_id, doc in self.docs.items()]}
+
+    def update_document(self, database_id, collection_id, document_id, data=None, permissions=None):
+        if self.down:
+            raise ConnectionError('Appwrite unreachable')
+        if document_id not in self.docs:
+            raise NotFound('Document not found')
+        self.docs[document_id] = data
+
+    def create_document(self, database_id, collection_id, document_id, data, permissions=None):
+        self.docs[document_id] = data
+
+
+@pytest.fixture
+def breaker(module):
+    return module('breaker')
+
+
+def registry(breaker, databases):
+    breakers = breaker.BreakerRegistry()
+    breakers.bind(databases)
+    return breakers
+
+
+def trip(circuit, breaker):
+    changed = [circuit.on_failure('HTTP 503') for _ in range(breaker.BREAKER_CONSECUTIVE)]
+    assert changed[-1] and not any(changed[:-1])
+
+
+def test_cooldown_doubles_on_each_retrip(breaker):
+    circuit = breaker.CircuitBreaker('stub')
+    trip(circuit, breaker)
+    first_cooldown = circuit.open_until - circuit.updated_at
+    assert not circuit.allows()
+
+    circuit.open_until = time.time() - 1
+    assert circuit.current_state() == 'half_open' and circuit.allows()
+    assert circuit.on_failure('HTTP 503')
+
+    assert circuit.open_until - circuit.updated_at == pytest.approx(2 * first_cooldown)
+    assert circuit.trip_count == 2
+
+
+def test_half_open_success_closes_the_breaker(breaker):
+    circuit = breaker.CircuitBreaker('stub')
+    trip(circuit, breaker)
+    circuit.open_until = time.time() - 1
+
+    assert circuit.on_success()
+    assert circuit.current_state() == 'closed'
+    assert not circuit.on_success()
+
+
+def test_failure_rate_trips_without_a_failure_streak(breaker):
+    circuit = breaker.CircuitBreaker('stub')
+    for _ in range(breaker.BREAKER_MIN_REQUESTS):
+        circuit.on_success()
+        if circuit.on_failure('HTTP 500'):
+            break
+
+    assert circuit.state == 'open'
+    assert circuit.consecutive_failures == 1
+
+
+def test_open_breaker_is_shared_through_engine_status(breaker):
+    databases = StatusDatabases()
+    writer = registry(breaker, databases)
+    trip(writer.get('claude'), breaker)
+    writer.persist('claude')
+    writer.get('claude').last_error = 'still down'
+    writer.persist('claude')
+
+    reader = registry(breaker, databases)
+    reader.sync()
+
+    assert list(databases.docs) == ['claude']
+    assert databases.docs['claude']['state'] == 'open' and not databases.docs['claude']['available']
+    assert reader.get('claude').state == 'open' and not reader.get('claude').allows()
+    assert reader.get('claude').open_until == pytest.approx(writer.get('claude').open_until)
+    assert reader.get('claude').last_error == 'still down'
+
+
+def test_older_status_does_not_override_a_newer_local_state(breaker):
+    databases = StatusDatabases()
+    stale = registry(breaker, databases)
+    trip(stale.get('claude'), breaker)
+    stale.persist('claude')
+
+    local = registry(breaker, databases)
+    local.get('claude').updated_at = time.time() + 60
+    local.sync()
+
+    assert local.get('claude').state == 'closed'
+
+
+def test_sync_is_cached_and_survives_an_unreachable_store(breaker):
+    databases = StatusDatabases()
+    breakers = registry(breaker, databases)
+    breakers.sync()
+    breakers.sync()
+    assert databases.lists == 1
+
+    databases.down = True
+    trip(breakers.get('claude'), breaker)
+    breakers.sync(force=True)
+    breakers.persist('claude')
+
+    assert databases.lists == 2
+    assert breakers.get('claude').state == 'open'
+    assert databases.docs == {}
@@ -0,0 +1,130 @@
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+LIMITS = {'daily': 100.0, 'monthly': 1000.0, 'tasks': {'prd': {'daily': 1.0}}, 'agents': {'cmo': {'monthly': 2.0}}}
+
+
+class UsagePages:
+    """Engine_Usage rows served a page at a time, honouring cursor_after by position."""
+
+    def __init__(self, rows: list, page: int):
+        self.rows = [dict(row, **{'$id': f"u{i:03d}"}) for i, row in enumerate(rows)]
+        self.page = page
+        self.calls = 0
+
+    def list_documents(self, database_id, collection_id, queries=None):
+        self.calls += 1
+        start = 0
+        for query in queries or []:
+            if 'cursor' in str(query).lower():
+                start = next(i for i, row in enumerate(self.rows) if row['$id'] in str(query)) + 1
+        return {'documents': self.rows[start:start + self.page]}
+
+
+@pytest.fixture
+def budgets(module):
+    return module('budgets')
+
+
+@pytest.fixture
+def spend(budgets, monkeypatch):
+    """The shared BudgetEngine with LIMITS, no spend and no reconcile due, restored afterwards."""
+    monkeypatch.setattr(budgets.budgets, 'limits', LIMITS)
+    monkeypatch.setattr(budgets.budgets, 'spend', {})
+    monkeypatch.setattr(budgets.budgets, 'stats', dict(budgets.budgets.stats))
+    monkeypatch.setattr(budgets.budgets, '_reconciled_at', time.time())
+    return budgets.budgets
+
+
+def test_check_reports_the_tightest_budget(budgets):
+    engine = budgets.BudgetEngine(limits=LIMITS)
+    engine.charge('prd', 'cmo', 0.5)
+
+    tightest = engine.check('prd', 'cmo', 0.25)
+    assert (tightest['scope'], tightest['period'], tightest['ratio']) == ('task:prd', 'daily', 0.75)
+    assert engine.check('blog', None, 0.0)['scope'] == 'total'
+    assert budgets.BudgetEngine(limits={}).check('blog', None, 1.0) is None
+
+
+def test_reconcile_adopts_higher_totals_across_pages(budgets, monkeypatch):
+    monkeypatch.setattr(budgets, 'BUDGET_RECONCILE_PAGE', 2)
+    now = datetime.now(timezone.utc)
+    today = now.strftime('%Y-%m-%dT%H:%M:%S')
+    rows = [{'task_type': 'prd', 'agent': 'cmo', 'cost_usd': 0.3, 'created_at': today}] * 3 + [
+        {'task_type': 'prd', 'cost_usd': 0.0, 'created_at': today},
+        {'task_type': 'blog', 'cost_usd': 5.0, 'created_at': ''},
+    ]
+    databases = UsagePages(rows, page=2)
+    engine = budgets.BudgetEngine(limits=LIMITS)
+    engine.bind(databases)
+    engine.charge('blog', None, 2.0)
+    engine.spend[('total', '2000-01')] = 9.0
+
+    engine.reconcile_if_stale(wait=True)
+
+    keys = engine.period_keys(now)
+    assert databases.calls == 3
+    assert engine.spend[('agent:cmo', keys['monthly'])] == pytest.approx(0.9)
+    assert engine.spend[('total', keys['daily'])] == pytest.approx(2.0)
+    assert ('total', '2000-01') not in engine.spend
+    assert engine.stats['reconciles'] == 1 and engine.stats['last_error'] is None
+
+    # Not stale again for BUDGET_RECONCILE_S
+    engine.reconcile_if_stale(wait=True)
+    assert databases.calls == 3
+
+
+def test_failed_reconcile_keeps_local_spend(budgets):
+    class Down:
+        def list_documents(self, *args, **kwargs):
+            raise ConnectionError('Appwrite unreachable')
+
+    engine = budgets.BudgetEngine(limits=LIMITS)
+    engine.bind(Down())
+    engine.charge('prd', None, 0.4)
+    engine.reconcile_if_stale(wait=True)
+
+    assert engine.stats['last_error'] == 'Appwrite unreachable'
+    assert engine.check('prd', None, 0.0)['spent_usd'] == 0.4
+
+
+def test_paid_engine_downgrades_near_its_budget(spend, call):
+    request = {'task_type': 'prd', 'estimate_only': True, 'prompt': 'Draft a PRD for budget alerts'}
+    assert call(request)['body']['engine'] == 'claude'
+
+    spend.charge('prd', None, 0.85)
+    body = call(request)['body']
+
+    assert body['engine'] == 'qwen' and body['fallback_used']
+    assert body['budget']['scope'] == 'task:prd'
+    assert spend.stats['downgraded'] == 1
+
+
+def test_spent_budget_rejects_when_no_free_engine_fits(spend, budgets, call, monkeypatch):
+    monkeypatch.setattr(budgets, 'BUDGET_DOWNGRADE_ENGINES', ['deepseek'])
+    request = {'task_type': 'prd', 'estimate_only': True, 'prompt': 'Draft a PRD for budget alerts'}
+
+    spend.charge('prd', None, 0.85)
+    assert call(request)['body']['engine'] == 'deepseek'
+
+    spend.charge('prd', None, 0.5)
+    response = call(request)
+    assert response['status'] == 429
+    assert response['body']['budget']['ratio'] >= 1
+    assert spend.stats['rejected'] == 1
+
+
+def test_projection_scales_spend_to_the_full_period(budgets):
+    engine = budgets.BudgetEngine(limits=LIMITS)
+    engine.charge('prd', 'cmo', 0.5)
+
+    report = engine.projection()
+
+    daily = report['scopes']['task:prd']['daily']
+    assert daily['spent_usd'] == 0.5 and daily['remaining_usd'] == 0.5
+    assert daily['projected_usd'] >= 0.5
+    assert daily['projected_over_limit'] == (daily['projected_usd'] > 1.0)
+    assert report['scopes']['agent:cmo']['monthly']['limit_usd'] == 2.0
+    assert report['scopes']['total']['monthly']['spent_usd'] == 0.5
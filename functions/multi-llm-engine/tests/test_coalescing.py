@@ -0,0 +1,50 @@
+import asyncio
+
+from load_bench import BenchContext
+
+
+def test_coalesced_followers_report_no_cost(call, provider_calls):
+    prompt = 'Coalesce this identical batch prompt'
+    response = call({'task_type': 'code', 'cache': False, 'prompts': [prompt, prompt, prompt]})
+
+    body = response['body']
+    leaders = [r for r in body['results'] if not r['coalesced']]
+    followers = [r for r in body['results'] if r['coalesced']]
+    assert response['status'] == 200 and body['failed'] == 0
+    assert provider_calls() == 1
+    assert len(leaders) == 1 and len(followers) == 2
+    assert all(r['cost_usd'] == 0 and r['tokens'] == 0 and r['cached_tokens'] == 0 for r in followers)
+    assert body['cost_usd'] == leaders[0]['cost_usd'] > 0
+    assert body['tokens'] == leaders[0]['tokens']
+
+
+def test_creative_tasks_do_not_coalesce_unless_asked(call, provider_calls):
+    prompt = 'Write an identical post about shipping'
+    response = call({'task_type': 'x_post', 'cache': False, 'prompts': [prompt, prompt]})
+
+    assert response['status'] == 200
+    assert provider_calls() == 2
+    assert not any(r['coalesced'] for r in response['body']['results'])
+
+    response = call({'task_type': 'x_post', 'cache': False, 'coalesce': True, 'prompts': [prompt, prompt]})
+    assert sum(r['coalesced'] for r in response['body']['results']) == 1
+
+
+def test_shared_failure_is_counted_once(module, monkeypatch):
+    pipeline = module('pipeline')
+
+    async def failing_plan(plan, databases, context):
+        await asyncio.sleep(0.05)
+        return {'error': 'All engines failed'}, 500
+
+    monkeypatch.setattr(pipeline, '_execute_plan', failing_plan)
+    plan = {'coalesce_key': 'shared-failure', 'task_type': 'code'}
+    before = pipeline.single_flight.stats['shared_errors']
+
+    async def pair():
+        return await asyncio.gather(*(pipeline.aexecute_request(plan, None, BenchContext({})) for _ in range(2)))
+
+    outcomes = pipeline.engine_loop.run(pair())
+
+    assert [status for _, status in outcomes] == [500, 500]
+    assert pipeline.single_flight.stats['shared_errors'] - before == 1
@@ -0,0 +1,71 @@
+import json
+import threading
+
+import pytest
+
+PAYLOAD = json.dumps({'model': 'pool', 'messages': [{'role': 'user', 'content': 'keep-alive'}], 'max_tokens': 16}).encode()
+HEADERS = {'Authorization': 'Bearer stub', 'Content-Type': 'application/json'}
+
+
+@pytest.fixture
+def url(stub):
+    return f"http://127.0.0.1:{stub.server_port}/openai/v1/chat/completions"
+
+
+@pytest.fixture
+def transport(module):
+    return module('transport')
+
+
+def test_sequential_calls_reuse_one_connection(transport, url):
+    pool = transport.ConnectionPool(max_per_host=2)
+
+    reused = [pool.request('POST', url, PAYLOAD, HEADERS, 10)[3] for _ in range(3)]
+
+    assert reused == [False, True, True]
+    assert pool.snapshot()['127.0.0.1'] == {'opened': 1, 'reused': 2, 'evicted': 0, 'idle': 1}
+
+
+def test_idle_connection_past_its_timeout_is_evicted(transport, url):
+    pool = transport.ConnectionPool(max_per_host=2, idle_timeout=0)
+
+    pool.request('POST', url, PAYLOAD, HEADERS, 10)
+    status, _, _, reused = pool.request('POST', url, PAYLOAD, HEADERS, 10)
+
+    assert (status, reused) == (200, False)
+    assert pool.snapshot()['127.0.0.1']['evicted'] == 1
+
+
+def test_exhausted_pool_waits_then_times_out(transport, url, monkeypatch):
+    monkeypatch.setattr(transport, 'POOL_ACQUIRE_TIMEOUT', 0.05)
+    pool = transport.ConnectionPool(max_per_host=1)
+    key, _ = pool._route(url)
+    conn, _ = pool.acquire(key, 10)
+
+    with pytest.raises(TimeoutError, match='exhausted'):
+        pool.acquire(key, 10)
+
+    # A released connection wakes the next waiter
+    threading.Timer(0.01, pool.release, (key, conn, False)).start()
+    monkeypatch.setattr(transport, 'POOL_ACQUIRE_TIMEOUT', 5)
+    _, reused = pool.acquire(key, 10)
+    assert reused is False
+
+
+def test_closed_async_connection_is_not_handed_out(transport, url):
+    pool = transport.AsyncConnectionPool(max_per_host=1)
+    loop = transport.engine_loop
+
+    loop.run(pool.request('POST', url, PAYLOAD, HEADERS, 10))
+    key, _ = transport.ConnectionPool._route(url)
+    _, writer, _ = pool._idle[key][0]
+
+    async def drop():
+        writer.close()
+        await writer.wait_closed()
+
+    loop.run(drop())
+    status, _, _, reused = loop.run(pool.request('POST', url, PAYLOAD, HEADERS, 10))
+
+    assert (status, reused) == (200, False)
+    assert pool.snapshot()['127.0.0.1']['evicted'] == 1
@@ -0,0 +1,57 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+PAYLOAD = json.dumps({'model': 'core', 'messages': [{'role': 'user', 'content': 'engine core'}], 'max_tokens': 16}).encode()
+HEADERS = {'Authorization': 'Bearer stub', 'Content-Type': 'application/json'}
+
+
+@pytest.fixture
+def url(stub):
+    return f"http://127.0.0.1:{stub.server_port}/openai/v1/chat/completions"
+
+
+def test_concurrent_calls_overlap_and_reuse_connections(module, url):
+    transport = module('transport')
+    pool = transport.AsyncConnectionPool(max_per_host=8)
+
+    async def burst():
+        return await asyncio.gather(*(pool.request('POST', url, PAYLOAD, HEADERS, 10) for _ in range(8)))
+
+    start = time.perf_counter()
+    first = transport.engine_loop.run(burst())
+    elapsed = time.perf_counter() - start
+    second = transport.engine_loop.run(burst())
+
+    # Eight 50 ms calls, in flight together rather than back to back
+    assert elapsed < 0.3
+    assert [r[0] for r in first + second] == [200] * 16
+    assert all(reused for _, _, _, reused in second)
+    assert pool.snapshot()['127.0.0.1']['opened'] == 8
+
+
+def test_cancelled_call_releases_its_slot_and_connection(module, url):
+    transport = module('transport')
+    pool = transport.AsyncConnectionPool(max_per_host=1)
+
+    with pytest.raises(TimeoutError):
+        transport.engine_loop.run(pool.request('POST', url, PAYLOAD, HEADERS, 10), timeout=0.01)
+    status, _, _, reused = transport.engine_loop.run(pool.request('POST', url, PAYLOAD, HEADERS, 10), timeout=5)
+
+    # The half-read connection was closed, not returned to the pool
+    assert (status, reused) == (200, False)
+
+
+def test_batch_items_fan_out_behind_the_sync_facade(call):
+    start = time.perf_counter()
+    response = call({'cache': False, 'prompts': [
+        {'task_type': 'summary', 'prompt': f"Core batch item {i}"} for i in range(6)
+    ]})
+    elapsed = time.perf_counter() - start
+
+    assert response['status'] == 200
+    assert response['body']['failed'] == 0
+    assert len(response['body']['results']) == 6
+    assert elapsed < 6 * 0.05
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+
+def test_timeout_waits_for_the_task_to_unwind(module):
+    engine_loop = module('transport').engine_loop
+    unwound = []
+
+    async def slow_call():
+        try:
+            await asyncio.sleep(5)
+        finally:
+            unwound.append(True)
+
+    with pytest.raises(TimeoutError):
+        engine_loop.run(slow_call(), timeout=0.05)
+    assert unwound == [True]
+
+
+def test_cancelled_call_is_not_recorded_as_a_failure(module):
+    engine_loop = module('transport').engine_loop
+    failures = []
+
+    async def slow_call():
+        try:
+            await asyncio.sleep(5)
+        except Exception as e:  # the pattern every engine call uses
+            failures.append(e)
+            raise
+
+    with pytest.raises(TimeoutError):
+        engine_loop.run(slow_call(), timeout=0.05)
+    assert failures == []
+
+
+def test_call_within_timeout_returns_its_result(module):
+    engine_loop = module('transport').engine_loop
+    async def quick_call():
+        await asyncio.sleep(0.01)
+        return 'done'
+
+    assert engine_loop.run(quick_call(), timeout=1) == 'done'
+
+
+def test_request_past_its_budget_answers_504(engine, module, call, monkeypatch):
+    transport = module('transport')
+    # The stub takes 50ms, longer than the whole invocation budget
+    monkeypatch.setattr(engine, 'REQUEST_TIMEOUT_S', 0.01)
+    response = call({'task_type': 'code', 'cache': False, 'prompt': 'Answer after the deadline'})
+
+    assert response['status'] == 504
+    assert transport.remaining_budget() == transport.REQUEST_TIMEOUT_S
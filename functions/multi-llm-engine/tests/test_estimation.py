@@ -0,0 +1,63 @@
+import pytest
+
+
+@pytest.fixture
+def estimation(module):
+    return module('estimation')
+
+
+def test_multibyte_text_costs_more_tokens(estimation):
+    overhead = estimation.TOKEN_MESSAGE_OVERHEAD
+
+    assert estimation.estimate_tokens('a' * 400) == 100 + overhead
+    assert estimation.estimate_tokens('a' * 350, 'anthropic') == 100 + overhead
+    # Three UTF-8 bytes each: a quarter token plus one for the extra bytes
+    assert estimation.estimate_tokens('語' * 400) == 100 + 400 + overhead
+    assert estimation.estimate_tokens('') == overhead
+
+
+def test_rewrite_tasks_are_budgeted_from_their_input(estimation):
+    short, long = 'Fix teh speling', 'word ' * 10000
+
+    assert estimation.task_max_tokens('spelling', short) < estimation.task_max_tokens('spelling', 'word ' * 200)
+    assert estimation.task_max_tokens('spelling', long) == estimation.MAX_TOKENS
+    assert estimation.task_max_tokens('x_post', long) == estimation.TASK_MAX_TOKENS['x_post']
+
+
+def test_estimate_uses_the_engines_recent_completions(estimation, monkeypatch):
+    engine = {'model': 'gpt-test', 'cost_per_1k': 1.0}
+    monkeypatch.setattr(estimation, 'task_tokens', {('stub', 'qa'): [100, 300]})
+
+    fresh = estimation.estimate_request('other', engine, 'qa', 'a' * 392, 800)
+    seen = estimation.estimate_request('stub', engine, 'qa', 'a' * 392, 800)
+
+    assert fresh['completion_tokens'] == 400 and seen['completion_tokens'] == 200
+    assert seen['cost_usd'] == pytest.approx((106 + 200) / 1000)
+    assert seen['max_cost_usd'] == pytest.approx((106 + 800) / 1000)
+
+
+def test_oversized_prompt_moves_to_a_long_context_engine(call):
+    # ~10k tokens: past gemma's 8k window, within qwen's
+    response = call({'task_type': 'simple', 'estimate_only': True, 'prompt': 'word ' * 8000})
+
+    assert response['status'] == 200
+    body = response['body']
+    assert body['engine'] != 'gemma' and body['fallback_used']
+    assert body['estimate']['prompt_tokens'] > 8192
+
+
+def test_forced_engine_that_cannot_hold_the_prompt_answers_413(call, provider_calls):
+    response = call({'task_type': 'simple', 'engine': 'gemma', 'prompt': 'word ' * 8000})
+
+    assert response['status'] == 413
+    assert response['body']['context_window'] == 8192
+    assert response['body']['max_tokens'] == 400
+    assert provider_calls() == 0
+
+
+def test_prompt_past_every_window_answers_413(call, provider_calls):
+    response = call({'task_type': 'qa', 'cache': False, 'prompt': 'a' * 4_500_000})
+
+    assert response['status'] == 413
+    assert 'every available engine' in response['body']['error']
+    assert provider_calls() == 0
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import pytest
+from load_bench import BenchContext
+
+
+@pytest.fixture
+def hedging(module):
+    return module('hedging')
+
+
+@pytest.fixture
+def racers(hedging, monkeypatch):
+    """Two real engine ids with scripted calls: {engine_id: (delay_s, error)}."""
+    primary_id, hedge_id = list(hedging.ENGINES)[:2]
+    script, started, unwound = {}, [], []
+
+    async def scripted_call(engine_id, engine_config, prompt, context, max_tokens):
+        started.append(engine_id)
+        delay, error = script[engine_id]
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            unwound.append(engine_id)
+        if error:
+            raise error
+        return {'text': engine_id, 'tokens': 1}, int(delay * 1000)
+
+    monkeypatch.setattr(hedging, '_timed_call', scripted_call)
+    monkeypatch.setattr(hedging, 'hedge_delay_ms', lambda engine_id: 2000)
+    monkeypatch.setattr(hedging, 'select_hedge_engine', lambda *args: (hedge_id, hedging.ENGINES[hedge_id]))
+    monkeypatch.setattr(hedging, 'record_failure', lambda *args: None)
+    return primary_id, hedge_id, script, started, unwound
+
+
+def hedged(hedging, primary_id):
+    return hedging.engine_loop.run(hedging.acall_engine_hedged(
+        primary_id, hedging.ENGINES[primary_id], 'Hedge this prompt', 'qa', BenchContext({})))
+
+
+def test_primary_failure_starts_the_hedge_immediately(hedging, racers):
+    primary_id, hedge_id, script, started, _ = racers
+    script.update({primary_id: (0.01, RuntimeError('primary down')), hedge_id: (0.01, None)})
+
+    begin = time.time()
+    outcome = hedged(hedging, primary_id)
+
+    assert time.time() - begin < 1
+    assert started == [primary_id, hedge_id]
+    assert outcome['engine_id'] == hedge_id and outcome['hedge_won']
+
+
+def test_fast_primary_wins_without_a_hedge(hedging, racers):
+    primary_id, hedge_id, script, started, _ = racers
+    script.update({primary_id: (0.01, None), hedge_id: (0.01, None)})
+
+    outcome = hedged(hedging, primary_id)
+
+    assert started == [primary_id]
+    assert outcome['engine_id'] == primary_id and outcome['hedge_engine'] is None
+
+
+def test_losing_racer_is_awaited_before_returning(hedging, racers, monkeypatch):
+    primary_id, hedge_id, script, _, unwound = racers
+    monkeypatch.setattr(hedging, 'hedge_delay_ms', lambda engine_id: 10)
+    script.update({primary_id: (5, None), hedge_id: (0.05, None)})
+
+    outcome = hedged(hedging, primary_id)
+
+    assert outcome['engine_id'] == hedge_id
+    assert sorted(unwound) == sorted([primary_id, hedge_id])
+
+
+def test_every_racer_failing_raises_the_primary_error(hedging, racers):
+    primary_id, hedge_id, script, _, _ = racers
+    primary_error = RuntimeError('primary down')
+    script.update({primary_id: (0.01, primary_error), hedge_id: (0.01, RuntimeError('hedge down'))})
+
+    with pytest.raises(RuntimeError, match='primary down'):
+        hedged(hedging, primary_id)
@@ -0,0 +1,78 @@
+import re
+
+import pytest
+
+SAMPLE = re.compile(r'^[a-z_]+(\{[a-z_]+="(?:[^"\\]|\\.)*"(,[a-z_]+="(?:[^"\\]|\\.)*")*\})? -?[0-9.e+-]+$')
+
+
+@pytest.fixture
+def metrics(module):
+    return module('metrics')
+
+
+def samples(text: str) -> dict:
+    """{'name{labels}': value} for every sample line of a Prometheus exposition."""
+    return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+            for line in text.splitlines() if not line.startswith('#')}
+
+
+def test_histogram_quantiles_stay_within_a_bucket(metrics):
+    histogram = metrics.LatencyHistogram(significant_bits=5)
+    for ms in range(1, 1001):
+        histogram.record(ms)
+
+    for q in (0.5, 0.9, 0.99):
+        assert histogram.quantile(q) == pytest.approx(q * 1000, rel=1 / 2 ** 4)
+    assert histogram.quantile(1.0) == 1000
+    assert histogram.snapshot()['count'] == 1000
+    assert len(histogram.buckets) < 200
+
+
+def test_calls_are_recorded_per_engine_task_and_phase(metrics):
+    recorder = metrics.Metrics()
+    recorder.observe_call('stub', 'qa', 200, 50, {'connect_ms': 0.0, 'ttfb_ms': 150})
+    recorder.observe_call('stub', 'qa', 400, 150)
+    recorder.count('errors', 'stub')
+
+    snapshot = recorder.snapshot()
+    phases = snapshot['latency']['stub']['qa']
+    assert {phase: summary['count'] for phase, summary in phases.items()} == {'connect': 1, 'ttfb': 1, 'total': 2}
+    assert snapshot['throughput']['stub']['qa'] == {'calls': 2, 'tokens': 200, 'seconds': 0.6, 'tokens_per_s': 333.3}
+    assert snapshot['errors'] == {'stub': 1}
+
+
+def test_exposition_is_valid_prometheus_text(metrics, engine, call):
+    call({'task_type': 'qa', 'cache': False, 'prompt': 'Fill the metrics'})
+    text = metrics.render_prometheus(engine.collect_metrics())
+
+    families = re.findall(r'^# TYPE (\S+) (\S+)$', text, re.M)
+    helps = re.findall(r'^# HELP (\S+) ', text, re.M)
+    assert [name for name, _ in families] == helps
+    assert len(set(helps)) == len(helps)
+    for line in text.splitlines():
+        assert line.startswith('# ') or SAMPLE.match(line), line
+
+    values = samples(text)
+    assert values['llm_calls_total{engine="gemini",task="qa"}'] >= 1
+    assert values['llm_call_latency_seconds_count{engine="gemini",task="qa",phase="total"}'] >= 1
+    assert values['llm_breaker_state{engine="gemini"}'] == 0
+    assert 'llm_usage_queue_depth' in values
+    assert any(key.startswith('llm_pool_connections_opened_total{pool="async"') for key in values)
+
+
+def test_label_values_are_escaped(metrics, engine):
+    snapshot = engine.collect_metrics()
+    snapshot['errors'] = {'odd "engine"\\\n': 1}
+
+    text = metrics.render_prometheus(snapshot)
+
+    assert 'llm_call_errors_total{engine="odd \\"engine\\"\\\\\\n"} 1' in text.splitlines()
+
+
+def test_metrics_action_serves_text_or_json(call):
+    text = call({'action': 'metrics'})
+    snapshot = call({'action': 'metrics', 'format': 'json'})
+
+    assert text['status'] == 200 and '# TYPE llm_calls_total counter' in text['raw']
+    assert snapshot['status'] == 200
+    assert {'latency', 'breakers', 'caches', 'coalescing', 'rate_limits', 'connection_pools'} <= set(snapshot['body'])
@@ -0,0 +1,47 @@
+import threading
+import time
+
+import pytest
+
+
+@pytest.mark.parametrize('payload, error', [
+    ({'prompt': 123}, 'prompt must be a string'),
+    ({'prompt': 'hi', 'skills': 'abc'}, 'skills must be a list of skill names'),
+    ({'prompt': 'hi', 'skills': ['ok', 7]}, 'skills must be a list of skill names'),
+])
+def test_malformed_prompt_input_is_a_400(call, payload, error):
+    response = call(dict(payload, task_type='code', cache=False))
+
+    assert response['status'] == 400
+    assert response['body']['error'] == error
+
+
+def test_gemini_cache_creation_does_not_block_other_requests(module, monkeypatch):
+    adapters = module('adapters')
+    cache = adapters.GeminiContextCache()
+    gemini = dict(adapters.ENGINES['gemini'], key='stub')
+    release = threading.Event()
+
+    def slow_create(engine_config, system):
+        if system.startswith('slow'):
+            release.wait(5)
+        return f"cachedContents/{len(system)}"
+
+    monkeypatch.setattr(cache, '_create', slow_create)
+    slow_prefix = 'slow ' + 'word ' * adapters.GEMINI_CACHE_MIN_TOKENS * 2
+    fast_prefix = 'fast ' + 'word ' * adapters.GEMINI_CACHE_MIN_TOKENS * 2
+    creator = threading.Thread(target=cache.get, args=(gemini, slow_prefix))
+    creator.start()
+    time.sleep(0.05)
+
+    start = time.perf_counter()
+    same_prefix = cache.get(gemini, slow_prefix)
+    other_prefix = cache.get(gemini, fast_prefix)
+    elapsed = time.perf_counter() - start
+    release.set()
+    creator.join()
+
+    assert elapsed < 1
+    assert same_prefix is None
+    assert other_prefix == f"cachedContents/{len(fast_prefix)}"
+    assert cache.get(gemini, slow_prefix) == f"cachedContents/{len(slow_prefix)}"
@@ -0,0 +1,92 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+FUNCTION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def ratelimit(module):
+    return module('ratelimit')
+
+
+def test_bucket_allows_a_burst_then_paces(ratelimit):
+    limiter = ratelimit.RateLimiter(rpm=60, burst=2)
+
+    assert [limiter.try_acquire() for _ in range(2)] == [0.0, 0.0]
+    assert limiter.try_acquire() == pytest.approx(1.0, abs=0.05)
+    assert not limiter.acquire(max_wait=0.1)
+    assert limiter.snapshot()['rpm'] == 60
+
+
+def test_unlimited_engine_is_only_blocked_by_the_provider(ratelimit):
+    limiter = ratelimit.RateLimiter()
+    assert all(limiter.try_acquire() == 0 for _ in range(100))
+
+    limiter.observe({'Retry-After': '30'}, status=429)
+    assert limiter.wait_time() == pytest.approx(30, abs=0.5)
+
+
+@pytest.mark.parametrize('headers, expected', [
+    ({'retry-after': '7'}, 7),
+    ({'retry-after': '1m30s'}, 90),
+    ({}, 'default'),
+    ({'Retry-After': 'not a date'}, 'default'),
+])
+def test_429_blocks_until_retry_after(ratelimit, headers, expected):
+    limiter = ratelimit.RateLimiter(rpm=600)
+    limiter.observe(headers, status=429)
+
+    blocked = ratelimit.RATE_LIMIT_DEFAULT_BACKOFF_S if expected == 'default' else expected
+    assert limiter.wait_time() == pytest.approx(blocked, abs=0.5)
+    assert limiter.snapshot()['tokens'] <= 0
+
+
+def test_exhausted_remaining_header_blocks_until_its_reset(ratelimit):
+    limiter = ratelimit.RateLimiter()
+    limiter.observe({'x-ratelimit-remaining-requests': '5', 'x-ratelimit-reset-requests': '20s'})
+    assert limiter.wait_time() == 0
+
+    limiter.observe({'x-ratelimit-remaining-requests': '0', 'x-ratelimit-reset-requests': '6m0s'})
+    assert limiter.wait_time() == pytest.approx(360, abs=0.5)
+
+
+def test_reset_formats(ratelimit):
+    now = time.time()
+    assert ratelimit._reset_seconds('250ms') == pytest.approx(0.25)
+    assert ratelimit._reset_seconds(str(now + 10)) == pytest.approx(10, abs=0.5)
+    assert ratelimit._reset_seconds(str(int((now + 10) * 1000))) == pytest.approx(10, abs=0.5)
+    assert ratelimit._reset_seconds('Wed, 21 Oct 2015 07:28:00 GMT') < 0
+    assert ratelimit._reset_seconds('soon') is None
+
+
+def test_throttled_engine_is_routed_around(ratelimit, call, monkeypatch):
+    blocked = ratelimit.RateLimiter()
+    blocked.block(60)
+    monkeypatch.setitem(ratelimit.rate_limiters, 'gemma', blocked)
+
+    response = call({'task_type': 'simple', 'cache': False, 'prompt': 'Route around the throttled engine'})
+
+    assert response['status'] == 200
+    assert response['body']['engine'] != 'gemma' and response['body']['fallback_used']
+
+
+def test_overrides_replace_and_add_engine_limits():
+    # The table is built at import, so read it from a fresh interpreter
+    overrides = {'qwen': {'rpm': 6, 'burst': 3}, 'claude': {'rpm': 120}}
+    script = ('import json, ratelimit; '
+              'print(json.dumps({e: l.snapshot() for e, l in ratelimit.rate_limiters.items()}))')
+    output = subprocess.run(
+        [sys.executable, '-c', script], cwd=FUNCTION_DIR, capture_output=True, text=True, check=True,
+        env=dict(os.environ, LLM_RATE_LIMITS=json.dumps(overrides)),
+    ).stdout
+    limits = json.loads(output)
+
+    assert (limits['qwen']['rpm'], limits['qwen']['tokens']) == (6, 3)
+    assert (limits['claude']['rpm'], limits['claude']['tokens']) == (120, 20)
+    assert limits['llama']['rpm'] == 20
+    assert limits['deepseek']['rpm'] is None
@@ -0,0 +1,100 @@
+import time
+
+import pytest
+
+ENGINE = {'model': 'cache-model'}
+PARAMS = {'max_tokens': 100}
+
+
+class NotFound(Exception):
+    code = 404
+
+
+class Conflict(Exception):
+    code = 409
+
+
+class CacheDatabases:
+    """Engine_Cache documents kept in a dict, as Appwrite would answer for them."""
+
+    def __init__(self):
+        self.docs = {}
+        self.updates = 0
+
+    def get_document(self, database_id, collection_id, document_id):
+        if document_id not in self.docs:
+            raise NotFound('Document not found')
+        return self.docs[document_id]
+
+    def create_document(self, database_id, collection_id, document_id, data, permissions=None):
+        if document_id in self.docs:
+            raise Conflict('Document already exists')
+        self.docs[document_id] = data
+
+    def update_document(self, database_id, collection_id, document_id, data=None, permissions=None):
+        self.docs[document_id] = data
+        self.updates += 1
+
+
+@pytest.fixture
+def caches(module):
+    return module('caches')
+
+
+def test_key_forgives_only_line_endings_and_surrounding_whitespace(caches):
+    key = caches.cache_key(ENGINE, 'summary', 'Sum up\nthe report', PARAMS)
+
+    assert caches.cache_key(ENGINE, 'summary', '  Sum up\r\nthe report\n', PARAMS) == key
+    assert caches.cache_key(ENGINE, 'summary', 'Sum up\n the report', PARAMS) != key
+    assert caches.cache_key({'model': 'other'}, 'summary', 'Sum up\nthe report', PARAMS) != key
+    assert caches.cache_key(ENGINE, 'summary', 'Sum up\nthe report', {'max_tokens': 200}) != key
+
+
+def test_least_recently_used_entry_is_evicted(caches):
+    cache = caches.ResponseCache(max_entries=2, persist=False)
+    for key in ('a', 'b'):
+        cache.put(key, {'text': key}, 60, 'stub', ENGINE, 'summary')
+    cache.get('a')
+    cache.put('c', {'text': 'c'}, 60, 'stub', ENGINE, 'summary')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == {'text': 'a'} and cache.get('c') == {'text': 'c'}
+    assert cache.stats['evictions'] == 1
+
+
+def test_expired_entry_is_a_miss(caches):
+    cache = caches.ResponseCache(persist=False)
+    cache._put_local('old', {'text': 'stale'}, time.time() - 1)
+    cache.put('uncached', {'text': 'x'}, 0, 'stub', ENGINE, 'code')
+
+    assert cache.get('old') is None
+    assert cache.get('uncached') is None
+    assert cache.stats == {'hits': 0, 'persistent_hits': 0, 'misses': 2, 'stores': 0, 'evictions': 0}
+
+
+def test_persistent_tier_is_shared_and_promoted(caches):
+    databases = CacheDatabases()
+    writer = caches.ResponseCache(persist=True)
+    writer.put('k' * 64, {'text': 'stored', 'tokens': 7}, 60, 'stub', ENGINE, 'summary', databases)
+    writer.put('k' * 64, {'text': 'restored', 'tokens': 8}, 60, 'stub', ENGINE, 'summary', databases)
+
+    # A second instance misses locally, reads Appwrite, then serves from memory
+    reader = caches.ResponseCache(persist=True)
+    assert reader.get('k' * 64, databases) == {'text': 'restored', 'tokens': 8}
+    assert reader.get('k' * 64) == {'text': 'restored', 'tokens': 8}
+    assert reader.stats['persistent_hits'] == 1 and reader.stats['hits'] == 2
+    assert list(databases.docs) == ['k' * 36] and databases.updates == 1
+    assert reader.get('m' * 64, databases) is None
+
+
+def test_repeated_prompt_is_served_from_cache(call, provider_calls):
+    request = {'task_type': 'summary', 'prompt': 'Summarise the cached quarterly report'}
+    first = call(request)
+    second = call(dict(request, prompt=request['prompt'] + '\n'))
+    bypassed = call(dict(request, cache=False))
+
+    assert provider_calls() == 2
+    assert first['body']['cache_hit'] is False
+    assert second['body']['cache_hit'] is True and second['body']['cache_tier'] == 'exact'
+    assert second['body']['text'] == first['body']['text']
+    assert bypassed['body']['cache_hit'] is False
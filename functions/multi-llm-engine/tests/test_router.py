@@ -0,0 +1,92 @@
+from collections import deque
+
+import pytest
+
+from load_bench import BenchContext
+
+
+class UsageRows:
+    """Engine_Usage rows for seed_router_stats, newest first as the query orders them."""
+
+    def __init__(self, rows: list):
+        self.rows = rows
+
+    def list_documents(self, database_id, collection_id, queries=None):
+        return {'documents': self.rows, 'total': len(self.rows)}
+
+
+@pytest.fixture
+def routing(module, monkeypatch):
+    """The routing module with empty call stats and no exploration."""
+    routing = module('routing')
+    monkeypatch.setattr(routing, 'engine_latency', {e: deque(maxlen=200) for e in routing.ENGINES})
+    monkeypatch.setattr(routing, 'engine_outcomes', {e: deque(maxlen=200) for e in routing.ENGINES})
+    monkeypatch.setattr(routing, 'task_tokens', {})
+    monkeypatch.setattr(routing, 'ROUTER_EXPLORE_RATE', 0.0)
+    monkeypatch.setattr(routing, '_router_seeded', True)
+    return routing
+
+
+def history(routing, engine_id: str, latency_ms: int, failures: int = 0, samples: int = 20):
+    for _ in range(samples):
+        routing._record_sample(engine_id, 'code', latency_ms, 1000)
+    routing.engine_outcomes[engine_id].extend([False] * failures)
+
+
+def test_engine_without_history_has_no_score(routing):
+    history(routing, 'claude', 100, samples=routing.ROUTER_MIN_SAMPLES - 1)
+
+    assert routing.routing_score('claude', 'code') is None
+    assert routing.select_engine_adaptive('code') == routing.select_engine('code')
+
+
+def test_score_weighs_cost_and_tail_latency(routing):
+    history(routing, 'claude', 100)
+    history(routing, 'deepseek', 5000)
+
+    # 1000 tokens at $0.003/1k, plus 0.1 s
+    assert routing.routing_score('claude', 'code') == pytest.approx(100 * 0.003 + 0.1)
+    engine_id, _, fallback_used = routing.select_engine_adaptive('code')
+    assert (engine_id, fallback_used) == ('claude', False)
+
+
+def test_error_rate_inflates_the_score(routing):
+    history(routing, 'claude', 100, failures=190, samples=10)
+    history(routing, 'deepseek', 5000)
+
+    assert routing.engine_error_rate('claude') == pytest.approx(0.95)
+    assert routing.select_engine_adaptive('code')[0] == 'deepseek'
+
+
+def test_only_allowed_engines_are_candidates(routing):
+    history(routing, 'grok', 10)
+    history(routing, 'deepseek', 5000)
+
+    assert 'grok' not in routing.allowed_engines('code')
+    assert routing.select_engine_adaptive('code')[0] == 'deepseek'
+
+
+def test_dry_run_logs_the_adaptive_pick_but_routes_statically(routing):
+    history(routing, 'claude', 100)
+    history(routing, 'deepseek', 5000)
+    context = BenchContext({})
+    logged = []
+    context.log = logged.append
+
+    assert routing.route_request('code', 'dry_run', None, context)[0] == 'deepseek'
+    assert routing.route_request('code', 'adaptive', None, context)[0] == 'claude'
+    assert any('static=deepseek adaptive=claude' in line for line in logged)
+
+
+def test_seed_skips_cache_hits_and_unknown_engines(routing, monkeypatch):
+    monkeypatch.setattr(routing, '_router_seeded', False)
+    rows = UsageRows([{'engine': 'claude', 'task_type': 'code', 'tokens_used': 500, 'latency_ms': 80}] * 10 + [
+        {'engine': 'claude', 'task_type': 'code', 'tokens_used': 0, 'latency_ms': 0, 'cache_hit': True},
+        {'engine': 'retired', 'task_type': 'code', 'tokens_used': 500, 'latency_ms': 80},
+    ])
+
+    routing.seed_router_stats(rows, BenchContext({}))
+    routing.seed_router_stats(UsageRows([]), BenchContext({}))
+
+    assert list(routing.engine_latency['claude']) == [80] * 10
+    assert routing.expected_cost('claude', 'code') == pytest.approx(0.5 * 0.003)
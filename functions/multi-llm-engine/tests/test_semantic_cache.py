@@ -0,0 +1,60 @@
+import random
+import string
+
+import pytest
+
+SHARD = '{"model": "stub", "task_type": "qa"}'
+ANSWER = {'text': 'Paris', 'tokens': 12}
+
+
+@pytest.fixture
+def cache(module):
+    return module('caches').SemanticCache(max_entries=8, ttl=60)
+
+
+def test_near_duplicates_hit_within_their_shard(cache):
+    cache.store(SHARD, 'What is the capital of France?', ANSWER)
+
+    assert cache.lookup(SHARD, '  what is the CAPITAL of   france?', 0.95) == (ANSWER, 1.0)
+    assert cache.lookup(SHARD.replace('qa', 'summary'), 'What is the capital of France?', 0.95) == (None, 0.0)
+    assert cache.lookup(SHARD, 'Recommend a hiking trail near Nairobi', 0.95) == (None, 0.0)
+
+
+def test_wide_verify_rejects_coarse_collisions(module):
+    caches = module('caches')
+    # One coarse dimension: every prompt's coarse score is +1 or -1
+    cache = caches.SemanticCache(max_entries=8, dim=1, ttl=60)
+    stored = 'What is the capital of France?'
+    cache.store(SHARD, stored, ANSWER)
+    prompts = (''.join(random.Random(seed).choice(string.ascii_lowercase + ' ') for _ in range(30)) for seed in range(200))
+    colliding = next(p for p in prompts
+                     if float(cache.embed(caches.semantic_normalize(p)) @ cache.embed(caches.semantic_normalize(stored))) > 0)
+
+    assert cache.lookup(SHARD, colliding, 0.9) == (None, 0.0)
+    assert cache.stats['misses'] == 1
+
+
+def test_verify_runs_outside_the_lock(cache, monkeypatch):
+    cache.store(SHARD, 'Summarise the quarterly ESG report', ANSWER)
+    embed = cache.embed
+    held = []
+
+    def watching_embed(normalized, dim=None):
+        if dim == cache.VERIFY_DIM:
+            held.append(cache._lock.locked())
+        return embed(normalized, dim)
+
+    monkeypatch.setattr(cache, 'embed', watching_embed)
+    value, similarity = cache.lookup(SHARD, 'Summarise the quarterly ESG reports', 0.9)
+
+    assert value == ANSWER and 0.9 <= similarity < 1.0
+    assert held and not any(held)
+
+
+def test_expired_entries_are_evicted(cache, monkeypatch):
+    cache.store(SHARD, 'What is the capital of France?', ANSWER)
+    cache.ttl = 0
+    cache.store(SHARD, 'What is the capital of Kenya?', ANSWER)
+
+    assert cache.lookup(SHARD, 'What is the capital of Kenya?', 0.95) == (None, 0.0)
+    assert cache.stats['evictions'] == 1
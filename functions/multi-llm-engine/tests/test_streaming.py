@@ -0,0 +1,22 @@
+import json
+
+
+def events(raw: str) -> list:
+    return [json.loads(line[len('data: '):]) for line in raw.splitlines() if line.startswith('data: ')]
+
+
+def test_stream_estimate_only_returns_the_estimate(call):
+    response = call({'task_type': 'code', 'prompt': 'estimate me', 'stream': True, 'estimate_only': True})
+
+    assert response['status'] == 200
+    assert response['body']['estimate']['prompt_tokens'] > 0
+    assert 'text' not in response['body']
+
+
+def test_stream_ends_with_done_event(call):
+    response = call({'task_type': 'code', 'prompt': 'stream me', 'stream': True, 'cache': False})
+
+    chunks = events(response['raw'])
+    assert response['status'] == 200
+    assert chunks[-1]['type'] == 'done'
+    assert any(chunk['type'] == 'delta' for chunk in chunks)
@@ -0,0 +1,67 @@
+import json
+
+
+class Transient(Exception):
+    code = 503
+
+
+class UsageDatabases:
+    """Engine_Usage writes, failing with a 503 once `fail_after` rows are in."""
+
+    def __init__(self, fail_after: int = None):
+        self.rows = []
+        self.fail_after = fail_after
+
+    def create_document(self, database_id, collection_id, document_id, data, permissions=None):
+        if self.fail_after is not None and len(self.rows) >= self.fail_after:
+            raise Transient('Service Unavailable')
+        self.rows.append(document_id)
+
+
+def records(count: int, start: int = 0) -> list:
+    return [{'$id': f"r{i:03d}", 'engine': 'stub', 'tokens_used': i} for i in range(start, start + count)]
+
+
+def spilled(path) -> list:
+    with open(path) as f:
+        return [json.loads(line)['$id'] for line in f]
+
+
+def test_overflow_spills_the_oldest_records(module, tmp_path):
+    logger = module('usage').UsageLogger(batch_size=5, max_queue=2, spill_path=str(tmp_path / 'spill.jsonl'))
+    for record in records(4):
+        logger.submit(record)
+
+    # Only two were queued when the third arrived: spill those, not five
+    assert spilled(logger.spill_path) == ['r000', 'r001']
+    assert [r['$id'] for r in logger._queue] == ['r002', 'r003']
+    assert logger.stats['spilled'] == 2
+
+
+def test_replay_writes_in_batches_and_keeps_the_rest_on_failure(module, tmp_path):
+    logger = module('usage').UsageLogger(batch_size=3, spill_path=str(tmp_path / 'spill.jsonl'))
+    logger._spill(records(8))
+    logger._databases = UsageDatabases(fail_after=3)
+    logger._replay_spill()
+
+    assert logger._databases.rows == ['r000', 'r001', 'r002']
+    assert logger.stats['replayed'] == 3
+    # The failed batch and everything after it, in order
+    assert spilled(logger.spill_path) == [f"r{i:03d}" for i in range(3, 8)]
+
+    logger._databases.fail_after = None
+    logger._replay_spill()
+    assert logger._databases.rows == [f"r{i:03d}" for i in range(8)]
+    assert not (tmp_path / 'spill.jsonl').exists()
+
+
+def test_failed_writes_spill_and_replay_after_recovery(module, tmp_path):
+    logger = module('usage').UsageLogger(batch_size=2, spill_path=str(tmp_path / 'spill.jsonl'))
+    logger._databases = UsageDatabases(fail_after=0)
+    assert logger._write(records(2)) is False
+    assert spilled(logger.spill_path) == ['r000', 'r001']
+
+    logger._databases.fail_after = None
+    assert logger._write(records(2, start=2)) is True
+    assert logger._databases.rows == ['r002', 'r003', 'r000', 'r001']
+    assert logger.stats['written'] == 2 and logger.stats['replayed'] == 2
@@ -0,0 +1,17 @@
+"""Appwrite datetime strings to and from epoch seconds."""
+from datetime import datetime, timezone
+
+
+def parse_timestamp(value) -> float:
+    """Epoch seconds from an Appwrite datetime string (0 when unset)."""
+    if not value:
+        return 0.0
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def format_timestamp(epoch: float) -> str:
+    """Appwrite datetime string (UTC) for epoch seconds."""
+    return datetime.utcfromtimestamp(epoch).isoformat()
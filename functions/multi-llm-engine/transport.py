@@ -0,0 +1,471 @@
+"""
+HTTP transport: keep-alive connection pools (threaded and asyncio) and the
+background event loop non-streaming provider calls run on.
+"""
+import json
+import time
+import asyncio
+import contextvars
+import functools
+import ssl
+import threading
+import http.client
+from concurrent.futures import TimeoutError as FutureTimeout
+from urllib.parse import urlsplit
+from settings import (
+    ASYNC_POOL_MAX_PER_HOST, POOL_ACQUIRE_TIMEOUT, POOL_IDLE_TIMEOUT, POOL_MAX_PER_HOST, REQUEST_TIMEOUT_S,
+)
+
+
+class ProviderHTTPError(Exception):
+    """Non-2xx response from an LLM provider."""
+
+    def __init__(self, status: int, reason: str, headers: dict, body: bytes):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        detail = body[:300].decode('utf-8', 'replace')
+        super().__init__(f"HTTP {status} {reason}: {detail}")
+
+
+# Per-thread request state: the headers of the last provider response
+# (read by the rate limiter), its connect/TTFB timings, and the
+# invocation's deadline
+request_scope = threading.local()
+
+
+def remaining_budget() -> float:
+    """Seconds left before this invocation's deadline (REQUEST_TIMEOUT_S outside main)."""
+    deadline = getattr(request_scope, 'deadline', None)
+    if deadline is None:
+        return REQUEST_TIMEOUT_S
+    return max(deadline - time.monotonic(), 0.0)
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP(S) connections keyed by provider host.
+
+    Several engines share one host (all OpenRouter models go to openrouter.ai),
+    so pooling per host rather than per engine lets them reuse the same TLS
+    session. Connections idle for longer than `idle_timeout` are closed on the
+    next checkout instead of being handed out stale.
+    """
+
+    def __init__(self, max_per_host: int = POOL_MAX_PER_HOST, idle_timeout: float = POOL_IDLE_TIMEOUT):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self._cond = threading.Condition()
+        self._idle = {}      # host key -> [(conn, last_used), ...]
+        self._in_use = {}    # host key -> count of checked-out connections
+        self._stats = {}     # host -> {'opened', 'reused', 'evicted'}
+        self._ssl_context = None  # loading the CA bundle costs ~35ms, so not at import
+
+    def _host_stats(self, host: str) -> dict:
+        return self._stats.setdefault(host, {'opened': 0, 'reused': 0, 'evicted': 0})
+
+    def _evict_idle(self, now: float):
+        """Close idle connections past their idle timeout (caller holds the lock)."""
+        for key, idle in self._idle.items():
+            fresh = []
+            for conn, last_used in idle:
+                if now - last_used > self.idle_timeout:
+                    conn.close()
+                    self._host_stats(key[1])['evicted'] += 1
+                else:
+                    fresh.append((conn, last_used))
+            idle[:] = fresh
+
+    def _new_connection(self, key: tuple, timeout: float):
+        scheme, host, port = key
+        if scheme == 'https':
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            return http.client.HTTPSConnection(host, port, timeout=timeout, context=self._ssl_context)
+        return http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def acquire(self, key: tuple, timeout: float) -> tuple:
+        """Check out a connection for `key`, returning (conn, reused)."""
+        deadline = time.monotonic() + POOL_ACQUIRE_TIMEOUT
+        with self._cond:
+            while True:
+                self._evict_idle(time.monotonic())
+                idle = self._idle.setdefault(key, [])
+                in_use = self._in_use.get(key, 0)
+                if idle:
+                    conn, _ = idle.pop()
+                    self._in_use[key] = in_use + 1
+                    self._host_stats(key[1])['reused'] += 1
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    return conn, True
+                if in_use < self.max_per_host:
+                    self._in_use[key] = in_use + 1
+                    self._host_stats(key[1])['opened'] += 1
+                    return self._new_connection(key, timeout), False
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Connection pool exhausted for {key[1]} ({self.max_per_host} in use)")
+                self._cond.wait(remaining)
+
+    def release(self, key: tuple, conn, reusable: bool = True):
+        """Return a connection to the pool, or close it if it can't be reused."""
+        with self._cond:
+            self._in_use[key] = max(self._in_use.get(key, 1) - 1, 0)
+            if reusable and conn.sock is not None:
+                self._idle.setdefault(key, []).append((conn, time.monotonic()))
+            else:
+                conn.close()
+            self._cond.notify()
+
+    @staticmethod
+    def _route(url: str) -> tuple:
+        """Split a URL into its pool key and request path."""
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'https'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        path = parts.path + (f"?{parts.query}" if parts.query else '')
+        return (scheme, parts.hostname, port), path
+
+    def request(self, method: str, url: str, body: bytes, headers: dict, timeout: float) -> tuple:
+        """
+        Send a request over a pooled connection.
+
+        Returns (status, headers, body_bytes, reused). A reused connection that
+        the server has already closed is retried once on a fresh one.
+        """
+        key, path = self._route(url)
+
+        for attempt in range(2):
+            conn, reused = self.acquire(key, timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError, OSError) as e:
+                self.release(key, conn, reusable=False)
+                if reused and attempt == 0 and not isinstance(e, TimeoutError):
+                    continue
+                raise
+            except Exception:
+                self.release(key, conn, reusable=False)
+                raise
+            self.release(key, conn, reusable=not response.will_close)
+            return response.status, dict(response.getheaders()), data, reused
+        raise RuntimeError('unreachable')
+
+    def open_stream(self, method: str, url: str, body: bytes, headers: dict, timeout: float) -> tuple:
+        """
+        Send a request and hand back its body as an iterator of raw lines.
+
+        The status is checked before returning, so provider errors surface
+        before any chunk is forwarded and the caller can still fall back.
+        The connection goes back to the pool only if the body is read to
+        the end. Returns (lines, reused).
+        """
+        key, path = self._route(url)
+
+        for attempt in range(2):
+            conn, reused = self.acquire(key, timeout)
+            started = time.perf_counter()
+            connect_ms = 0.0
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                    connect_ms = (time.perf_counter() - started) * 1000
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.release(key, conn, reusable=False)
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                self.release(key, conn, reusable=False)
+                raise
+            if response.status >= 400:
+                data = response.read()
+                self.release(key, conn, reusable=not response.will_close)
+                raise ProviderHTTPError(
+                    response.status, response.reason, dict(response.getheaders()), data
+                )
+            request_scope.response_headers = dict(response.getheaders())
+            request_scope.timings = {'connect_ms': connect_ms, 'ttfb_ms': (time.perf_counter() - started) * 1000}
+            return self._iter_lines(key, conn, response), reused
+        raise RuntimeError('unreachable')
+
+    def _iter_lines(self, key: tuple, conn, response):
+        completed = False
+        try:
+            for line in response:
+                yield line
+            completed = True
+        finally:
+            self.release(key, conn, reusable=completed and not response.will_close)
+
+    def snapshot(self) -> dict:
+        """Per-host connection counters for observability."""
+        with self._cond:
+            return {
+                host: dict(stats, idle=sum(len(v) for k, v in self._idle.items() if k[1] == host))
+                for host, stats in self._stats.items()
+            }
+
+
+http_pool = ConnectionPool()
+
+
+def post_json(url: str, payload: dict, headers: dict, timeout: float) -> tuple:
+    """POST a JSON payload through the shared pool. Returns (data, connection_reused)."""
+    status, resp_headers, body, reused = http_pool.request(
+        'POST', url, json.dumps(payload).encode(), headers, timeout
+    )
+    if status >= 400:
+        raise ProviderHTTPError(status, http.client.responses.get(status, ''), resp_headers, body)
+    request_scope.response_headers = resp_headers
+    return json.loads(body), reused
+
+
+# ============================================================================
+# ASYNC ENGINE CORE (one event loop per warm instance)
+# ============================================================================
+#
+# Non-streaming provider calls, hedges and batch fan-out run as tasks on a
+# single background event loop. The sync entry points (call_engine,
+# execute_request, handle_batch) submit coroutines to it and block on the
+# result, so main(context) keeps its synchronous contract. Cancelling a task
+# closes its connection, which is how a losing hedge is aborted.
+
+class AsyncConnectionPool:
+    """
+    Keep-alive HTTP/1.1 connections on asyncio streams, keyed like
+    ConnectionPool. Only what the providers need is implemented: a request
+    with a complete body, and Content-Length or chunked responses.
+    """
+
+    def __init__(self, max_per_host: int = ASYNC_POOL_MAX_PER_HOST, idle_timeout: float = POOL_IDLE_TIMEOUT):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self._idle = {}    # host key -> [(reader, writer, last_used), ...]
+        self._slots = {}   # host key -> asyncio.Semaphore
+        self._stats = {}   # host -> {'opened', 'reused', 'evicted'}
+        self._ssl_context = None
+
+    def _host_stats(self, host: str) -> dict:
+        return self._stats.setdefault(host, {'opened': 0, 'reused': 0, 'evicted': 0})
+
+    @staticmethod
+    async def _close(writer):
+        """Close a connection and wait until its transport has let go of the socket."""
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass  # the peer already dropped it
+
+    async def _checkout_idle(self, key: tuple):
+        """A live idle connection for `key`, or None."""
+        idle = self._idle.get(key, [])
+        now = time.monotonic()
+        while idle:
+            reader, writer, last_used = idle.pop()
+            if now - last_used <= self.idle_timeout and not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            self._host_stats(key[1])['evicted'] += 1
+            await self._close(writer)
+        return None
+
+    async def _open(self, key: tuple):
+        scheme, host, port = key
+        if scheme == 'https':
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            return await asyncio.open_connection(host, port, ssl=self._ssl_context, server_hostname=host)
+        return await asyncio.open_connection(host, port)
+
+    @staticmethod
+    async def _read_response(reader) -> tuple:
+        """(status, reason, headers, body, keep_alive, first_byte_at) for one response."""
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('Connection closed by peer')
+        first_byte_at = time.perf_counter()
+        version, status, reason = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip()] = value.strip()
+        lower = {k.lower(): v.lower() for k, v in headers.items()}
+        keep_alive = version == 'HTTP/1.1' and lower.get('connection') != 'close'
+        
+        if 'chunked' in lower.get('transfer-encoding', ''):
+            parts = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                parts.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b''.join(parts)
+        elif 'content-length' in lower:
+            body = await reader.readexactly(int(lower['content-length']))
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return int(status), reason, headers, body, keep_alive, first_byte_at
+
+    @staticmethod
+    def request_head(method: str, key: tuple, path: str, headers: dict) -> bytes:
+        """Request line and headers, minus Content-Length and the blank line."""
+        host_header = key[1] if key[2] in (80, 443) else f"{key[1]}:{key[2]}"
+        return ''.join(
+            [f"{method} {path} HTTP/1.1\r\nHost: {host_header}\r\n"]
+            + [f"{name}: {value}\r\n" for name, value in headers.items()]
+        ).encode('latin-1')
+
+    async def request(self, method: str, url: str, body: bytes, headers: dict, timeout: float) -> tuple:
+        """
+        Async twin of ConnectionPool.request: (status, headers, body, reused).
+        A reused connection the server already closed is retried once.
+        """
+        key, path = ConnectionPool._route(url)
+        return await self.send(key, self.request_head(method, key, path, headers), body, timeout)
+
+    async def send(self, key: tuple, head: bytes, body: bytes, timeout: float) -> tuple:
+        """request() with a prebuilt head (see request_head), as RequestTemplate keeps."""
+        slots = self._slots.get(key)
+        if slots is None:
+            slots = self._slots[key] = asyncio.Semaphore(self.max_per_host)
+        message = b''.join((head, b'Content-Length: %d\r\n\r\n' % len(body), body))
+        
+        await asyncio.wait_for(slots.acquire(), POOL_ACQUIRE_TIMEOUT)
+        try:
+            for attempt in range(2):
+                conn = await self._checkout_idle(key)
+                reused = conn is not None
+                if reused:
+                    self._host_stats(key[1])['reused'] += 1
+                writer = None
+                started = time.perf_counter()
+                try:
+                    reader, writer = conn or await asyncio.wait_for(self._open(key), timeout)
+                    connect_ms = 0.0 if reused else (time.perf_counter() - started) * 1000
+                    if not reused:
+                        self._host_stats(key[1])['opened'] += 1
+                    writer.write(message)
+                    status, reason, resp_headers, data, keep_alive, first_byte_at = await asyncio.wait_for(
+                        self._read_response(reader), timeout
+                    )
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    if writer:
+                        await self._close(writer)
+                    if reused and attempt == 0:
+                        continue
+                    raise ConnectionResetError(str(e) or 'Connection lost') from e
+                except BaseException:
+                    # Timeouts and cancellation leave the response half-read
+                    if writer:
+                        await self._close(writer)
+                    raise
+                if keep_alive:
+                    self._idle.setdefault(key, []).append((reader, writer, time.monotonic()))
+                else:
+                    await self._close(writer)
+                response_timings.set({
+                    'connect_ms': connect_ms,
+                    'ttfb_ms': (first_byte_at - started) * 1000,
+                    'total_ms': (time.perf_counter() - started) * 1000
+                })
+                return status, resp_headers, data, reused
+            raise RuntimeError('unreachable')
+        finally:
+            slots.release()
+
+    def snapshot(self) -> dict:
+        """Per-host connection counters, in ConnectionPool.snapshot form."""
+        return {
+            host: dict(stats, idle=sum(len(v) for k, v in self._idle.items() if k[1] == host))
+            for host, stats in list(self._stats.items())
+        }
+
+
+async_http_pool = AsyncConnectionPool()
+
+# Headers and connect/TTFB/total timings of the last provider response in
+# the current task (the async counterparts of request_scope's)
+response_headers = contextvars.ContextVar('response_headers', default=None)
+response_timings = contextvars.ContextVar('response_timings', default=None)
+
+
+async def apost_json(url: str, payload: dict, headers: dict, timeout: float) -> tuple:
+    """POST a JSON payload through the async pool. Returns (data, connection_reused)."""
+    status, resp_headers, body, reused = await async_http_pool.request(
+        'POST', url, json.dumps(payload).encode(), headers, timeout
+    )
+    if status >= 400:
+        raise ProviderHTTPError(status, http.client.responses.get(status, ''), resp_headers, body)
+    response_headers.set(resp_headers)
+    return json.loads(body), reused
+
+
+class EngineLoop:
+    """
+    The background event loop that async work is submitted to. Started on
+    first use and kept for the life of the warm instance, so the async pool's
+    connections survive between invocations.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name='engine-loop', daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    # How long a timed-out call gets to unwind after cancellation
+    CANCEL_GRACE_S = 2.0
+
+    def run(self, coro, timeout: float = None):
+        """
+        Run `coro` on the loop and wait for it. On timeout the task is
+        cancelled on the loop by asyncio.wait_for, which waits for it to
+        unwind (slot and connection released) before TimeoutError reaches
+        the caller; a call that completes in the meantime returns normally.
+        Cancellation is not an Exception, so the call's own failure
+        handling doesn't record it: the caller's TimeoutError is the one
+        report of the request.
+        """
+        if timeout is None:
+            return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+        future = asyncio.run_coroutine_threadsafe(asyncio.wait_for(coro, timeout), self.loop)
+        try:
+            return future.result(timeout + self.CANCEL_GRACE_S)
+        except (asyncio.TimeoutError, FutureTimeout):
+            # FutureTimeout: the task ignored cancellation for the whole grace period
+            future.cancel()
+            raise TimeoutError(f"Engine call timed out after {timeout}s")
+
+
+engine_loop = EngineLoop()
+
+
+def offload(fn, *args, **kwargs):
+    """
+    Await a blocking call (Appwrite reads/writes, breaker sync) on the
+    default executor so it doesn't stall the loop.
+    """
+    return asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args, **kwargs))
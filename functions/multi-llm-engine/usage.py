@@ -0,0 +1,255 @@
+"""Engine_Usage logging: background, batched writes with an on-disk spill."""
+import os
+import json
+import atexit
+import time
+import itertools
+import threading
+from collections import deque
+from datetime import datetime
+from appwrite.services.databases import Databases
+from appwrite.id import ID
+from budgets import budgets
+from estimation import actual_prompt_tokens, call_cost, prompt_cache_usage
+from settings import (
+    DATABASE_ID, USAGE_BATCH_SIZE, USAGE_FLUSH_S, USAGE_QUEUE_MAX, USAGE_SHUTDOWN_TIMEOUT_S,
+    USAGE_SPILL_PATH,
+)
+
+
+def _is_transient(error: Exception) -> bool:
+    """Network trouble, rate limits and 5xx are worth retrying; 4xx are not."""
+    code = getattr(error, 'code', None)
+    return not code or code == 429 or code >= 500
+
+
+class UsageLogger:
+    """
+    Queue Engine_Usage records and write them off the response path.
+
+    A daemon thread drains the queue in batches, by size or by time.
+    Batches that fail with a transient error are appended to a JSONL spill
+    file and replayed, oldest first, once a write succeeds again - also
+    across warm starts, since the spill file outlives the invocation.
+    Records carry their document ID from the start, so a replay that
+    overlaps an earlier partial write just hits 409 and moves on.
+    """
+
+    def __init__(self, batch_size: int = USAGE_BATCH_SIZE, flush_s: float = USAGE_FLUSH_S,
+                 spill_path: str = USAGE_SPILL_PATH, max_queue: int = USAGE_QUEUE_MAX):
+        self.batch_size = batch_size
+        self.flush_s = flush_s
+        self.spill_path = spill_path
+        self.max_queue = max_queue
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._databases = None
+        self._thread = None
+        self._closed = False
+        self._in_flight = 0
+        self.stats = {'queued': 0, 'written': 0, 'spilled': 0, 'replayed': 0,
+                      'dropped': 0, 'last_error': None}
+
+    def bind(self, databases: Databases):
+        """Attach the Appwrite client and make sure the writer is running."""
+        self._databases = databases
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._closed = False
+                self._thread = threading.Thread(target=self._run, name='usage-logger', daemon=True)
+                self._thread.start()
+
+    def submit(self, record: dict):
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                overflow = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                self._spill(overflow)
+            self._queue.append(record)
+            self.stats['queued'] += 1
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+
+    def depth(self) -> int:
+        return len(self._queue) + self._in_flight
+
+    def _next_batch(self, wait: bool) -> list:
+        with self._cond:
+            if wait and not self._closed:
+                self._cond.wait_for(lambda: self._closed or len(self._queue) >= self.batch_size,
+                                    timeout=self.flush_s)
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            self._in_flight = len(batch)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch(wait=True)
+            if batch:
+                self._write(batch)
+            elif os.path.exists(self.spill_path):
+                self._replay_spill()
+            with self._cond:
+                self._in_flight = 0
+                if self._closed and not self._queue:
+                    return
+
+    def _create(self, records: list):
+        """Write records, bulk when the SDK supports it. Raises on transient failure."""
+        databases = self._databases
+        if hasattr(databases, 'create_documents'):
+            try:
+                databases.create_documents(DATABASE_ID, 'Engine_Usage', records)
+                return
+            except Exception as e:
+                if getattr(e, 'code', None) != 409:
+                    raise
+                # Some rows already exist (replay overlap) - fall through row by row
+        for record in records:
+            data = {k: v for k, v in record.items() if k != '$id'}
+            try:
+                databases.create_document(DATABASE_ID, 'Engine_Usage', record['$id'], data)
+            except Exception as e:
+                if getattr(e, 'code', None) == 409:
+                    continue
+                if _is_transient(e):
+                    raise
+                self.stats['dropped'] += 1
+                self.stats['last_error'] = str(e)
+
+    def _write(self, batch: list) -> bool:
+        with self._write_lock:
+            if self._databases is None:
+                self._spill(batch)
+                return False
+            try:
+                self._create(batch)
+            except Exception as e:
+                self.stats['last_error'] = str(e)
+                self._spill(batch)
+                return False
+            self.stats['written'] += len(batch)
+        if os.path.exists(self.spill_path):
+            self._replay_spill()
+        return True
+
+    def _spill(self, records: list, count: bool = True):
+        try:
+            with open(self.spill_path, 'a') as f:
+                for record in records:
+                    f.write(json.dumps(record) + '\n')
+            if count:
+                self.stats['spilled'] += len(records)
+        except OSError as e:
+            self.stats['dropped'] += len(records)
+            self.stats['last_error'] = f"spill failed: {e}"
+
+    def _replay_spill(self):
+        """
+        Move spilled records back into Appwrite, stopping at the first
+        failure. The file is read batch_size lines at a time, so a large
+        spill is never held in memory whole.
+        """
+        with self._write_lock:
+            if self._databases is None:
+                return
+            replay_path = self.spill_path + '.replay'
+            try:
+                os.replace(self.spill_path, replay_path)
+            except OSError:
+                return
+            with open(replay_path) as f:
+                lines = (line for line in f if line.strip())
+                while True:
+                    chunk = [json.loads(line) for line in itertools.islice(lines, self.batch_size)]
+                    if not chunk:
+                        break
+                    try:
+                        self._create(chunk)
+                    except Exception as e:
+                        self.stats['last_error'] = str(e)
+                        # Put back this chunk and, still streaming, the rest of the file
+                        self._spill(chunk, count=False)
+                        self._spill_lines(lines)
+                        break
+                    self.stats['replayed'] += len(chunk)
+            os.remove(replay_path)
+
+    def _spill_lines(self, lines):
+        """Append already-serialised records to the spill file."""
+        try:
+            with open(self.spill_path, 'a') as f:
+                f.writelines(lines)
+        except OSError as e:
+            self.stats['last_error'] = f"spill failed: {e}"
+
+    def flush(self, timeout: float = USAGE_SHUTDOWN_TIMEOUT_S):
+        """Synchronously write everything queued (used at shutdown)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            batch = self._next_batch(wait=False)
+            if not batch:
+                break
+            self._write(batch)
+        with self._cond:
+            self._in_flight = 0
+            remaining = list(self._queue)
+            self._queue.clear()
+        if remaining:
+            self._spill(remaining)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(USAGE_SHUTDOWN_TIMEOUT_S)
+        self.flush()
+
+
+usage_logger = UsageLogger()
+atexit.register(usage_logger.close)
+
+
+def log_usage(databases: Databases, engine_id: str, engine: dict, result: dict, 
+              task_type: str, latency_ms: int, fallback_used: bool, context,
+              cache_hit: bool = False, estimate: dict = None, coalesced: bool = False, agent: str = None):
+    """
+    Queue a usage record for the Engine_Usage collection and charge its
+    cost to the task's and agent's budgets.
+
+    Cache hits are logged with the tokens the original call used but zero
+    cost, so savings can be read straight off the collection. Provider
+    calls also record the pre-dispatch prompt estimate beside the actual
+    prompt tokens, to track estimator accuracy, and what provider prompt
+    caching saved (already netted out of cost_usd). Coalesced requests
+    rode on another request's call, so they are logged with no tokens and
+    no cost; the leader's row carries the call.
+    """
+    try:
+        tokens = 0 if coalesced else result.get('tokens', 0)
+        free = cache_hit or coalesced
+        cached_tokens, cache_savings = (0, 0.0) if free else prompt_cache_usage(engine, result.get('usage'))
+        cost = 0.0 if free else call_cost(engine, result)
+        budgets.charge(task_type, agent, cost)
+        
+        usage_logger.submit({
+            '$id': ID.unique(),
+            'engine': engine_id,
+            'model': engine['model'],
+            'task_type': task_type,
+            'agent': agent,
+            'tokens_used': tokens,
+            'cost_usd': cost,
+            'latency_ms': latency_ms,
+            'fallback_used': fallback_used,
+            'cache_hit': cache_hit,
+            'estimated_prompt_tokens': estimate['prompt_tokens'] if estimate else None,
+            'prompt_tokens': actual_prompt_tokens(result.get('usage')) if not free else None,
+            'cached_tokens': cached_tokens,
+            'cache_savings_usd': round(cache_savings, 8),
+            'coalesced': coalesced,
+            'created_at': datetime.utcnow().isoformat()
+        })
+    except Exception as e:
+        context.log(f"Failed to log usage: {e}")